@@ -2,7 +2,6 @@ import threading
 import os
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
 import json
 from datetime import datetime
 from Encriptacion import load_or_create_key, ensure_dirs, read_encrypted
@@ -10,6 +9,8 @@ from Usuarios import (    add_user, verify_login, get_user, list_users,
     upsert_planes, list_session_summaries, list_therapists, list_patients)
 from Conexion_Adafruit import threaded_upload_user, sync_users_with_cloud, send_data_http
 from Juego import KneeRehabilitationGame
+from Dispositivos import gestor_equipos
+from Recursos import asset_manager, SPRITES
 
 
 # ==========================================================
@@ -22,8 +23,8 @@ def set_background(root, image_path="imagenes/Costa_Rica.jpg"):
         if isinstance(w, tk.Canvas) and getattr(w, "_is_bg", False):
             w.destroy()
     try:
-        img = Image.open(image_path).resize((1280, 720), Image.LANCZOS)
-        tkimg = ImageTk.PhotoImage(img)
+        # Escalada una sola vez y reutilizada entre pantallas (ver Recursos.py)
+        tkimg = asset_manager().photo(image_path, (1280, 720))
         canvas = tk.Canvas(root, width=1280, height=720, highlightthickness=0, bd=0)
         canvas._is_bg = True
         canvas.place(x=0, y=0, relwidth=1, relheight=1)
@@ -37,11 +38,6 @@ def set_background(root, image_path="imagenes/Costa_Rica.jpg"):
         root.configure(bg="#f5f5f5")
 
 
-    except Exception as e:
-        print("[Background] Error:", e)
-        root.configure(bg="#f5f5f5")
-
-
 
 def make_card(root, title_text):
     """Tarjeta central blanca con título y separador."""
@@ -114,10 +110,7 @@ class App:
 
                 sync_users_with_cloud()
 
-                users = list_users()
-                pacientes = {uid: u for uid, u in users.items() if u.get("tipo") == "paciente"}
-
-                for uid in pacientes.keys():
+                for uid in list_patients():
                     self._safe_status_update(f"⬆️ Subiendo datos pendientes de {uid}...", "#0277bd")
                     threaded_upload_user(uid)
 
@@ -236,10 +229,7 @@ class App:
         # Terapeuta asignado dinámico
         tk.Label(inner, text="Terapeuta asignado (solo paciente):", bg="#ffffff").grid(row=6, column=0, sticky="e",
                                                                                        padx=6, pady=6)
-        terapeutas = [
-            u_id for u_id, u_data in list_users().items()
-            if u_data.get("tipo") == "terapeuta"
-        ]
+        terapeutas = list_therapists()
         self.r_ter = ttk.Combobox(inner, values=terapeutas, state="disabled", width=26, justify="center")
         self.r_ter.grid(row=6, column=1, padx=6, pady=6, sticky="ew")
 
@@ -261,11 +251,7 @@ class App:
         t = self.r_tipo.get().strip().lower()
 
         if t == "paciente":
-            usuarios = list_users()
-            terapeutas = [
-                uid for uid, data in usuarios.items()
-                if data.get("tipo", "").lower() == "terapeuta"
-            ]
+            terapeutas = list_therapists()
 
             if not terapeutas:
                 self.r_ter["values"] = ["(No hay terapeutas registrados)"]
@@ -386,8 +372,7 @@ class App:
         tk.Label(top, text="Paciente:", bg="#ffffff").pack(side="left", padx=(0,6))
 
         self.cb_pacientes = ttk.Combobox(top, state="readonly", width=28)
-        all_users = list_users()
-        pacientes_ids = sorted([uid for uid, d in all_users.items() if d.get("tipo") == "paciente"])
+        pacientes_ids = sorted(list_patients())
         self.cb_pacientes["values"] = pacientes_ids
         self.cb_pacientes.pack(side="left", padx=(0,8))
         self.cb_pacientes.bind("<<ComboboxSelected>>", self._on_patient_selected)  # carga planes al seleccionar
@@ -680,12 +665,39 @@ class App:
         self.e_plan_id = ttk.Entry(inner, width=10)
         self.e_plan_id.grid(row=1, column=1, padx=6, pady=6)
 
+        # Equipo (con varios Teensy conectados se elige en cuál hacer la sesión)
+        tk.Label(inner, text="Equipo:", bg="#ffffff").grid(row=2, column=0, sticky="e", padx=6, pady=6)
+        self.cb_equipo = ttk.Combobox(inner, state="readonly", width=18)
+        self._refresh_equipos()
+        self.cb_equipo.grid(row=2, column=1, padx=6, pady=6, sticky="w")
+        # Enumerar puertos serie puede tardar: se hace en un hilo y la lista se actualiza al terminar
+        threading.Thread(target=self._discover_equipos, daemon=True).start()
+
         btns = tk.Frame(inner, bg="#ffffff")
-        btns.grid(row=2, column=0, columnspan=2, pady=8, sticky="w")
+        btns.grid(row=3, column=0, columnspan=2, pady=8, sticky="w")
         green_button(btns, "Iniciar", self._patient_start).pack(side="left", padx=6)
         grey_button(btns, "Ver historial", self._patient_history_screen).pack(side="left", padx=6)
         grey_button(btns, "Cerrar sesión", self._back_to_login).pack(side="left", padx=6)
 
+    def _discover_equipos(self):
+        try:
+            nuevos = gestor_equipos().descubrir()
+        except Exception as e:
+            print("[Equipos] Error al buscar equipos:", e)
+            return
+        if nuevos:
+            self.root.after(0, self._refresh_equipos)
+
+    def _refresh_equipos(self):
+        """Opciones del selector de equipo: 'Automático' y los equipos libres."""
+        cb = getattr(self, "cb_equipo", None)
+        if cb is None or not cb.winfo_exists():
+            return
+        actual = cb.get()
+        valores = ["Automático"] + [e.nombre for e in gestor_equipos().libres()]
+        cb.configure(values=valores)
+        cb.set(actual if actual in valores else "Automático")
+
     def _patient_start(self):
         pid = self.e_plan_id.get().strip()
         if not pid:
@@ -713,12 +725,23 @@ class App:
             messagebox.showerror("Error", "Ese plan no existe para este usuario.")
             return
 
+        # Reservar el equipo elegido (sin equipos registrados se usa la conexión única)
+        equipo = None
+        gestor = gestor_equipos()
+        if gestor.equipos:
+            nombre = self.cb_equipo.get()
+            try:
+                equipo = gestor.asignar(None if nombre == "Automático" else nombre, self.id_app)
+            except (KeyError, RuntimeError) as e:
+                messagebox.showerror("Equipo", str(e))
+                return
+
         def _finish(_resumen):
             # Al volver del juego, recargamos la pantalla del paciente
             self._screen_patient()
 
         threading.Thread(
-            target=lambda: KneeRehabilitationGame(self.root, plan, self.id_app, _finish),
+            target=lambda: KneeRehabilitationGame(self.root, plan, self.id_app, _finish, equipo=equipo),
             daemon=True
         ).start()
 
@@ -773,5 +796,7 @@ if __name__ == "__main__":
 
     # Iniciar sincronización de usuarios automáticamente al abrir la aplicación
     threading.Thread(target=sync_users_with_cloud, daemon=True).start()
+    # Sprites del juego escalados de antemano para que la partida arranque sin esperar
+    asset_manager().precargar(SPRITES)
 
     root.mainloop()
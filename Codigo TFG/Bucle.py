@@ -0,0 +1,189 @@
+import time
+import random
+from array import array
+from collections import deque
+
+# ======================= Paso fijo =======================
+#
+# El juego simula siempre en pasos de 'dt' (las velocidades están dadas por
+# paso, calibradas a 60 Hz) sin importar cada cuánto Tk llama al cuadro. El
+# resto que no llega a un paso queda en el acumulador y se usa para
+# interpolar el dibujo entre el paso anterior y el actual.
+
+class FixedTimestep:
+    """
+    Acumulador de paso fijo. advance(t) devuelve cuántos pasos simular hasta
+    el instante t; 'alpha' es la fracción de paso pendiente (0..1) para
+    interpolar. Tras un bloqueo largo se simulan como máximo 'max_pasos' y
+    el resto se descarta (el juego se pausa en lugar de acelerar).
+    """
+
+    def __init__(self, dt=1 / 60, max_pasos=5):
+        self.dt = dt
+        self.max_pasos = max_pasos
+        self._acc = 0.0
+        self._t_prev = None
+        self.pasos = 0
+        self.descartados = 0
+
+    @property
+    def t_sim(self):
+        """Tiempo simulado (s)."""
+        return self.pasos * self.dt
+
+    @property
+    def alpha(self):
+        return self._acc / self.dt
+
+    def reset(self, t):
+        """Retoma desde t sin acumular el intervalo (p. ej. al salir de la pausa)."""
+        self._t_prev = t
+
+    def advance(self, t) -> int:
+        if self._t_prev is None:
+            self._t_prev = t
+        self._acc += max(0.0, t - self._t_prev)
+        self._t_prev = t
+        n = min(int(self._acc / self.dt), self.max_pasos)
+        self._acc -= n * self.dt
+        if self._acc >= self.dt:
+            perdidos = int(self._acc / self.dt)
+            self.descartados += perdidos
+            self._acc -= perdidos * self.dt
+        self.pasos += n
+        return n
+
+
+# ======================= Perfil de cuadros =======================
+
+def _percentil(orden, q):
+    return orden[min(len(orden) - 1, int(q * len(orden)))] if orden else 0.0
+
+
+class FrameProfiler:
+    """
+    Perfil del bucle de cuadros:
+    - duración de cada tick (trabajo dentro del callback) → p50/p95/p99
+    - cuadros perdidos: intervalos entre ticks de más de 1.5 períodos
+      (se cuentan los períodos que faltaron)
+    - bloqueos del bucle de eventos: intervalos mayores a 'bloqueo_s'
+    texto() resume los últimos 'ventana' cuadros para el overlay de depuración.
+    """
+
+    def __init__(self, periodo_s=1 / 60, bloqueo_s=0.1, ventana=600):
+        self.periodo = periodo_s
+        self.bloqueo = bloqueo_s
+        self.duraciones = array("d")   # Toda la sesión (8 bytes por cuadro)
+        self._recientes = deque(maxlen=ventana)
+        self._intervalos = deque(maxlen=ventana)
+        self.perdidos = 0
+        self.bloqueos = 0
+        self.bloqueo_max = 0.0
+        self._t_ini = self._t_prev = self._t_primero = None
+        self._t_fin = None
+
+    @property
+    def cuadros(self):
+        return len(self.duraciones)
+
+    def begin_frame(self, t=None):
+        t = time.perf_counter() if t is None else t
+        if self._t_prev is None:
+            self._t_primero = t
+        else:
+            intervalo = t - self._t_prev
+            self._intervalos.append(intervalo)
+            if intervalo > 1.5 * self.periodo:
+                self.perdidos += int(intervalo / self.periodo + 0.5) - 1
+            if intervalo > self.bloqueo:
+                self.bloqueos += 1
+                self.bloqueo_max = max(self.bloqueo_max, intervalo)
+        self._t_prev = self._t_ini = t
+
+    def end_frame(self, t=None):
+        t = time.perf_counter() if t is None else t
+        d = t - self._t_ini
+        self.duraciones.append(d)
+        self._recientes.append(d)
+        self._t_fin = t
+
+    def resumen(self) -> dict:
+        orden = sorted(self.duraciones)
+        total = (self._t_fin - self._t_primero) if self.cuadros > 1 else 0.0
+        return {
+            "cuadros": self.cuadros,
+            "fps_medio": round(self.cuadros / total, 2) if total > 0 else 0.0,
+            "tick_p50_ms": round(_percentil(orden, 0.50) * 1000, 3),
+            "tick_p95_ms": round(_percentil(orden, 0.95) * 1000, 3),
+            "tick_p99_ms": round(_percentil(orden, 0.99) * 1000, 3),
+            "tick_max_ms": round((orden[-1] if orden else 0.0) * 1000, 3),
+            "cuadros_perdidos": self.perdidos,
+            "bloqueos": self.bloqueos,
+            "bloqueo_max_ms": round(self.bloqueo_max * 1000, 1),
+        }
+
+    def texto(self) -> str:
+        """Resumen corto de los cuadros recientes (overlay de depuración)."""
+        orden = sorted(self._recientes)
+        intervalos = list(self._intervalos)
+        fps = len(intervalos) / sum(intervalos) if intervalos and sum(intervalos) > 0 else 0.0
+        return (f"{fps:5.1f} FPS | tick p50 {_percentil(orden, 0.5) * 1000:.2f} ms  "
+                f"p95 {_percentil(orden, 0.95) * 1000:.2f} ms  p99 {_percentil(orden, 0.99) * 1000:.2f} ms\n"
+                f"perdidos {self.perdidos} | bloqueos {self.bloqueos} "
+                f"(máx {self.bloqueo_max * 1000:.0f} ms)")
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_timestep(segundos=60.0, periodo=1 / 60, bloqueos=0.01, seed=1):
+    """
+    Bucle con reloj virtual: cuadros con variación y bloqueos ocasionales
+    (como un Tk cargado). Compara cuánto avanza un asteroide a 3 px por
+    llamada (bucle anterior) y a 3 px por paso fijo, contra lo esperado.
+    """
+    rnd = random.Random(seed)
+    reloj = FixedTimestep(periodo)
+    perf = FrameProfiler(periodo)
+    t = 0.0
+    x_llamada = 0.0
+    llamadas = 0
+    while t < segundos:
+        perf.begin_frame(t)
+        x_llamada += 3.0
+        llamadas += 1
+        reloj.advance(t)
+        trabajo = rnd.uniform(0.001, 0.004)
+        perf.end_frame(t + trabajo)
+        # after(16) + trabajo + demora del bucle de eventos; a veces un bloqueo
+        t += 0.016 + trabajo + rnd.expovariate(1 / 0.002)
+        if rnd.random() < bloqueos:
+            t += rnd.uniform(0.05, 0.3)
+
+    esperado = 3.0 * segundos / periodo
+    x_fijo = 3.0 * reloj.pasos
+    print(f"[Bench] {segundos:.0f} s virtuales, {llamadas} cuadros")
+    print(f"[Bench] Avance por llamada: {x_llamada / esperado * 100:.1f} % de lo esperado | "
+          f"paso fijo: {x_fijo / esperado * 100:.1f} % "
+          f"({reloj.descartados} pasos descartados por bloqueos)")
+    print(f"[Bench] Perfil: {perf.resumen()}")
+
+    # Costo del perfilador por cuadro
+    perf = FrameProfiler(periodo)
+    n = 200_000
+    t_a = time.perf_counter()
+    for i in range(n):
+        perf.begin_frame()
+        perf.end_frame()
+    dt = time.perf_counter() - t_a
+    print(f"[Bench] Perfilador: {dt / n * 1e6:.2f} µs/cuadro, resumen de {n:,} cuadros "
+          f"en {_tiempo(perf.resumen) * 1000:.1f} ms")
+
+
+def _tiempo(fn):
+    t_a = time.perf_counter()
+    fn()
+    return time.perf_counter() - t_a
+
+
+if __name__ == "__main__":
+    benchmark_timestep()
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+
+import numpy as np
+
+from Encriptacion import ensure_dirs, read_encrypted, write_encrypted
+from Conexion_Teensy import (ADC_MAX, POT_ESCALA, ANG_PENDIENTE, ANG_OFFSET,
+                             BRAZO_A, BRAZO_R, RESORTES)
+
+# ======================= Perfiles de calibración =======================
+#
+# Con la salida cruda ('C') el Teensy solo envía la lectura del ADC y el host
+# calcula ángulo y fuerza por lotes con NumPy, usando un perfil por equipo:
+#   - "angulo": polinomio lectura → ángulo en extensión (coeficientes de mayor
+#     a menor grado, como np.polyval); en flexión el ángulo cambia de signo
+#   - "geometria": distancias a y r del brazo (m), como en calcularFuerza()
+#   - "resortes": constante K (N/m) de cada resorte
+# Los perfiles se guardan cifrados en "Datos locales" y se asignan a cada
+# equipo por número de serie USB del Teensy.
+
+CALIBRATION_FILE = "calibraciones.enc"
+DEFAULT_PROFILE = "firmware"
+
+
+def _perfil_firmware() -> dict:
+    """Perfil equivalente a las ecuaciones fijas del firmware."""
+    pendiente = ANG_PENDIENTE * POT_ESCALA / ADC_MAX
+    return {
+        "nombre": DEFAULT_PROFILE,
+        "angulo": [pendiente, ANG_OFFSET],
+        "geometria": {"a": BRAZO_A, "r": BRAZO_R},
+        "resortes": {str(n): k for n, (_, k) in RESORTES.items()},
+    }
+
+
+def calibration_path():
+    return os.path.join(ensure_dirs(), CALIBRATION_FILE)
+
+
+def _load_store() -> dict:
+    path = calibration_path()
+    if not os.path.exists(path):
+        return {"perfiles": {}, "dispositivos": {}}
+    return json.loads(read_encrypted(path).decode("utf-8"))
+
+
+def _save_store(store: dict):
+    write_encrypted(calibration_path(), json.dumps(store, ensure_ascii=False).encode("utf-8"))
+
+
+def list_profiles():
+    """Nombres de los perfiles guardados (el del firmware siempre existe)."""
+    return [DEFAULT_PROFILE] + sorted(_load_store()["perfiles"])
+
+
+def get_profile(nombre: str) -> dict:
+    if nombre == DEFAULT_PROFILE:
+        return _perfil_firmware()
+    perfil = _load_store()["perfiles"].get(nombre)
+    if perfil is None:
+        raise KeyError(f"Perfil de calibración inexistente: {nombre}")
+    return perfil
+
+
+def save_profile(perfil: dict):
+    """Guarda (o reemplaza) un perfil."""
+    nombre = perfil.get("nombre")
+    if not nombre or nombre == DEFAULT_PROFILE:
+        raise ValueError("El perfil necesita un nombre distinto de 'firmware'.")
+    if not perfil.get("angulo"):
+        raise ValueError("El perfil necesita coeficientes de ángulo.")
+    store = _load_store()
+    store["perfiles"][nombre] = perfil
+    _save_store(store)
+
+
+def assign_profile(numero_serie: str, nombre: str):
+    """Asocia un perfil al Teensy con ese número de serie."""
+    get_profile(nombre)
+    store = _load_store()
+    store["dispositivos"][str(numero_serie)] = nombre
+    _save_store(store)
+
+
+def profile_for_device(numero_serie) -> dict:
+    """Perfil asignado al equipo, o el del firmware si no tiene uno."""
+    if numero_serie:
+        nombre = _load_store()["dispositivos"].get(str(numero_serie))
+        if nombre:
+            try:
+                return get_profile(nombre)
+            except KeyError:
+                print(f"[Calibración] Perfil '{nombre}' no encontrado; se usa el del firmware.")
+    return _perfil_firmware()
+
+
+def fit_profile(nombre, lecturas, angulos, grado=1, base: dict = None) -> dict:
+    """
+    Ajusta el polinomio lectura → ángulo (en extensión) a partir de puntos
+    medidos con goniómetro. Copia geometría y resortes de 'base' (o del firmware).
+    """
+    coef = np.polyfit(np.asarray(lecturas, float), np.asarray(angulos, float), grado)
+    perfil = dict(base or _perfil_firmware())
+    perfil["nombre"] = nombre
+    perfil["angulo"] = [float(c) for c in coef]
+    perfil["ajuste"] = {"grado": grado, "puntos": len(lecturas),
+                        "fecha": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return perfil
+
+
+# ======================= Conversión por lotes =======================
+
+class Calibrador:
+    """
+    Conversión vectorizada lectura → (ángulo, fuerza) para un perfil,
+    resorte y modo. convert() acepta una lista o arreglo de lecturas y
+    devuelve dos listas de float (listas para el buffer del lector).
+    """
+
+    def __init__(self, perfil: dict, resorte, modo="E"):
+        self.perfil = perfil
+        self.coef = np.asarray(perfil["angulo"], dtype=np.float64)
+        self.signo = 1.0 if str(modo).upper() == "E" else -1.0
+        geo = perfil.get("geometria", {})
+        a, r = float(geo.get("a", BRAZO_A)), float(geo.get("r", BRAZO_R))
+        # L² = a² + r² − 2ar·cos θ  (misma geometría que calcularFuerza)
+        self._l2_base = a * a + r * r
+        self._l2_cos = 2 * a * r
+        self._l0 = abs(a - r)
+        self.k = float(perfil.get("resortes", {}).get(str(resorte), 0.0))
+        self.samples = 0
+        self.t_total = 0.0
+
+    def convert_array(self, adc):
+        """Versión NumPy pura: arreglo de lecturas → (ángulos, fuerzas)."""
+        adc = np.asarray(adc, dtype=np.float64)
+        ang = np.polyval(self.coef, adc)
+        if self.signo < 0:
+            ang = -ang
+        if self.k == 0.0:
+            return ang, np.zeros_like(ang)
+        largo = np.sqrt(self._l2_base - self._l2_cos * np.cos(np.radians(ang)))
+        fuerza = self.k * np.maximum(largo - self._l0, 0.0)
+        return ang, fuerza
+
+    def convert(self, adc):
+        t_a = time.perf_counter()
+        ang, fuerza = self.convert_array(adc)
+        self.samples += len(ang)
+        self.t_total += time.perf_counter() - t_a
+        return ang.tolist(), fuerza.tolist()
+
+    def stats(self) -> dict:
+        return {"muestras": self.samples,
+                "muestras_por_s": self.samples / self.t_total if self.t_total else 0.0}
+
+
+def calibrador_para(numero_serie, resorte, modo="E") -> Calibrador:
+    """Calibrador con el perfil asignado al equipo (por número de serie)."""
+    return Calibrador(profile_for_device(numero_serie), int(str(resorte) or 0), modo)
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_calibration(n=100_000, lote=500, repeticiones=20):
+    """Mide la conversión por lotes (objetivo: ≥ 100k muestras/s en un núcleo)."""
+    from Conexion_Teensy import FrameDecoder, encode_raw_frame, convertir_angulo, calcular_fuerza
+
+    rng = np.random.default_rng(0)
+    adc = rng.uniform(500, 900, n)
+    cal = Calibrador(_perfil_firmware(), 3, "E")
+
+    # Coincidencia con el firmware
+    ang, fuerza = cal.convert_array(adc[:1000])
+    err_a = max(abs(a - convertir_angulo(x)) for a, x in zip(ang, adc[:1000]))
+    err_f = max(abs(f - calcular_fuerza(convertir_angulo(x), 3)) for f, x in zip(fuerza, adc[:1000]))
+    print(f"[Bench] Error máx. vs firmware: ángulo {err_a:.2e}°, fuerza {err_f:.2e} N")
+
+    t_a = time.perf_counter()
+    for _ in range(repeticiones):
+        cal.convert_array(adc)
+    dt = (time.perf_counter() - t_a) / repeticiones
+    print(f"[Bench] Arreglo completo ({n:,}): {n / dt:,.0f} muestras/s")
+
+    lista = adc.tolist()
+    t_a = time.perf_counter()
+    for i in range(0, n, lote):
+        cal.convert(lista[i:i + lote])
+    dt = time.perf_counter() - t_a
+    print(f"[Bench] Lotes de {lote} (lista → listas, como el lector): {n / dt:,.0f} muestras/s")
+
+    # Camino completo del lector: decodificar tramas crudas + calibrar
+    data = b"".join(encode_raw_frame(i, i * 100, x) for i, x in enumerate(lista))
+    dec = FrameDecoder()
+    t_a = time.perf_counter()
+    for i in range(0, len(data), lote * 14):
+        rows = dec.feed(data[i:i + lote * 14])
+        cal.convert([r[2] for r in rows])
+    dt = time.perf_counter() - t_a
+    print(f"[Bench] Decodificación + calibración: {n / dt:,.0f} muestras/s "
+          f"({dec.frames:,} tramas, {dec.corrupt} corruptas)")
+
+
+if __name__ == "__main__":
+    benchmark_calibration()
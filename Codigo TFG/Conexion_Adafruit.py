@@ -8,6 +8,7 @@ from datetime import datetime
 from Adafruit_IO import Client, Feed, RequestError
 from Encriptacion import ensure_dirs, read_encrypted
 from Usuarios import list_users, _save_users
+from Sesiones import is_session_file, load_session, iter_mediciones
 
 
 
@@ -359,12 +360,12 @@ def threaded_upload_user(uid):
                         print(f"[SYNC] ⚠️ No se pudo crear feed '{fk}': {e}")
 
             for fname in os.listdir(user_dir):
-                if not fname.endswith(".json.enc"):
+                if not is_session_file(fname):
                     continue
 
                 path = os.path.join(user_dir, fname)
                 try:
-                    data = json.loads(read_encrypted(path).decode("utf-8"))
+                    data, columnas = load_session(read_encrypted(path))
                 except Exception as e:
                     #print(f"[UPLOAD] ⚠️ No se pudo leer {fname}: {e}")
                     continue
@@ -372,7 +373,7 @@ def threaded_upload_user(uid):
                 session_id = data.get("session_id") or uuid.uuid4().hex[:8].upper()
                 fecha_sesion = data.get("fecha", "?")
                 plan_id = data.get("plan_usado", "?")
-                mediciones = data.get("mediciones", [])
+                mediciones = iter_mediciones(columnas)
 
                 feed_ang = f"{uid.lower()}-angulo"
                 feed_fza = f"{uid.lower()}-fuerza"
@@ -1,16 +1,145 @@
+import os
 import serial
 import serial.tools.list_ports
 import time
+import struct
+import binascii
+import math
+import json
+import itertools
+import threading
+from array import array
+
+from Encriptacion import (SegmentedWriter, iter_encrypted_segments, ensure_dirs,
+                          read_encrypted, write_encrypted)
 
 # Variable global para mantener una sola conexión
 _ser_teensy = None
-_PORT = "COM4"  # Cambia según el caso
+_PORT = None  # Fijar (p. ej. "COM4") para omitir el descubrimiento automático
+
+# ======================= Descubrimiento del puerto =======================
+
+# Identificación USB del Teensy (PJRC): VID 0x16C0, PID según el modo USB
+TEENSY_VID = 0x16C0
+TEENSY_PIDS = (0x0483, 0x0487, 0x0489, 0x048A, 0x04D0)
+TEENSY_SERIAL = None  # Número de serie preferido (None = cualquiera)
+
+PORT_CACHE_FILE = "puerto_teensy.enc"
+
+# Métricas de la última conexión
+_connect_metrics = {}
+
+
+def port_cache_path():
+    return os.path.join(ensure_dirs(), PORT_CACHE_FILE)
+
+
+def _load_port_cache():
+    try:
+        return json.loads(read_encrypted(port_cache_path()).decode("utf-8"))
+    except Exception:
+        return {}
+
+
+def _save_port_cache(port, serial_number=None):
+    cache = {"port": port, "serial_number": serial_number}
+    if cache == _load_port_cache():
+        return
+    try:
+        write_encrypted(port_cache_path(), json.dumps(cache).encode("utf-8"))
+    except OSError as e:
+        print(f"[Teensy] No se pudo guardar el puerto en caché: {e}")
+
+
+def find_teensy_ports(serial_number=None):
+    """
+    Puertos USB con VID/PID de Teensy, opcionalmente filtrados por número
+    de serie. Devuelve [(puerto, número de serie), ...].
+    """
+    found = []
+    for info in serial.tools.list_ports.comports():
+        if info.vid != TEENSY_VID or info.pid not in TEENSY_PIDS:
+            continue
+        if serial_number and info.serial_number != serial_number:
+            continue
+        found.append((info.device, info.serial_number))
+    return found
+
+
+def _candidate_ports(serial_number=None, excluir=()):
+    """
+    Orden de prueba: puerto en caché (sin enumerar, arranque casi inmediato)
+    y luego los encontrados por VID/PID/número de serie. Se omiten los
+    puertos de 'excluir' (p. ej. los ya abiertos por otros equipos).
+    """
+    cache = _load_port_cache()
+    if (cache.get("port") and cache["port"] not in excluir
+            and (not serial_number or cache.get("serial_number") == serial_number)):
+        yield cache["port"], cache.get("serial_number"), "cache"
+    for port, sn in find_teensy_ports(serial_number):
+        if port != cache.get("port") and port not in excluir:
+            yield port, sn, "enumeracion"
+
+
+def connection_metrics() -> dict:
+    """Métricas de la última conexión (origen del puerto, tiempo, intentos)."""
+    return dict(_connect_metrics)
+
 
 # ======================= Conexión =======================
 
-def conectar_teensy(baud=115200, timeout=0.2):
+def abrir_teensy(baud=115200, timeout=0.2, port=None, serial_number=None, excluir=()):
+    """
+    Abre una conexión nueva (sin tocar la conexión única del módulo).
+    Con 'port' se usa ese puerto aunque no responda al ping; si no, se
+    prueban los candidatos por caché y VID/PID/número de serie, salvo los de
+    'excluir', y solo se acepta uno que responda.
+    Devuelve (serial o None, métricas de la conexión).
+    """
+    t_ini = time.perf_counter()
+    if port:
+        candidates = [(port, serial_number, "fijo")]
+    else:
+        candidates = _candidate_ports(serial_number, excluir)
+
+    # Buscar y abrir puerto
+    intentos = 0
+    for cand, sn, origen in candidates:
+        intentos += 1
+        try:
+            ser = serial.Serial(cand, baudrate=baud, timeout=timeout)
+        except serial.SerialException as e:
+            #print(f"[Teensy] Error al conectar: {e}")
+            continue
+        # Esperar solo hasta que el firmware responda (antes: pausa fija de 0.5 s)
+        version = ping_teensy(ser)
+        if version is None:
+            if origen != "fijo":
+                # Puerto de la caché o de la enumeración que no responde como un
+                # Teensy (p. ej. la caché apunta ahora a otro dispositivo serie)
+                print(f"[Teensy] {cand} no respondió al ping; se prueba el siguiente.")
+                try:
+                    ser.close()
+                except Exception:
+                    pass
+                continue
+            print(f"[Teensy] {cand} no confirmó el ping (¿firmware sin confirmaciones?).")
+        #print(f"[Teensy] Conectado en {cand}")
+        return ser, {"puerto": cand, "origen": origen, "intentos": intentos,
+                     "protocolo": version, "numero_serie": sn,
+                     "t_conexion_s": time.perf_counter() - t_ini}
+
+    return None, {"puerto": None, "origen": None, "intentos": intentos, "numero_serie": None,
+                  "t_conexion_s": time.perf_counter() - t_ini}
+
+
+def conectar_teensy(baud=115200, timeout=0.2, port=None, serial_number=None):
     """
     Establece o reutiliza la conexión única con el Teensy.
+    Con 'port' (o _PORT) se usa ese puerto (p. ej. el del simulador); si no,
+    se prueba el puerto en caché y luego se buscan Teensy por VID/PID
+    (y número de serie, si se indica o hay TEENSY_SERIAL).
+    Para varios equipos a la vez ver Dispositivos.DeviceManager.
     Retorna el objeto serial si está disponible.
     """
     global _ser_teensy
@@ -20,50 +149,64 @@ def conectar_teensy(baud=115200, timeout=0.2):
         #print("[Teensy] Conexión existente reutilizada.")
         return _ser_teensy
 
-    # Buscar y abrir puerto
-    try:
-        _ser_teensy = serial.Serial(_PORT, baudrate=baud, timeout=timeout)
-        time.sleep(0.5)
-        #print(f"[Teensy] Conectado en {_PORT}")
-        return _ser_teensy
-    except serial.SerialException as e:
-        #print(f"[Teensy] Error al conectar: {e}")
+    fixed = port or _PORT
+    _ser_teensy, metrics = abrir_teensy(baud, timeout, port=fixed,
+                                        serial_number=serial_number or TEENSY_SERIAL)
+    if _ser_teensy is not None and not fixed:
+        _save_port_cache(metrics["puerto"], metrics["numero_serie"])
+    _connect_metrics.update(metrics)
+    return _ser_teensy
+
+
+def reconectar_teensy(configurar=None, **kwargs):
+    """
+    Cierra la conexión actual (si quedó abierta tras un error), vuelve a
+    conectar y aplica 'configurar(ser)'. Devuelve el nuevo serial o None.
+    """
+    global _ser_teensy
+    if _ser_teensy is not None:
+        try:
+            _ser_teensy.close()
+        except Exception:
+            pass
         _ser_teensy = None
-        return None
+    ser = conectar_teensy(**kwargs)
+    if ser is not None and configurar is not None:
+        configurar(ser)
+    return ser
 
 
 # ======================= Configuración =======================
 
-def configurar_teensy(ser, resorte, tipo):
+def configurar_teensy(ser, resorte, tipo, reader=None):
     """
-    Envía configuración inicial (resorte y modo).
+    Envía configuración inicial (resorte y modo) y espera su confirmación.
+    Retorna True si el Teensy aceptó ambos valores.
     """
     if ser is None:
         #print("[Teensy] No hay conexión activa.")
-        return
+        return False
 
     try:
         resorte = str(resorte).strip()
         tipo = tipo.strip().upper()
         if not resorte.isdigit():
             print("[Teensy] Valor de resorte inválido.")
-            return
+            return False
         if tipo not in ("E", "F"):
             print("[Teensy] Tipo inválido (usar 'E' o 'F').")
-            return
+            return False
 
-        ser.flushInput()
-        ser.flushOutput()
-        time.sleep(0.1)
-        ser.write(f"{resorte}\n".encode("utf-8"))
-        time.sleep(0.1)
-        ser.write(f"{tipo}\n".encode("utf-8"))
-        time.sleep(0.1)
+        if reader is None:
+            ser.reset_input_buffer()
+        enviar_comandos(ser, [resorte, tipo], reader=reader)
 
         print(f"[Teensy] Configurado → Resorte {resorte}, Tipo {tipo}")
+        return True
 
     except Exception as e:
         print(f"[Teensy] Error al configurar: {e}")
+        return False
 
 
 # ======================= Lectura =======================
@@ -88,6 +231,890 @@ def leer_teensy_linea(ser):
     return None
 
 
+# ======================= Geometría del equipo =======================
+# Espejo en Python de convertirAngulo()/calcularFuerza() de Teensy/Teensy.ino.
+
+ADC_MAX = 1023
+POT_ESCALA = 10000.0
+ANG_PENDIENTE = 0.0274
+ANG_OFFSET = -138.472
+
+BRAZO_A = 0.081   # Distancia punto fijo (m)
+BRAZO_R = 0.026   # Radio brazo móvil (m)
+
+# Resortes: índice 1..3 → (L0, K)
+RESORTES = {
+    1: (0.045, 428.3),
+    2: (0.046, 595.6),
+    3: (0.04, 12146.8),
+}
+
+
+def convertir_angulo(lectura, modo="E"):
+    """Lectura del potenciómetro (0–1023) → ángulo en grados."""
+    ang = ANG_PENDIENTE * (lectura / ADC_MAX * POT_ESCALA) + ANG_OFFSET
+    return ang if modo == "E" else -ang
+
+
+def angulo_a_adc(angulo, modo="E"):
+    """Inversa de convertir_angulo(), redondeada y limitada al rango del ADC."""
+    ang = angulo if modo == "E" else -angulo
+    lectura = round((ang - ANG_OFFSET) / ANG_PENDIENTE / POT_ESCALA * ADC_MAX)
+    return min(ADC_MAX, max(0, lectura))
+
+
+def calcular_fuerza(angulo, resorte, modo="E"):
+    """Fuerza del resorte (N) para un ángulo (°), con la geometría del firmware."""
+    if resorte not in RESORTES:
+        return 0.0
+    _, k = RESORTES[resorte]
+    theta = math.radians(angulo)
+    largo = math.hypot(BRAZO_R * math.cos(theta) - BRAZO_A, BRAZO_R * math.sin(theta))
+    delta = largo - abs(BRAZO_A - BRAZO_R)
+    return k * delta if delta > 0 else 0.0
+
+
+# Tabla ángulo → fuerza del firmware (fuerzaTabla): |ángulo| de 0° a 180°
+LUT_PASO = 0.5
+LUT_N = 361
+_TABLAS_FUERZA = {r: [calcular_fuerza(i * LUT_PASO, r) for i in range(LUT_N)] for r in RESORTES}
+
+
+def fuerza_tabla(angulo, resorte):
+    """Fuerza por tabla con interpolación lineal, igual que el firmware."""
+    tabla = _TABLAS_FUERZA.get(resorte)
+    if tabla is None:
+        return 0.0
+    x = abs(angulo) / LUT_PASO
+    if x >= LUT_N - 1:
+        return tabla[-1]
+    i = int(x)
+    return tabla[i] + (x - i) * (tabla[i + 1] - tabla[i])
+
+
+# ======================= Protocolo binario =======================
+#
+# Trama (little-endian), ver Teensy/Teensy.ino:
+#   0xA5 0x5A | tipo u8 | largo u8 | payload (largo bytes) | CRC-16/CCITT u16
+# El CRC cubre tipo, largo y payload. Payload de datos (tipo 0x01):
+#   secuencia u16 | t_us u32 | adc u16 | angulo f32 | fuerza f32
+# Confirmación de comando (tipo 0x02):
+#   id u16 | estado u8 | valor i32
+# Muestra cruda (tipo 0x03, salida 'C', calibración en el host):
+#   secuencia u16 | t_us u32 | adc_x16 u16 (lectura promediada en 1/16 de cuenta)
+
+SYNC = b"\xA5\x5A"
+FRAME_DATA = 0x01
+FRAME_ACK = 0x02
+FRAME_RAW = 0x03
+MAX_PAYLOAD = 64
+ADC_FRAC = 16
+
+_FRAME_HEAD = struct.Struct("<2sBB")
+_DATA_PAYLOAD = struct.Struct("<HIHff")
+_ACK_PAYLOAD = struct.Struct("<HBi")
+_RAW_PAYLOAD = struct.Struct("<HIH")
+_CRC = struct.Struct("<H")
+_NAN = float("nan")
+
+
+def crc16_ccitt(data) -> int:
+    """CRC-16/CCITT-FALSE (polinomio 0x1021, valor inicial 0xFFFF)."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(tipo, payload) -> bytes:
+    body = bytes((tipo, len(payload))) + payload
+    return SYNC + body + _CRC.pack(crc16_ccitt(body))
+
+
+def encode_data_frame(seq, t_us, adc, ang, fuerza) -> bytes:
+    """Construye una trama de datos (la usan el simulador y las pruebas)."""
+    return encode_frame(FRAME_DATA, _DATA_PAYLOAD.pack(seq & 0xFFFF, t_us & 0xFFFFFFFF,
+                                                        adc, ang, fuerza))
+
+
+def encode_raw_frame(seq, t_us, adc) -> bytes:
+    """Construye una trama cruda a partir de la lectura (en cuentas, admite fracción)."""
+    return encode_frame(FRAME_RAW, _RAW_PAYLOAD.pack(seq & 0xFFFF, t_us & 0xFFFFFFFF,
+                                                      round(adc * ADC_FRAC)))
+
+
+def encode_ack_frame(cmd_id, estado, valor=0) -> bytes:
+    """Construye una trama de confirmación de comando."""
+    return encode_frame(FRAME_ACK, _ACK_PAYLOAD.pack(cmd_id & 0xFFFF, estado, valor))
+
+
+class FrameDecoder:
+    """
+    Decodificador incremental de tramas binarias. feed() acepta cualquier
+    cantidad de bytes (p. ej. todo lo que devolvió un read()) y devuelve las
+    muestras completas como tuplas (secuencia, t_us, adc, angulo, fuerza).
+    En tramas crudas angulo y fuerza son NaN (los calcula la calibración del host).
+    Lleva contadores de tramas válidas, corruptas (CRC), perdidas (saltos de
+    secuencia) y bytes descartados al resincronizar.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.last_seq = None
+        self.frames = 0
+        self.corrupt = 0
+        self.dropped = 0
+        self.garbage_bytes = 0
+        self.acks = []    # confirmaciones recibidas: (id, estado, valor)
+        self.other = []   # tramas de otros tipos: (tipo, payload)
+
+    def reset(self):
+        """Descarta bytes pendientes y la secuencia (p. ej. tras reconectar)."""
+        self._buf.clear()
+        self.last_seq = None
+
+    def feed(self, data) -> list:
+        buf = self._buf
+        buf += data
+        out = []
+        pos = 0
+        n = len(buf)
+        while True:
+            i = buf.find(SYNC, pos)
+            if i < 0:
+                # Conservar un posible primer byte de sincronía al final
+                keep = 1 if n and buf[n - 1] == SYNC[0] else 0
+                self.garbage_bytes += n - pos - keep
+                pos = n - keep
+                break
+            self.garbage_bytes += i - pos
+            pos = i
+            if n - pos < _FRAME_HEAD.size:
+                break
+            _, tipo, largo = _FRAME_HEAD.unpack_from(buf, pos)
+            if largo > MAX_PAYLOAD:
+                self.corrupt += 1
+                pos += 1
+                continue
+            end = pos + _FRAME_HEAD.size + largo + _CRC.size
+            if end > n:
+                break
+            (crc,) = _CRC.unpack_from(buf, end - _CRC.size)
+            if crc != crc16_ccitt(buf[pos + 2:end - _CRC.size]):
+                self.corrupt += 1
+                pos += 1
+                continue
+            payload_at = pos + _FRAME_HEAD.size
+            if tipo == FRAME_DATA and largo == _DATA_PAYLOAD.size:
+                sample = _DATA_PAYLOAD.unpack_from(buf, payload_at)
+            elif tipo == FRAME_RAW and largo == _RAW_PAYLOAD.size:
+                seq, t_us, adc_x16 = _RAW_PAYLOAD.unpack_from(buf, payload_at)
+                sample = (seq, t_us, adc_x16 / ADC_FRAC, _NAN, _NAN)
+            else:
+                sample = None
+            if sample is not None:
+                seq = sample[0]
+                if self.last_seq is not None:
+                    gap = (seq - self.last_seq - 1) & 0xFFFF
+                    if gap < 0x8000:
+                        self.dropped += gap
+                self.last_seq = seq
+                self.frames += 1
+                out.append(sample)
+            elif tipo == FRAME_ACK and largo == _ACK_PAYLOAD.size:
+                self.acks.append(_ACK_PAYLOAD.unpack_from(buf, payload_at))
+            else:
+                self.other.append((tipo, bytes(buf[payload_at:payload_at + largo])))
+            pos = end
+        del buf[:pos]
+        return out
+
+    def stats(self) -> dict:
+        return {"tramas": self.frames, "corruptas": self.corrupt,
+                "perdidas": self.dropped, "bytes_basura": self.garbage_bytes}
+
+
+# ======================= Comandos confirmados =======================
+#
+# Cada comando se envía como "#<id> <comando>\n". El firmware responde con
+# una trama FRAME_ACK (salida binaria) o una línea "#ACK,id,estado,valor"
+# (salida ASCII), que los decodificadores separan de las muestras. Así el
+# host espera solo lo que el Teensy tarda en responder, sin pausas fijas.
+# Los comandos sin id siguen funcionando como antes (con eco en ASCII).
+
+ACK_OK = 0
+ACK_DESCONOCIDO = 1
+ACK_INVALIDO = 2
+ACK_AJUSTADO = 3   # Aceptado con el valor limitado al rango permitido
+
+ACK_MENSAJES = {
+    ACK_OK: "correcto",
+    ACK_DESCONOCIDO: "comando desconocido",
+    ACK_INVALIDO: "valor inválido",
+    ACK_AJUSTADO: "valor ajustado al rango",
+}
+
+# Límites de muestreo del firmware (ver Teensy.ino)
+FREC_MIN_HZ = 1
+FREC_MAX_HZ = 5000
+FREC_ADC_MAX_HZ = 50000
+DECIMACION_MAX = 64
+
+ACK_LINE_PREFIX = b"#ACK,"
+ACK_TIMEOUT_S = 0.5
+CONNECT_TIMEOUT_S = 1.0
+PROTOCOL_VERSION = 2   # Respuesta al comando "?" (ping)
+
+_cmd_ids = itertools.count(1)
+
+
+class TeensyCommandError(Exception):
+    """El Teensy rechazó un comando o no lo confirmó a tiempo."""
+
+
+def parse_ack_line(raw):
+    """b"#ACK,id,estado,valor" → (id, estado, valor) o None."""
+    try:
+        _, cmd_id, estado, valor = raw.strip().split(b",")
+        return int(cmd_id), int(estado), int(valor)
+    except ValueError:
+        return None
+
+
+def _next_cmd_id():
+    return next(_cmd_ids) % 0xFFFF + 1
+
+
+class AckWaiter:
+    """Confirmaciones pendientes, resueltas desde el hilo lector."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = {}
+
+    def expect(self, ids):
+        with self._cond:
+            for i in ids:
+                self._pending[i] = None
+
+    def resolve(self, cmd_id, estado, valor):
+        with self._cond:
+            if cmd_id in self._pending:
+                self._pending[cmd_id] = (estado, valor)
+                self._cond.notify_all()
+
+    def wait(self, ids, timeout):
+        """Espera las confirmaciones de 'ids'; las que no lleguen quedan en None."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(self._pending[i] is None for i in ids):
+                restante = deadline - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            return [self._pending.pop(i) for i in ids]
+
+
+def _wait_acks_direct(ser, ids, timeout):
+    """
+    Espera confirmaciones leyendo el puerto directamente (sin hilo lector,
+    p. ej. al conectar). Acepta tanto tramas como líneas ASCII; las muestras
+    que lleguen mientras tanto se descartan.
+    """
+    frames, lines = FrameDecoder(), AsciiLineDecoder()
+    got = {}
+    deadline = time.monotonic() + timeout
+    while len(got) < len(ids) and time.monotonic() < deadline:
+        n = ser.in_waiting
+        data = ser.read(n if n else 1)
+        if not data:
+            continue
+        frames.feed(data)
+        lines.feed(data)
+        for cmd_id, estado, valor in frames.acks + lines.acks:
+            if cmd_id in ids:
+                got[cmd_id] = (estado, valor)
+        frames.acks.clear()
+        lines.acks.clear()
+    return [got.get(i) for i in ids]
+
+
+def enviar_comandos(ser, comandos, timeout=ACK_TIMEOUT_S, reader=None):
+    """
+    Envía varios comandos de una vez y espera sus confirmaciones.
+    Si hay un TeensyReader activo sobre el puerto, es él quien las recibe.
+    Devuelve [(estado, valor), ...]; lanza TeensyCommandError si alguno se
+    rechaza o no se confirma dentro de 'timeout' segundos.
+    """
+    ids = [_next_cmd_id() for _ in comandos]
+    payload = "".join(f"#{i} {c}\n" for i, c in zip(ids, comandos)).encode("utf-8")
+    if reader is not None and reader.running:
+        reader.acks.expect(ids)
+        ser.write(payload)
+        results = reader.acks.wait(ids, timeout)
+    else:
+        ser.write(payload)
+        results = _wait_acks_direct(ser, ids, timeout)
+
+    for cmd, res in zip(comandos, results):
+        if res is None:
+            raise TeensyCommandError(f"Sin confirmación del Teensy para '{cmd}'")
+        estado, _ = res
+        if estado not in (ACK_OK, ACK_AJUSTADO):
+            raise TeensyCommandError(
+                f"El Teensy rechazó '{cmd}': {ACK_MENSAJES.get(estado, estado)}")
+    return results
+
+
+def enviar_comando(ser, comando, timeout=ACK_TIMEOUT_S, reader=None):
+    """Envía un comando y devuelve (estado, valor) de su confirmación."""
+    return enviar_comandos(ser, [comando], timeout, reader)[0]
+
+
+def ping_teensy(ser, timeout=CONNECT_TIMEOUT_S):
+    """Devuelve la versión de protocolo del firmware, o None si no responde."""
+    try:
+        return enviar_comando(ser, "?", timeout)[1]
+    except TeensyCommandError:
+        return None
+
+
+def configurar_salida(ser, modo="B", reader=None):
+    """
+    Selecciona salida binaria ('B'), cruda ('C': lecturas del ADC para
+    calibrar en el host) o ASCII ('A', para depuración).
+    """
+    if ser is None:
+        return False
+    modo = modo.strip().upper()
+    if modo not in ("A", "B", "C"):
+        print("[Teensy] Salida inválida (usar 'A', 'B' o 'C').")
+        return False
+    try:
+        enviar_comando(ser, modo, reader=reader)
+        return True
+    except TeensyCommandError as e:
+        print(f"[Teensy] Error al configurar la salida: {e}")
+        return False
+
+
+def configurar_frecuencia(ser, hz, reader=None):
+    """
+    Fija la frecuencia de envío del Teensy (FREC_MIN_HZ–FREC_MAX_HZ); se
+    puede cambiar en plena sesión pasando el lector activo. El firmware la
+    limita además según la decimación (frecuencia × decimación ≤ FREC_ADC_MAX_HZ).
+    Devuelve la frecuencia que quedó aplicada, o None si falló.
+    """
+    if ser is None:
+        return None
+    hz = max(FREC_MIN_HZ, min(FREC_MAX_HZ, int(hz)))
+    try:
+        return enviar_comando(ser, f"R{hz}", reader=reader)[1]
+    except TeensyCommandError as e:
+        print(f"[Teensy] Error al configurar la frecuencia: {e}")
+        return None
+
+
+def configurar_decimacion(ser, n, reader=None):
+    """
+    Fija cuántas lecturas del ADC promedia el Teensy por muestra enviada
+    (1–DECIMACION_MAX). Devuelve el valor aplicado, o None si falló.
+    """
+    if ser is None:
+        return None
+    n = max(1, min(DECIMACION_MAX, int(n)))
+    try:
+        return enviar_comando(ser, f"D{n}", reader=reader)[1]
+    except TeensyCommandError as e:
+        print(f"[Teensy] Error al configurar la decimación: {e}")
+        return None
+
+
+def _consultar(ser, cmd, reader):
+    if ser is None:
+        return None
+    try:
+        return enviar_comando(ser, cmd, reader=reader)[1]
+    except TeensyCommandError as e:
+        print(f"[Teensy] Error en la consulta '{cmd}': {e}")
+        return None
+
+
+def consultar_frecuencia(ser, reader=None):
+    """Frecuencia de envío actual del Teensy (Hz), o None."""
+    return _consultar(ser, "R?", reader)
+
+
+def consultar_decimacion(ser, reader=None):
+    """Decimación actual del Teensy, o None."""
+    return _consultar(ser, "D?", reader)
+
+
+def leer_teensy_tramas(ser, decoder: FrameDecoder):
+    """
+    Lee todo lo disponible en el puerto y devuelve la lista de muestras
+    binarias decodificadas (puede estar vacía).
+    """
+    if ser is None:
+        return []
+    try:
+        data = ser.read(ser.in_waiting or 1)
+    except serial.SerialException:
+        return []
+    return decoder.feed(data) if data else []
+
+
+# ======================= Buffer circular de muestras =======================
+
+class SampleRing:
+    """
+    Buffer circular preasignado de muestras (t_host, t_dev, angulo, fuerza).
+    - t_host: time.monotonic() al recibir el bloque de bytes.
+    - t_dev:  marca de tiempo del Teensy en segundos (o t_host en modo ASCII).
+    Si el consumidor se atrasa, se sobrescriben las más antiguas y se cuenta
+    en 'overruns'. Los consumidores toman lotes con take()/wait_take().
+    """
+
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self._t_host = array("d", bytes(8 * capacity))
+        self._t_dev = array("d", bytes(8 * capacity))
+        self._ang = array("d", bytes(8 * capacity))
+        self._fuerza = array("d", bytes(8 * capacity))
+        self._head = 0      # próxima posición de escritura
+        self._count = 0
+        self._cond = threading.Condition()
+        self.pushed = 0
+        self.overruns = 0
+
+    def __len__(self):
+        return self._count
+
+    def push_many(self, rows):
+        """Agrega muestras [(t_host, t_dev, ang, fuerza), ...]."""
+        if not rows:
+            return
+        with self._cond:
+            cap = self.capacity
+            for t_host, t_dev, ang, fuerza in rows:
+                i = self._head
+                self._t_host[i] = t_host
+                self._t_dev[i] = t_dev
+                self._ang[i] = ang
+                self._fuerza[i] = fuerza
+                self._head = (i + 1) % cap
+                if self._count == cap:
+                    self.overruns += 1
+                else:
+                    self._count += 1
+            self.pushed += len(rows)
+            self._cond.notify_all()
+
+    def take(self, max_n=None):
+        """Extrae hasta max_n muestras (todas si es None), de la más antigua a la más nueva."""
+        with self._cond:
+            return self._take_locked(max_n)
+
+    def wait_take(self, timeout=None, max_n=None):
+        """Como take(), pero espera hasta 'timeout' s a que haya datos."""
+        with self._cond:
+            if self._count == 0:
+                self._cond.wait(timeout)
+            return self._take_locked(max_n)
+
+    def _take_locked(self, max_n):
+        n = self._count if max_n is None else min(max_n, self._count)
+        if n == 0:
+            return []
+        cap = self.capacity
+        start = (self._head - self._count) % cap
+        out = []
+        for k in range(n):
+            i = (start + k) % cap
+            out.append((self._t_host[i], self._t_dev[i], self._ang[i], self._fuerza[i]))
+        self._count -= n
+        return out
+
+    def clear(self):
+        with self._cond:
+            self._count = 0
+
+
+# ======================= Lector en hilo =======================
+
+class AsciiLineDecoder:
+    """
+    Decodificador incremental de líneas "angulo,fuerza" (modo ASCII).
+    Las confirmaciones "#ACK,id,estado,valor" se separan en 'acks'.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.lines = 0
+        self.malformed = 0
+        self.acks = []
+
+    def reset(self):
+        self._buf = bytearray()
+
+    def feed(self, data) -> list:
+        self._buf += data
+        *lines, rest = self._buf.split(b"\n")
+        self._buf = bytearray(rest)
+        out = []
+        for raw in lines:
+            raw = raw.strip()
+            if not raw:
+                continue
+            if raw.startswith(ACK_LINE_PREFIX):
+                ack = parse_ack_line(raw)
+                if ack:
+                    self.acks.append(ack)
+                continue
+            self.lines += 1
+            parts = raw.split(b",")
+            try:
+                out.append((float(parts[0]), float(parts[1])))
+            except (ValueError, IndexError):
+                self.malformed += 1
+        return out
+
+
+# Espera entre reintentos de reconexión (se duplica hasta el máximo)
+RECONNECT_MIN_S = 0.05
+RECONNECT_MAX_S = 2.0
+
+
+class TeensyReader:
+    """
+    Hilo lector dedicado: se bloquea en el puerto (hasta ser.timeout), vacía
+    de una vez todo lo que hay en in_waiting, decodifica en bloque y deja las
+    muestras en un SampleRing con marcas de tiempo monotónicas.
+    """
+
+    def __init__(self, ser, binary=True, ring: SampleRing = None, capacity=8192,
+                 capture=None, reconnect=None, calibration=None):
+        self.ser = ser
+        self.binary = binary
+        # Calibración en el host (Calibracion.Calibrador): convierte por lotes
+        # la lectura del ADC en ángulo y fuerza (necesaria con la salida 'C')
+        self.calibration = calibration
+        self.capture = capture   # CaptureWriter opcional (copia de los bytes crudos)
+        self._capture_lock = threading.Lock()
+        self.reconnect = reconnect  # Función sin argumentos → nuevo serial o None
+        self.acks = AckWaiter()     # Confirmaciones de comandos enviados con el lector activo
+        self.ring = ring if ring is not None else SampleRing(capacity)
+        self.decoder = FrameDecoder() if binary else AsciiLineDecoder()
+        self._stop = threading.Event()
+        self._thread = None
+        self._t_us_last = None
+        self._t_us_wraps = 0
+        self._dev_offset = 0.0
+        self._last_dev = self._last_host = None
+        self._resync = False
+        self.reads = 0
+        self.bytes_read = 0
+        self.error = None
+
+        # Métricas de conexión
+        self._t_start = None
+        self._t_lost = None
+        self.t_first_sample = None
+        self.t_last_sample = None   # time.monotonic() de la última muestra recibida
+        self.reconnects = 0
+        self.reconnect_latencies = []
+
+    def start(self):
+        if self._thread is None:
+            self._t_start = time.monotonic()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_capture(self, capture):
+        """
+        Cambia la captura con el lector en marcha (p. ej. un equipo compartido
+        entre sesiones). Devuelve la anterior, que ya no recibirá escrituras.
+        """
+        with self._capture_lock:
+            prev, self.capture = self.capture, capture
+        return prev
+
+    def _device_time(self, t_us, t_host):
+        """
+        Convierte micros() (u32, se desborda cada ~71 min) en segundos continuos.
+        Tras una reconexión el Teensy pudo reiniciarse: se empalma la nueva
+        base de tiempo con la anterior usando el reloj del host.
+        """
+        if self._resync:
+            self._resync = False
+            self._t_us_last, self._t_us_wraps = None, 0
+            if self._last_dev is not None:
+                self._dev_offset = self._last_dev + (t_host - self._last_host) - t_us / 1e6
+        if self._t_us_last is not None and t_us < self._t_us_last:
+            self._t_us_wraps += 1
+        self._t_us_last = t_us
+        t_dev = (self._t_us_wraps * 2 ** 32 + t_us) / 1e6 + self._dev_offset
+        self._last_dev, self._last_host = t_dev, t_host
+        return t_dev
+
+    def _convert(self, decoded, t_host):
+        if self.binary and self.calibration is not None and decoded:
+            angs, fuerzas = self.calibration.convert([d[2] for d in decoded])
+            return [(t_host, self._device_time(d[1], t_host), a, f)
+                    for d, a, f in zip(decoded, angs, fuerzas)]
+        if self.binary:
+            return [(t_host, self._device_time(t_us, t_host), ang, fuerza)
+                    for _, t_us, _, ang, fuerza in decoded]
+        return [(t_host, t_host, ang, fuerza) for ang, fuerza in decoded]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._pump()
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._stop.is_set():
+                    return
+                print(f"[Teensy] Lector detenido: {e}")
+                self.error = e
+                if self.reconnect is None or not self._reconnect_loop():
+                    return
+
+    def _pump(self):
+        ser = self.ser
+        while not self._stop.is_set():
+            n = ser.in_waiting
+            data = ser.read(n if n else 1)
+            if not data:
+                continue
+            t_host = time.monotonic()
+            self.reads += 1
+            self.bytes_read += len(data)
+            if self.capture is not None:
+                with self._capture_lock:
+                    if self.capture is not None:
+                        self.capture.write(t_host, data)
+            rows = self._convert(self.decoder.feed(data), t_host)
+            if self.decoder.acks:
+                for ack in self.decoder.acks:
+                    self.acks.resolve(*ack)
+                self.decoder.acks.clear()
+            if rows:
+                self._note_samples(t_host)
+                self.ring.push_many(rows)
+
+    def _note_samples(self, t_host):
+        self.t_last_sample = t_host
+        if self.t_first_sample is None:
+            self.t_first_sample = t_host - self._t_start
+        if self._t_lost is not None:
+            self.reconnect_latencies.append(t_host - self._t_lost)
+            self._t_lost = None
+
+    def _reconnect_loop(self):
+        """Reintenta con espera exponencial hasta reconectar o detenerse."""
+        self._t_lost = time.monotonic()
+        espera = RECONNECT_MIN_S
+        while not self._stop.is_set():
+            try:
+                ser = self.reconnect()
+            except (serial.SerialException, OSError) as e:
+                print(f"[Teensy] Reconexión fallida: {e}")
+                ser = None
+            if ser is not None:
+                self.ser = ser
+                self.decoder.reset()
+                self._resync = True
+                self.reconnects += 1
+                self.error = None
+                print("[Teensy] Reconectado.")
+                return True
+            self._stop.wait(espera)
+            espera = min(RECONNECT_MAX_S, espera * 2)
+        return False
+
+    def stats(self) -> dict:
+        st = {"lecturas": self.reads, "bytes": self.bytes_read,
+              "muestras": self.ring.pushed, "desbordes": self.ring.overruns,
+              "en_buffer": len(self.ring), "t_primera_muestra_s": self.t_first_sample,
+              "reconexiones": self.reconnects,
+              "latencia_reconexion_max_s": max(self.reconnect_latencies, default=None)}
+        if self.binary:
+            st.update(self.decoder.stats())
+        else:
+            st["lineas_invalidas"] = self.decoder.malformed
+        return st
+
+
+# ======================= Captura y reproducción =======================
+#
+# Captura de los bytes crudos recibidos, para reproducir sesiones reales.
+# Contenido (en claro, antes de comprimir y cifrar por segmentos):
+#   encabezado: magic b"PFGR" | versión u8 | flags u8 (bit 0 = binario) | u16 reservado
+#               | inicio f64 (time.time() al abrir)
+#   registros:  dt_us u32 (desde el registro anterior) | largo u16 | bytes
+
+CAPTURE_MAGIC = b"PFGR"
+CAPTURE_VERSION = 1
+CAPTURE_EXT = ".cap.enc"
+CAPTURE_COMPRESSION = "zlib"
+
+_CAP_HEADER = struct.Struct("<4sBBHd")
+_CAP_REC = struct.Struct("<IH")
+_CAP_MAX_CHUNK = 0xFFFF
+
+
+class CaptureWriter:
+    """
+    Escribe la captura en flujo (comprimida y cifrada por segmentos).
+    write() se llama desde el hilo lector con la marca monotónica del read().
+    """
+
+    def __init__(self, path, binary=True):
+        self.path = path
+        self._w = SegmentedWriter(path, compression=CAPTURE_COMPRESSION)
+        self._w.write(_CAP_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION,
+                                       1 if binary else 0, 0, time.time()))
+        self._t_prev = time.monotonic()
+        self.records = 0
+        self.bytes = 0
+
+    def write(self, t_host, data):
+        dt_us = max(0, min(0xFFFFFFFF, int((t_host - self._t_prev) * 1e6)))
+        self._t_prev = t_host
+        mv = memoryview(data)
+        for i in range(0, len(mv), _CAP_MAX_CHUNK):
+            chunk = mv[i:i + _CAP_MAX_CHUNK]
+            self._w.write(_CAP_REC.pack(dt_us, len(chunk)) + chunk)
+            dt_us = 0
+        self.records += 1
+        self.bytes += len(data)
+
+    def close(self):
+        self._w.close()
+
+
+def load_capture(path):
+    """
+    Lee una captura completa. Devuelve (info, registros) con
+    registros = [(t_s desde el inicio, bytes), ...].
+    """
+    raw = b"".join(iter_encrypted_segments(path))
+    magic, version, flags, _, inicio = _CAP_HEADER.unpack_from(raw, 0)
+    if magic != CAPTURE_MAGIC:
+        raise ValueError("No es una captura de Teensy.")
+    if version > CAPTURE_VERSION:
+        raise ValueError(f"Versión de captura no soportada: {version}")
+    records = []
+    off, t_us = _CAP_HEADER.size, 0
+    while off + _CAP_REC.size <= len(raw):
+        dt_us, n = _CAP_REC.unpack_from(raw, off)
+        off += _CAP_REC.size
+        t_us += dt_us
+        records.append((t_us / 1e6, raw[off:off + n]))
+        off += n
+    info = {"binario": bool(flags & 1), "inicio": inicio, "registros": len(records),
+            "bytes": sum(len(d) for _, d in records),
+            "duracion_s": records[-1][0] if records else 0.0}
+    return info, records
+
+
+class ReplaySource:
+    """
+    Objeto tipo serial que entrega una captura a TeensyReader.
+    speed=1.0 respeta los tiempos originales; speed=None (o 0) entrega
+    todo lo antes posible. 'finished' indica que ya se entregó todo.
+    """
+
+    def __init__(self, capture, speed=1.0, timeout=0.2):
+        if isinstance(capture, (str, os.PathLike)):
+            self.info, self._records = load_capture(capture)
+        else:
+            self.info, self._records = capture
+        self.speed = speed or None
+        self.timeout = timeout
+        self.is_open = True
+        self.written = []
+        self.total_bytes = sum(len(d) for _, d in self._records)
+        self._i = 0
+        self._off = 0
+        self._t0 = None
+
+    @property
+    def finished(self):
+        return self._i >= len(self._records)
+
+    def _now(self):
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+        return float("inf") if self.speed is None else (time.monotonic() - self._t0) * self.speed
+
+    @property
+    def in_waiting(self):
+        now = self._now()
+        n, i = 0, self._i
+        while i < len(self._records) and self._records[i][0] <= now:
+            n += len(self._records[i][1])
+            i += 1
+        return n - self._off if n else 0
+
+    def read(self, size=1):
+        if self.finished:
+            time.sleep(self.timeout)
+            return b""
+        t_next = self._records[self._i][0]
+        espera = (t_next - self._now()) / self.speed if self.speed else 0.0
+        if espera > 0:
+            if espera > self.timeout:
+                time.sleep(self.timeout)
+                return b""
+            time.sleep(espera)
+        now = self._now()
+        out = bytearray()
+        while len(out) < size and not self.finished and self._records[self._i][0] <= now:
+            data = self._records[self._i][1]
+            take = data[self._off:self._off + size - len(out)]
+            out += take
+            self._off += len(take)
+            if self._off >= len(data):
+                self._i += 1
+                self._off = 0
+        return bytes(out)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+    def reset_input_buffer(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    flushInput = reset_input_buffer
+    flushOutput = reset_output_buffer
+
+    def close(self):
+        self.is_open = False
+
+
+def puerto_conexion_unica():
+    """
+    Puerto de la conexión global de conectar_teensy() si sigue abierta, o
+    None. DeviceManager lo considera ocupado para no abrirlo dos veces.
+    """
+    ser = _ser_teensy
+    if ser is None or not getattr(ser, "is_open", False):
+        return None
+    return _connect_metrics.get("puerto") or getattr(ser, "port", None)
+
+
 # ======================= Cierre =======================
 
 def cerrar_teensy():
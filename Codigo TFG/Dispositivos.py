@@ -0,0 +1,408 @@
+import time
+import threading
+from collections import deque
+
+from Conexion_Teensy import (abrir_teensy, find_teensy_ports, configurar_teensy, configurar_salida,
+                             configurar_frecuencia, TeensyReader, SampleRing,
+                             puerto_conexion_unica)
+
+# ======================= Varios equipos =======================
+#
+# Conexion_Teensy mantiene una sola conexión global (un equipo por PC). Para
+# sesiones grupales, DeviceManager administra N equipos independientes: cada
+# Equipo tiene su propio serial, hilo lector, buffer circular, configuración
+# (resorte, tipo, salida, frecuencia) y métricas de salud, y se reconecta
+# por su cuenta. Cada KneeRehabilitationGame se asocia a un Equipo.
+
+# Cantidad de lotes recientes usados para las latencias de salud
+LATENCIA_VENTANA = 512
+
+
+def _percentil(valores, q):
+    if not valores:
+        return None
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(q * len(orden)))]
+
+
+class Equipo:
+    """
+    Un equipo de rehabilitación (un Teensy). Se identifica por número de
+    serie USB (sobrevive a cambios de puerto al reconectar) o por puerto fijo.
+    """
+
+    def __init__(self, nombre, port=None, serial_number=None, binary=True, capacity=8192,
+                 gestor=None):
+        self.nombre = nombre
+        self.port = port
+        self.serial_number = serial_number
+        self.binary = binary
+        # El buffer es del equipo: se conserva entre reconexiones y sesiones
+        self.ring = SampleRing(capacity)
+        self.ser = None
+        self.reader = None
+        self.conexion = {}
+        self._gestor = gestor
+        self._lock = threading.Lock()
+
+        # Configuración vigente (se reaplica al reconectar)
+        self.resorte = None
+        self.tipo = None
+        self.salida = "B" if binary else "A"
+        self.frec_hz = None
+        self.calibracion = False
+
+        # Sesión asociada (usuario/juego) o None si está libre
+        self.ocupado_por = None
+
+        # Salud
+        self.lotes = 0
+        self.config_fallidas = 0
+        self._lat_entrega = deque(maxlen=LATENCIA_VENTANA)
+        self._lat_transporte = deque(maxlen=LATENCIA_VENTANA)
+        self._offset_min = None
+
+    def __repr__(self):
+        return f"Equipo({self.nombre!r}, puerto={self.conexion.get('puerto') or self.port})"
+
+    @property
+    def conectado(self):
+        return self.reader is not None and self.reader.running
+
+    # ---------- Conexión ----------
+    def _abrir(self):
+        excluir = self._gestor.puertos_en_uso(excepto=self) if self._gestor else ()
+        ser, metrics = abrir_teensy(port=None if self.serial_number else self.port,
+                                    serial_number=self.serial_number, excluir=excluir)
+        self.conexion = metrics
+        if ser is not None and not self.serial_number:
+            # Sin número de serie, las reconexiones vuelven al mismo puerto
+            self.serial_number = metrics["numero_serie"]
+            self.port = self.port or metrics["puerto"]
+        return ser
+
+    def conectar(self) -> bool:
+        """Abre el puerto, aplica la configuración y arranca el lector."""
+        with self._lock:
+            if self.conectado:
+                return True
+            ser = self._abrir()
+            if ser is None:
+                print(f"[Equipo] {self.nombre}: no se encontró el Teensy.")
+                return False
+            self.ser = ser
+            self._aplicar(ser, reader=None)
+            self.reader = TeensyReader(ser, binary=self.binary, ring=self.ring,
+                                       reconnect=self._reconectar,
+                                       calibration=self._calibrador())
+            self.reader.start()
+            print(f"[Equipo] {self.nombre} conectado en {self.conexion.get('puerto')}")
+            return True
+
+    def _reconectar(self):
+        # Lo llama el hilo lector de este equipo tras perder el puerto
+        try:
+            self.ser.close()
+        except Exception:
+            pass
+        ser = self._abrir()
+        if ser is not None:
+            self.ser = ser
+            self._aplicar(ser, reader=None)
+        return ser
+
+    def detener(self):
+        with self._lock:
+            if self.reader is not None:
+                self.reader.stop()
+                self.reader = None
+            if self.ser is not None:
+                try:
+                    self.ser.close()
+                except Exception:
+                    pass
+                self.ser = None
+
+    # ---------- Configuración ----------
+    def configurar(self, resorte, tipo, salida=None, frec_hz=None) -> bool:
+        """
+        Fija resorte, tipo ('E'/'F'), salida ('A'/'B'/'C') y frecuencia, y los
+        envía si el equipo está conectado. Con salida 'C' calcula ángulo y
+        fuerza en el host con el perfil del equipo (ver Calibracion.py).
+        """
+        self.resorte, self.tipo = resorte, tipo
+        if salida is not None:
+            self.salida = salida
+        if frec_hz is not None:
+            self.frec_hz = frec_hz
+        self.calibracion = self.salida == "C"
+        if not self.conectado:
+            return True
+        ok = self._aplicar(self.ser, reader=self.reader)
+        self.reader.calibration = self._calibrador()
+        return ok
+
+    def _aplicar(self, ser, reader):
+        ok = True
+        if self.resorte is not None:
+            ok = configurar_teensy(ser, self.resorte, self.tipo, reader=reader) and ok
+        if self.binary:
+            ok = configurar_salida(ser, self.salida, reader=reader) and ok
+        if self.frec_hz is not None:
+            ok = configurar_frecuencia(ser, self.frec_hz, reader=reader) is not None and ok
+        if not ok:
+            self.config_fallidas += 1
+        return ok
+
+    def _calibrador(self):
+        if not self.calibracion or self.resorte is None:
+            return None
+        from Calibracion import calibrador_para
+        return calibrador_para(self.serial_number, self.resorte, self.tipo)
+
+    # ---------- Sesión ----------
+    def ocupar(self, dueño):
+        with self._lock:
+            if self.ocupado_por is not None:
+                raise RuntimeError(f"{self.nombre} está en uso por {self.ocupado_por}.")
+            self.ocupado_por = dueño
+        # Descartar lo acumulado mientras el equipo estaba libre
+        self.ring.clear()
+
+    def liberar(self):
+        with self._lock:
+            self.ocupado_por = None
+
+    # ---------- Lectura ----------
+    def tomar(self, timeout=0.1, max_n=None):
+        """
+        Lote de muestras del buffer, como SampleRing.wait_take(), registrando
+        latencias: entrega (lector → consumidor, muestra más antigua del lote)
+        y transporte (t_host − t_dev sobre el mínimo observado: USB + sistema).
+        """
+        batch = self.ring.wait_take(timeout, max_n)
+        if batch:
+            ahora = time.monotonic()
+            self.lotes += 1
+            self._lat_entrega.append(ahora - batch[0][0])
+            t_host, t_dev = batch[-1][0], batch[-1][1]
+            offset = t_host - t_dev
+            if self._offset_min is None or offset < self._offset_min:
+                self._offset_min = offset
+            self._lat_transporte.append(offset - self._offset_min)
+        return batch
+
+    def salud(self) -> dict:
+        entrega, transporte = list(self._lat_entrega), list(self._lat_transporte)
+        reader = self.reader
+        ultima = reader.t_last_sample if reader else None
+        st = {
+            "nombre": self.nombre,
+            "puerto": self.conexion.get("puerto") or self.port,
+            "numero_serie": self.serial_number,
+            "conectado": self.conectado,
+            "ocupado_por": self.ocupado_por,
+            "resorte": self.resorte, "tipo": self.tipo, "salida": self.salida,
+            "frec_hz": self.frec_hz,
+            "config_fallidas": self.config_fallidas,
+            "t_conexion_s": self.conexion.get("t_conexion_s"),
+            "edad_ultima_muestra_s": time.monotonic() - ultima if ultima else None,
+            "lotes": self.lotes,
+            "entrega_p50_ms": _ms(_percentil(entrega, 0.5)),
+            "entrega_p95_ms": _ms(_percentil(entrega, 0.95)),
+            "entrega_max_ms": _ms(max(entrega, default=None)),
+            "transporte_p50_ms": _ms(_percentil(transporte, 0.5)),
+            "transporte_p95_ms": _ms(_percentil(transporte, 0.95)),
+        }
+        if reader is not None:
+            st["lector"] = reader.stats()
+        return st
+
+
+def _ms(v):
+    return None if v is None else v * 1000
+
+
+class DeviceManager:
+    """Conjunto de equipos por nombre, con asignación a sesiones."""
+
+    def __init__(self, binary=True, capacity=8192):
+        self.binary = binary
+        self.capacity = capacity
+        self.equipos = {}   # nombre → Equipo (en orden de alta)
+        self._lock = threading.Lock()
+
+    def _lista(self) -> list:
+        with self._lock:
+            return list(self.equipos.values())
+
+    def _alta(self, nombre, port, serial_number) -> Equipo:
+        """Registra un equipo; se llama con self._lock tomado."""
+        nombre = nombre or f"Equipo {len(self.equipos) + 1}"
+        if nombre in self.equipos:
+            raise ValueError(f"Ya existe un equipo llamado '{nombre}'.")
+        equipo = Equipo(nombre, port, serial_number, binary=self.binary,
+                        capacity=self.capacity, gestor=self)
+        self.equipos[nombre] = equipo
+        return equipo
+
+    def agregar(self, nombre=None, port=None, serial_number=None) -> Equipo:
+        with self._lock:
+            return self._alta(nombre, port, serial_number)
+
+    def descubrir(self) -> list:
+        """
+        Da de alta los Teensy conectados por USB que aún no estén registrados.
+        Enumerar puertos puede tardar: desde la interfaz, llamarlo en un hilo.
+        """
+        encontrados = find_teensy_ports()       # Fuera del lock
+        en_uso = self.puertos_en_uso()
+        nuevos = []
+        with self._lock:
+            conocidos = {e.serial_number for e in self.equipos.values() if e.serial_number}
+            puertos = en_uso | {e.port for e in self.equipos.values() if e.port}
+            for port, sn in encontrados:
+                if (sn and sn in conocidos) or port in puertos:
+                    continue
+                nuevos.append(self._alta(None, None if sn else port, sn))
+        return nuevos
+
+    def obtener(self, nombre) -> Equipo:
+        with self._lock:
+            equipo = self.equipos.get(nombre)
+        if equipo is None:
+            raise KeyError(f"Equipo inexistente: {nombre}")
+        return equipo
+
+    def libres(self) -> list:
+        return [e for e in self._lista() if e.ocupado_por is None]
+
+    def puertos_en_uso(self, excepto=None) -> set:
+        puertos = {e.conexion["puerto"] for e in self._lista()
+                   if e is not excepto and e.ser is not None and e.conexion.get("puerto")}
+        # La conexión única de conectar_teensy() también ocupa su puerto
+        unico = puerto_conexion_unica()
+        if unico:
+            puertos.add(unico)
+        return puertos
+
+    def conectar_todos(self) -> dict:
+        return {e.nombre: e.conectar() for e in self._lista()}
+
+    def asignar(self, nombre, dueño) -> Equipo:
+        """
+        Reserva el equipo 'nombre' (o el primero libre si es None) para una
+        sesión. Lanza RuntimeError si está ocupado o no hay equipos libres.
+        La conexión la abre quien lo usa (Equipo.conectar(), p. ej. el juego).
+        """
+        if nombre is None:
+            # Otro hilo puede reservar el mismo equipo entre libres() y ocupar()
+            for equipo in self.libres():
+                try:
+                    equipo.ocupar(dueño)
+                    return equipo
+                except RuntimeError:
+                    continue
+            raise RuntimeError("No hay equipos libres.")
+        equipo = self.obtener(nombre)
+        equipo.ocupar(dueño)
+        return equipo
+
+    def quitar(self, nombre):
+        self.obtener(nombre).detener()
+        with self._lock:
+            del self.equipos[nombre]
+
+    def cerrar_todos(self):
+        for equipo in self._lista():
+            equipo.detener()
+
+    def salud(self) -> dict:
+        return {e.nombre: e.salud() for e in self._lista()}
+
+    def stats(self) -> dict:
+        """Totales de todos los equipos."""
+        equipos = self._lista()
+        lectores = [e.reader.stats() for e in equipos if e.reader]
+        return {
+            "equipos": len(equipos),
+            "conectados": sum(e.conectado for e in equipos),
+            "ocupados": sum(e.ocupado_por is not None for e in equipos),
+            "muestras": sum(st["muestras"] for st in lectores),
+            "desbordes": sum(st["desbordes"] for st in lectores),
+            "reconexiones": sum(st["reconexiones"] for st in lectores),
+        }
+
+
+# Gestor compartido por la aplicación
+_gestor = None
+_gestor_lock = threading.Lock()
+
+
+def gestor_equipos() -> DeviceManager:
+    global _gestor
+    if _gestor is None:
+        with _gestor_lock:
+            if _gestor is None:
+                _gestor = DeviceManager()
+    return _gestor
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_devices(cantidades=(1, 2, 3), rate_hz=1000, seconds=3.0):
+    """
+    Levanta N simuladores, los conecta con un DeviceManager y consume cada
+    equipo en su propio hilo (como N juegos). Mide el caudal total y la
+    latencia de cada equipo.
+    """
+    from Simulador_Teensy import TeensySimulator
+
+    for n in cantidades:
+        sims = [TeensySimulator(seed=i).start() for i in range(n)]
+        gestor = DeviceManager()
+        try:
+            for i, sim in enumerate(sims):
+                equipo = gestor.agregar(port=sim.port)
+                equipo.configurar(str(i % 3 + 1), "EF"[i % 2], frec_hz=rate_hz)
+            conectados = gestor.conectar_todos()
+
+            recibidas = {nombre: 0 for nombre in gestor.equipos}
+            detener = threading.Event()
+
+            def consumir(equipo):
+                equipo.ocupar("bench")
+                while not detener.is_set():
+                    recibidas[equipo.nombre] += len(equipo.tomar(timeout=0.1))
+
+            hilos = [threading.Thread(target=consumir, args=(e,), daemon=True)
+                     for e in gestor.equipos.values()]
+            t_ini = time.perf_counter()
+            for h in hilos:
+                h.start()
+            time.sleep(seconds)
+            detener.set()
+            for h in hilos:
+                h.join()
+            dt = time.perf_counter() - t_ini
+
+            # Cada simulador debe haber recibido la configuración de su equipo
+            aislados = all(sim.resorte_sel == int(e.resorte) and sim.modo_sel == e.tipo
+                           for sim, e in zip(sims, gestor.equipos.values()))
+            total = sum(recibidas.values())
+            print(f"[Bench] {n} equipo(s) a {rate_hz} Hz: {total / dt:,.0f} muestras/s en total "
+                  f"({total / dt / n:,.0f} por equipo), conectados {sum(conectados.values())}/{n}, "
+                  f"configuración aislada: {'sí' if aislados else 'NO'}")
+            for nombre, st in gestor.salud().items():
+                print(f"        {nombre}: entrega p50 {st['entrega_p50_ms']:.2f} ms, "
+                      f"p95 {st['entrega_p95_ms']:.2f} ms, máx {st['entrega_max_ms']:.2f} ms | "
+                      f"transporte p95 {st['transporte_p95_ms']:.2f} ms | "
+                      f"perdidas {st['lector'].get('perdidas', 0)}, desbordes {st['lector']['desbordes']}")
+        finally:
+            gestor.cerrar_todos()
+            for sim in sims:
+                sim.stop()
+
+
+if __name__ == "__main__":
+    benchmark_devices()
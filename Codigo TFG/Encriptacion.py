@@ -1,5 +1,16 @@
 import os
-from cryptography.fernet import Fernet
+import time
+import lzma
+import zlib
+import base64
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
 
 # ======================= Directorios =======================
 
@@ -25,21 +36,807 @@ def load_or_create_key():
             f.write(key)
     else:
         with open(path, "rb") as f:
-            key = f.read()
+            key = f.read().strip()
     return key
 
-# Inicializa el cifrador global
-_F = Fernet(load_or_create_key())
+def old_keys_path():
+    """Ruta al archivo de claves anteriores (solo para descifrar)."""
+    return os.path.join(ensure_dirs(), "claves_anteriores.key")
+
+def load_old_keys():
+    """Claves anteriores, de la más reciente a la más antigua."""
+    path = old_keys_path()
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def key_id(key: bytes) -> int:
+    """Identificador corto (16 bits, nunca 0) de una clave, guardado en los encabezados."""
+    return int.from_bytes(hashlib.sha256(key).digest()[:2], "little") or 1
+
+def _write_key_file(path, lines):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\n".join(lines) + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+# ======================= Sobre binario AEAD =======================
+#
+# Formato en disco (sin base64):
+#   magic b"PFGA" | versión u8 | algoritmo u8 | id de clave u16 | nonce (12) | cifrado + tag (16)
+# El encabezado de 8 bytes se autentica como datos asociados.
+# La clave AEAD se deriva con HKDF-SHA256 de la misma clave.key, así que no
+# hace falta generar ni repartir claves nuevas. Los tokens Fernet antiguos
+# se siguen leyendo de forma transparente.
+
+ENVELOPE_MAGIC = b"PFGA"
+ENVELOPE_VERSION = 1
+
+# Formato usado al escribir: "aead" (sobre binario) o "fernet" (token base64 antiguo)
+ENCRYPTION_FORMAT = "aead"
+# Algoritmo AEAD para escrituras nuevas: "aesgcm" | "chacha20"
+AEAD_ALGORITHM = "aesgcm"
+
+_ENV_HEADER = struct.Struct("<4sBBH")
+_NONCE_SIZE = 12
+_TAG_SIZE = 16
+_AEAD_IDS = {"aesgcm": 1, "chacha20": 2}
+_AEAD_CLASSES = {1: AESGCM, 2: ChaCha20Poly1305}
+
+
+def derive_aead_key(fernet_key: bytes, alg_id: int) -> bytes:
+    """Deriva la clave AEAD (32 bytes) a partir de la clave Fernet."""
+    master = base64.urlsafe_b64decode(fernet_key)
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=b"PFG sobre AEAD v1/" + bytes([alg_id])).derive(master)
+
+
+# ======================= Llavero (rotación de claves) =======================
+#
+# clave.key es la clave principal (cifra y descifra); claves_anteriores.key
+# guarda las claves rotadas, que solo se usan para descifrar. Los encabezados
+# AEAD llevan key_id() en el campo reservado para elegir la clave directamente;
+# si no coincide (p. ej. archivos con id 0) o si el descifrado falla (dos
+# claves con el mismo id de 16 bits) se prueban todas.
+
+_F = None          # MultiFernet: cifra con la principal, descifra con todas
+_AEAD = {}         # (key_id, algoritmo) -> cifrador AEAD
+_AEAD_ALL = []     # (algoritmo, cifrador) de todas las claves, la principal primero
+_PRIMARY_KID = 0
+
+
+def _reload_keys():
+    """(Re)construye los cifradores globales desde los archivos de clave."""
+    global _F, _AEAD, _AEAD_ALL, _PRIMARY_KID
+    keys = [load_or_create_key()] + load_old_keys()
+    _F = MultiFernet([Fernet(k) for k in keys])
+    _AEAD, _AEAD_ALL = {}, []
+    for k in keys:
+        for alg_id, cls in _AEAD_CLASSES.items():
+            cipher = cls(derive_aead_key(k, alg_id))
+            _AEAD.setdefault((key_id(k), alg_id), cipher)   # Ante un choque de id, la más nueva
+            _AEAD_ALL.append((alg_id, cipher))
+    _PRIMARY_KID = key_id(keys[0])
+
+
+_reload_keys()
+
+
+def _aead_id():
+    return _AEAD_IDS[AEAD_ALGORITHM]
+
+
+def _seal(alg_id: int, plain: bytes, aad: bytes) -> bytes:
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + _AEAD[(_PRIMARY_KID, alg_id)].encrypt(nonce, plain, aad)
+
+
+def _open(alg_id: int, kid: int, blob: bytes, aad: bytes) -> bytes:
+    if alg_id not in _AEAD_CLASSES:
+        raise ValueError(f"Algoritmo de cifrado desconocido ({alg_id}).")
+    nonce, ct = blob[:_NONCE_SIZE], blob[_NONCE_SIZE:]
+    cipher = _AEAD.get((kid, alg_id))
+    if cipher is not None:
+        try:
+            return cipher.decrypt(nonce, ct, aad)
+        except InvalidTag:
+            pass    # Puede ser otra clave con el mismo id: se prueban las demás
+    for a, otro in _AEAD_ALL:
+        if a != alg_id or otro is cipher:
+            continue
+        try:
+            return otro.decrypt(nonce, ct, aad)
+        except InvalidTag:
+            continue
+    raise InvalidTag()
+
+
+def encrypt_envelope(raw_bytes: bytes) -> bytes:
+    """Cifra en el sobre binario AEAD con la clave principal."""
+    header = _ENV_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, _aead_id(), _PRIMARY_KID)
+    return header + _seal(_aead_id(), raw_bytes, header)
+
+
+def decrypt_envelope(data: bytes) -> bytes:
+    """Descifra un sobre binario AEAD."""
+    magic, version, alg_id, kid = _ENV_HEADER.unpack_from(data)
+    if magic != ENVELOPE_MAGIC or version > ENVELOPE_VERSION:
+        raise ValueError("Sobre cifrado no reconocido.")
+    return _open(alg_id, kid, data[_ENV_HEADER.size:], data[:_ENV_HEADER.size])
+
+
+def _encrypt_blob(raw_bytes: bytes) -> bytes:
+    if ENCRYPTION_FORMAT == "aead":
+        return encrypt_envelope(raw_bytes)
+    return _F.encrypt(raw_bytes)
+
+
+def _decrypt_blob(data: bytes) -> bytes:
+    """Descifra un sobre AEAD o un token Fernet antiguo, según el magic."""
+    if data[:4] == ENVELOPE_MAGIC:
+        return decrypt_envelope(data)
+    return _F.decrypt(data)
+
+# ======================= Compresión =======================
+#
+# Se comprime antes de cifrar. El contenido en claro comprimido lleva un
+# encabezado: magic b"PFGZ" | códec u8 | nivel u8. Si el contenido descifrado
+# no empieza con el magic, se trata como archivo antiguo sin comprimir.
+
+COMPRESS_MAGIC = b"PFGZ"
+_COMP_HEADER = struct.Struct("<4sBB")
+
+# Códec por defecto para escrituras nuevas ("zlib", "lzma" o None) y su nivel
+COMPRESSION = "zlib"
+COMPRESSION_LEVEL = 6
+
+_CODECS_BY_NAME = {}
+_CODECS_BY_ID = {}
+
+
+def register_codec(name, codec_id, compress, decompress):
+    """
+    Registra un códec de compresión.
+    compress(data, level) / decompress(data) trabajan sobre bloques completos.
+    """
+    codec = {"name": name, "id": codec_id, "compress": compress, "decompress": decompress}
+    _CODECS_BY_NAME[name] = codec
+    _CODECS_BY_ID[codec_id] = codec
+
+
+register_codec("zlib", 1,
+               lambda data, level: zlib.compress(data, level),
+               zlib.decompress)
+register_codec("lzma", 2,
+               lambda data, level: lzma.compress(data, preset=level),
+               lzma.decompress)
+
+
+def _resolve_codec(compression):
+    """None -> códec por defecto; "none"/False -> sin compresión."""
+    if compression is None:
+        compression = COMPRESSION
+    if not compression or compression == "none":
+        return None
+    if compression not in _CODECS_BY_NAME:
+        raise ValueError(f"Códec de compresión desconocido: {compression}")
+    return _CODECS_BY_NAME[compression]
+
+
+def compress_payload(raw_bytes: bytes, compression=None, level=None) -> bytes:
+    """Comprime y antepone el encabezado; sin códec devuelve los datos tal cual."""
+    codec = _resolve_codec(compression)
+    if codec is None:
+        return raw_bytes
+    level = COMPRESSION_LEVEL if level is None else level
+    return _COMP_HEADER.pack(COMPRESS_MAGIC, codec["id"], level) + codec["compress"](raw_bytes, level)
+
+
+def decompress_payload(data: bytes) -> bytes:
+    """Descomprime si lleva encabezado PFGZ; si no, devuelve los datos tal cual."""
+    if data[:4] != COMPRESS_MAGIC:
+        return data
+    _, codec_id, _ = _COMP_HEADER.unpack_from(data)
+    if codec_id not in _CODECS_BY_ID:
+        raise ValueError(f"Archivo comprimido con códec no registrado ({codec_id}).")
+    return _CODECS_BY_ID[codec_id]["decompress"](data[_COMP_HEADER.size:])
+
 
 # ======================= Lectura y escritura cifrada =======================
 
-def write_encrypted(path: str, raw_bytes: bytes):
-    """Escribe datos cifrados."""
+def write_encrypted(path: str, raw_bytes: bytes, compression=None) -> bytes:
+    """
+    Escribe datos cifrados (comprimidos antes con 'compression', por defecto
+    COMPRESSION). Devuelve el token escrito en disco.
+    Se escribe a un temporal y se reemplaza, para no dejar el archivo a medias.
+    """
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "wb") as f:
-        f.write(_F.encrypt(raw_bytes))
+    token = _encrypt_blob(compress_payload(raw_bytes, compression))
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(token)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return token
 
 def read_encrypted(path: str) -> bytes:
-    """Lee y descifra un archivo."""
+    """
+    Lee y descifra un archivo (sobre AEAD, token Fernet antiguo o contenedor
+    por segmentos), descomprimiéndolo si fue escrito con compresión.
+    """
     with open(path, "rb") as f:
-        return _F.decrypt(f.read())
+        if f.read(4) == SEGMENT_MAGIC:
+            f.seek(0)
+            return decompress_payload(b"".join(SegmentedReader(f).iter_segments()))
+        f.seek(0)
+        return decompress_payload(_decrypt_blob(f.read()))
+
+def encrypt_bytes(raw_bytes: bytes) -> bytes:
+    """
+    Cifra datos en memoria (p. ej. campos individuales). Devuelve un token
+    Fernet: es texto base64 sin saltos de línea, apto para la bitácora.
+    """
+    return _F.encrypt(raw_bytes)
+
+def decrypt_bytes(token: bytes) -> bytes:
+    """Descifra un token ya leído de disco (Fernet o sobre AEAD)."""
+    return _decrypt_blob(token)
+
+
+# ======================= Cifrado por segmentos =======================
+#
+# Contenedor para archivos grandes (sesiones largas):
+#
+#   encabezado: magic b"PFGE" | versión u8 | algoritmo u8 | id de clave u16
+#               | tamaño de segmento u32 | id de archivo (16 bytes aleatorios)
+#   registros:  longitud u32 | segmento cifrado
+#
+# Versión 1: cada segmento es un token Fernet (solo lectura).
+# Versión 2: cada segmento es nonce + cifrado AEAD + tag, con el encabezado
+#            del contenedor como datos asociados.
+# Versión 3: como la 2, pero el contenido de cada segmento va comprimido por
+#            separado (con su propio encabezado PFGZ), de modo que el segmento
+#            N se descomprime sin leer los anteriores.
+# Cada segmento cifra (id de archivo, índice u64, es_último u8) + datos,
+# así que cada segmento se verifica por separado y no se puede reordenar,
+# mezclar con otro archivo ni truncar el final sin que se detecte.
+# Todos los segmentos salvo el último tienen exactamente SEGMENT_SIZE bytes en
+# claro. Sin compresión el segmento N está en una posición calculable; con
+# compresión los registros varían de largo y se ubican siguiendo las
+# longitudes (sin descifrar los anteriores).
+
+SEGMENT_MAGIC = b"PFGE"
+SEGMENT_VERSION = 2
+SEGMENT_VERSION_COMPRESSED = 3
+SEGMENT_SIZE = 64 * 1024
+
+_SEG_HEADER = struct.Struct("<4sBBHI16s")
+_SEG_INNER = struct.Struct("<16sQB")
+_SEG_LEN = struct.Struct("<I")
+
+
+def _fernet_token_len(n_plain: int) -> int:
+    raw = 1 + 8 + 16 + (n_plain // 16 + 1) * 16 + 32
+    return 4 * ((raw + 2) // 3)
+
+
+def _segment_record_len(version: int, n_plain: int) -> int:
+    if version == 1:
+        return _SEG_LEN.size + _fernet_token_len(n_plain)
+    return _SEG_LEN.size + _NONCE_SIZE + n_plain + _TAG_SIZE
+
+
+class SegmentedWriter:
+    """
+    Escritor tipo archivo: acumula hasta SEGMENT_SIZE bytes, cifra el segmento
+    (comprimido por separado si hay códec) y lo escribe. La memoria usada
+    queda acotada a un segmento.
+    Con una ruta, escribe a un temporal y lo reemplaza al cerrar.
+    """
+
+    def __init__(self, target, segment_size: int = SEGMENT_SIZE, compression=None):
+        self.segment_size = segment_size
+        self.file_id = os.urandom(16)
+        self.index = 0
+        self._buf = bytearray()
+        self._path = None
+        if isinstance(target, (str, os.PathLike)):
+            self._path = os.fspath(target)
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._f = open(self._path + ".tmp", "wb")
+        else:
+            self._f = target
+        # El formato Fernet (versión 1) se conserva solo por compatibilidad y
+        # no lleva compresión
+        self._codec = None
+        if ENCRYPTION_FORMAT == "aead":
+            self._codec = _resolve_codec(compression)
+            self.version = SEGMENT_VERSION_COMPRESSED if self._codec else SEGMENT_VERSION
+            self.alg_id = _aead_id()
+        else:
+            self.version, self.alg_id = 1, 0
+        kid = _PRIMARY_KID if self.version > 1 else 0
+        self._header = _SEG_HEADER.pack(SEGMENT_MAGIC, self.version, self.alg_id, kid,
+                                        segment_size, self.file_id)
+        self._f.write(self._header)
+        self.closed = False
+
+    def _emit(self, data, last):
+        if self._codec is not None:
+            data = compress_payload(bytes(data), self._codec["name"])
+        inner = _SEG_INNER.pack(self.file_id, self.index, 1 if last else 0) + bytes(data)
+        if self.version == 1:
+            token = _F.encrypt(inner)
+        else:
+            token = _seal(self.alg_id, inner, self._header)
+        self._f.write(_SEG_LEN.pack(len(token)))
+        self._f.write(token)
+        self.index += 1
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._flush_full()
+        return len(data)
+
+    def _flush_full(self):
+        size = self.segment_size
+        # Se conserva al menos un byte pendiente para que el último segmento
+        # siempre se emita en close() con la marca de final.
+        while len(self._buf) > size:
+            self._emit(self._buf[:size], last=False)
+            del self._buf[:size]
+
+    def close(self):
+        if self.closed:
+            return
+        self._emit(self._buf, last=True)
+        self._buf = bytearray()
+        self.closed = True
+        if self._path:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+            os.replace(self._path + ".tmp", self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._path:
+            self._f.close()
+            os.remove(self._path + ".tmp")
+
+
+class SegmentedReader:
+    """
+    Lector del contenedor por segmentos: acceso aleatorio al segmento N,
+    generador de segmentos y lectura secuencial tipo archivo (read(n)).
+    Devuelve el contenido en claro (descomprimido en la versión 3).
+    """
+
+    def __init__(self, source):
+        self._own = isinstance(source, (str, os.PathLike))
+        self._f = open(source, "rb") if self._own else source
+        self._start = self._f.tell()
+        hdr = self._f.read(_SEG_HEADER.size)
+        if len(hdr) < _SEG_HEADER.size:
+            raise ValueError("Contenedor cifrado incompleto.")
+        magic, self.version, self.alg_id, self.kid, self.segment_size, self.file_id = _SEG_HEADER.unpack(hdr)
+        if magic != SEGMENT_MAGIC or not 1 <= self.version <= SEGMENT_VERSION_COMPRESSED:
+            raise ValueError("Formato de contenedor cifrado no reconocido.")
+        self._header = hdr
+        self.compressed = self.version == SEGMENT_VERSION_COMPRESSED
+        self._f.seek(0, os.SEEK_END)
+        self._end = self._f.tell()
+        body = self._end - self._start - _SEG_HEADER.size
+        if self.compressed:
+            self._offsets = [self._start + _SEG_HEADER.size]   # posición de cada registro
+            self._count = None
+        else:
+            self._record = _segment_record_len(self.version, _SEG_INNER.size + self.segment_size)
+            self._count = max(1, -(-body // self._record))
+        self._pending = b""
+        self._next = 0
+
+    @property
+    def segment_count(self) -> int:
+        if self._count is None:
+            # Con compresión hay que recorrer las longitudes hasta el final
+            while self._offsets[-1] < self._end:
+                self._offset(len(self._offsets))
+            self._count = max(1, len(self._offsets) - 1)
+        return self._count
+
+    def _offset(self, n):
+        """Posición del registro N (versión 3: sigue las longitudes de los anteriores)."""
+        if not self.compressed:
+            return self._start + _SEG_HEADER.size + n * self._record
+        while len(self._offsets) <= n:
+            pos = self._offsets[-1]
+            self._f.seek(pos)
+            raw_len = self._f.read(_SEG_LEN.size)
+            if len(raw_len) < _SEG_LEN.size:
+                raise ValueError(f"Segmento {len(self._offsets) - 1} ausente.")
+            self._offsets.append(pos + _SEG_LEN.size + _SEG_LEN.unpack(raw_len)[0])
+        return self._offsets[n]
+
+    def _read_record(self, n):
+        self._f.seek(self._offset(n))
+        raw_len = self._f.read(_SEG_LEN.size)
+        if len(raw_len) < _SEG_LEN.size:
+            raise ValueError(f"Segmento {n} ausente.")
+        (length,) = _SEG_LEN.unpack(raw_len)
+        token = self._f.read(length)
+        if self.version == 1:
+            inner = _F.decrypt(token)
+        else:
+            inner = _open(self.alg_id, self.kid, token, self._header)
+        file_id, index, last = _SEG_INNER.unpack_from(inner)
+        if file_id != self.file_id or index != n:
+            raise ValueError(f"Segmento {n} no corresponde a este archivo.")
+        data = inner[_SEG_INNER.size:]
+        if self.compressed:
+            data = decompress_payload(data)
+        return data, bool(last)
+
+    def read_segment(self, n: int) -> bytes:
+        """Descifra y verifica solo el segmento N."""
+        if n < 0 or (self._count is not None and n >= self._count):
+            raise IndexError(n)
+        try:
+            return self._read_record(n)[0]
+        except ValueError:
+            if n >= self.segment_count:
+                raise IndexError(n) from None
+            raise
+
+    def _check_last(self, n, last):
+        if last != (n == self.segment_count - 1):
+            raise ValueError("Contenedor cifrado truncado o alterado.")
+
+    def iter_segments(self, start: int = 0):
+        """Generador de segmentos descifrados; verifica que el archivo no esté truncado."""
+        n = start
+        while True:
+            data, last = self._read_record(n)
+            if last or self._count is not None:
+                self._check_last(n, last)
+            yield data
+            if last:
+                return
+            n += 1
+
+    def read(self, size: int = -1) -> bytes:
+        """Lectura secuencial: descifra solo los segmentos necesarios."""
+        parts = [self._pending]
+        have = len(self._pending)
+        while (size < 0 or have < size) and self._next is not None:
+            data, last = self._read_record(self._next)
+            if last or self._count is not None:
+                self._check_last(self._next, last)
+            self._next = None if last else self._next + 1
+            parts.append(data)
+            have += len(data)
+        buf = b"".join(parts)
+        if size < 0:
+            self._pending = b""
+            return buf
+        self._pending = buf[size:]
+        return buf[:size]
+
+    def close(self):
+        if self._own:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_encrypted_stream(path: str, chunks, segment_size: int = SEGMENT_SIZE, compression=None):
+    """Cifra por segmentos (comprimiendo cada uno) el contenido de un iterable de bytes."""
+    with SegmentedWriter(path, segment_size, compression) as w:
+        for chunk in chunks:
+            w.write(chunk)
+
+
+def iter_encrypted_segments(path: str):
+    """Generador de bytes descifrados y descomprimidos, por bloques (memoria acotada)."""
+    with open(path, "rb") as f:
+        if f.read(4) != SEGMENT_MAGIC:
+            f.seek(0)
+            yield decompress_payload(_decrypt_blob(f.read()))
+            return
+        f.seek(0)
+        yield from SegmentedReader(f).iter_segments()
+
+
+def read_encrypted_prefix(path: str, n: int) -> bytes:
+    """
+    Devuelve los primeros n bytes descifrados (o todo si n < 0 o es más corto).
+    En el contenedor por segmentos solo se descifran (y descomprimen) los
+    segmentos necesarios; en archivos de un solo bloque se descifra todo.
+    """
+    parts, have = [], 0
+    for chunk in iter_encrypted_segments(path):
+        parts.append(chunk)
+        have += len(chunk)
+        if 0 <= n <= have:
+            break
+    data = b"".join(parts)
+    return data if n < 0 else data[:n]
+
+
+# ======================= Rotación y recifrado masivo =======================
+
+REENCRYPT_WORKERS = None        # None = os.cpu_count()
+REENCRYPT_CHUNK = 16            # archivos por tarea
+
+# Subcarpetas de 'Datos locales' que no contienen datos cifrados (p. ej.
+# cachés); cada módulo registra las suyas con exclude_from_reencrypt(). La
+# caché de imágenes (Recursos.ASSET_CACHE_DIR) va incluida para que la omita
+# también un proceso que recifre sin haber importado Recursos.
+_EXCLUDED_DIRS = {"cache_imagenes"}
+
+
+def exclude_from_reencrypt(nombre: str):
+    """Omite la subcarpeta 'nombre' de 'Datos locales' al recorrerla para recifrar."""
+    _EXCLUDED_DIRS.add(nombre)
+
+
+def checkpoint_path():
+    """Archivo de progreso del recifrado (permite reanudarlo)."""
+    return os.path.join(ensure_dirs(), "recifrado.checkpoint")
+
+
+def reencrypt_pending() -> bool:
+    """Indica si hay un recifrado iniciado y no terminado."""
+    return os.path.exists(checkpoint_path())
+
+
+def rotate_key():
+    """
+    Genera una clave principal nueva. La anterior pasa a claves_anteriores.key
+    (solo descifrado) y se deja registrado un recifrado pendiente.
+    Devuelve la clave nueva.
+    """
+    actual = load_or_create_key()
+    nueva = Fernet.generate_key()
+    _write_key_file(old_keys_path(), [actual] + load_old_keys())
+    _write_key_file(key_path(), [nueva])
+    with open(checkpoint_path(), "w", encoding="utf-8") as f:
+        f.write(f"{key_id(nueva)}\n")
+    _reload_keys()
+    print(f"[Cifrado] Clave rotada (id {key_id(nueva)}). Recifrado pendiente.")
+    return nueva
+
+
+def _needs_reencrypt(path: str) -> bool:
+    with open(path, "rb") as f:
+        head = f.read(_SEG_HEADER.size)
+    if head[:4] == ENVELOPE_MAGIC:
+        _, _, alg_id, kid = _ENV_HEADER.unpack_from(head)
+        return alg_id != _aead_id() or kid != _PRIMARY_KID
+    if head[:4] == SEGMENT_MAGIC:
+        _, version, alg_id, kid, _, _ = _SEG_HEADER.unpack_from(head)
+        return version == 1 or alg_id != _aead_id() or kid != _PRIMARY_KID
+    return head[:1] == b"g"  # token Fernet (base64 de 0x80)
+
+
+def reencrypt_file(path: str):
+    """Reescribe un archivo cifrado con la clave, formato y algoritmo actuales."""
+    with open(path, "rb") as f:
+        segmentado = f.read(4) == SEGMENT_MAGIC
+    if segmentado:
+        # El generador termina (y cierra el original) antes de reemplazarlo
+        write_encrypted_stream(path, iter_encrypted_segments(path))
+    else:
+        write_encrypted(path, read_encrypted(path))
+
+
+def _reencrypt_chunk(paths):
+    """
+    Tarea de proceso: devuelve (ruta, bytes procesados, error) por archivo.
+    Un error que empieza con "!" es permanente (el archivo no se puede descifrar).
+    """
+    out = []
+    for path in paths:
+        try:
+            if _needs_reencrypt(path):
+                size = os.path.getsize(path)
+                reencrypt_file(path)
+                out.append((path, size, None))
+            else:
+                out.append((path, 0, None))
+        except OSError as e:
+            out.append((path, 0, f"{e} (se reintentará)"))
+        except Exception as e:
+            # No se puede descifrar (clave desconocida, archivo dañado o no cifrado):
+            # reintentarlo no cambia nada
+            out.append((path, 0, f"!{str(e) or type(e).__name__}"))
+    return out
+
+
+def _list_encrypted_files(base):
+    for root, dirs, files in os.walk(base):
+        if root == base:
+            dirs[:] = [d for d in dirs if d not in _EXCLUDED_DIRS]
+        for fname in files:
+            if fname.endswith((".key", ".tmp", ".journal", ".checkpoint",
+                               ".db", ".db-wal", ".db-shm", ".db-journal")):
+                continue
+            yield os.path.join(root, fname)
+
+
+def reencrypt_local_data(base: str = None, workers: int = None):
+    """
+    Recorre 'Datos locales' y reescribe con la clave principal y el sobre AEAD
+    todo archivo que no esté ya así, repartiendo el trabajo en procesos.
+    Cada lote terminado se anota en recifrado.checkpoint, de modo que si se
+    interrumpe, la siguiente llamada continúa donde quedó. Los archivos que no
+    se pueden descifrar se anotan con "!" y se informan, pero no impiden
+    terminar: el checkpoint se borra cuando no quedan errores reintentables
+    (p. ej. un archivo bloqueado por otro proceso). Omite las claves, la base
+    SQLite y la bitácora (ver Usuarios.reencrypt_user_store).
+    Devuelve estadísticas con el rendimiento medido.
+    """
+    base = base or ensure_dirs()
+    ckpt = checkpoint_path()
+    hechos_previos = set()
+    ilegibles = []
+    lineas = []
+    if os.path.exists(ckpt):
+        with open(ckpt, "r", encoding="utf-8") as f:
+            lineas = f.read().splitlines()
+    if lineas and lineas[0] == str(_PRIMARY_KID):
+        hechos_previos = {l[1:] if l.startswith("!") else l for l in lineas[1:]}
+        ilegibles = [l[1:] for l in lineas[1:] if l.startswith("!")]
+    else:
+        # Sin progreso previo (o de otra clave): empezar de cero
+        with open(ckpt, "w", encoding="utf-8") as f:
+            f.write(f"{_PRIMARY_KID}\n")
+
+    paths = [p for p in _list_encrypted_files(base)
+             if os.path.relpath(p, base) not in hechos_previos]
+    workers = workers or REENCRYPT_WORKERS or os.cpu_count() or 1
+    chunks = [paths[i:i + REENCRYPT_CHUNK] for i in range(0, len(paths), REENCRYPT_CHUNK)]
+
+    stats = {"archivos": 0, "reescritos": 0, "bytes": 0, "errores": 0,
+             "reanudado": len(hechos_previos)}
+    t0 = time.perf_counter()
+
+    def registrar(resultados, log):
+        for path, size, error in resultados:
+            stats["archivos"] += 1
+            rel = os.path.relpath(path, base)
+            if error and error.startswith("!"):
+                ilegibles.append(rel)
+                print(f"[Cifrado] {path} no se puede descifrar, se omite: {error[1:]}")
+                log.write(f"!{rel}\n")
+                continue
+            if error:
+                stats["errores"] += 1
+                print(f"[Cifrado] No se pudo recifrar {path}: {error}")
+                continue
+            if size:
+                stats["reescritos"] += 1
+                stats["bytes"] += size
+            log.write(rel + "\n")
+        log.flush()
+        os.fsync(log.fileno())
+
+    with open(ckpt, "a", encoding="utf-8") as log:
+        if workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                registrar(_reencrypt_chunk(chunk), log)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                for fut in as_completed([ex.submit(_reencrypt_chunk, c) for c in chunks]):
+                    registrar(fut.result(), log)
+
+    dt = time.perf_counter() - t0
+    stats["segundos"] = round(dt, 3)
+    stats["mb_s"] = round(stats["bytes"] / 1e6 / dt, 2) if dt > 0 else 0.0
+    stats["archivos_s"] = round(stats["archivos"] / dt, 1) if dt > 0 else 0.0
+    stats["ilegibles"] = ilegibles
+    if stats["errores"] == 0:
+        os.remove(ckpt)
+    print(f"[Cifrado] Recifrado: {stats['reescritos']}/{stats['archivos']} archivos, "
+          f"{stats['bytes'] / 1e6:.1f} MB en {dt:.2f} s ({stats['mb_s']} MB/s, "
+          f"{stats['archivos_s']} archivos/s), {stats['errores']} errores, "
+          f"{len(ilegibles)} ilegibles.")
+    return stats
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_compression(repeticiones=5):
+    """Mide tamaño y velocidad de escritura/lectura cifrada con cada códec."""
+    import json
+    import random
+    import tempfile
+    import shutil
+
+    usuarios = {f"P{i:04d}": {"password": "x" * 8, "tipo": "paciente", "nombre": f"Paciente {i}",
+                              "id": str(100000000 + i), "fecha_registro": "2025-01-01",
+                              "terapeuta": "Terapeuta",
+                              "planes": [{"id": j, "modo": "Activo", "pierna": "Derecha",
+                                          "tipo": "Extensión", "resorte": "1", "angulo_min": 0.0,
+                                          "angulo_max": 90.0, "repeticiones": 10} for j in range(5)]}
+                for i in range(300)}
+    sesion = {"usuario": "P0001", "fecha": "2025-01-01 00:00:00",
+              "mediciones": [(round(i * 0.1, 3), round(random.uniform(0, 90), 2),
+                              round(random.uniform(0, 20), 3)) for i in range(6000)]}
+    cargas = {
+        "usuarios.json": json.dumps(usuarios, indent=2, ensure_ascii=False).encode("utf-8"),
+        "sesion JSON": json.dumps(sesion, indent=2).encode("utf-8"),
+    }
+    try:
+        from Sesiones import encode_session
+        cargas["sesion binaria"] = encode_session({"usuario": "P0001"}, sesion["mediciones"], fmt="binary")
+    except ImportError:
+        pass
+
+    tmp = tempfile.mkdtemp(prefix="pfg_bench_")
+    try:
+        path = os.path.join(tmp, "x.enc")
+        for nombre, raw in cargas.items():
+            print(f"[Bench] {nombre}: {len(raw)} bytes en claro")
+            for comp in ("none", "zlib", "lzma"):
+                t0 = time.perf_counter()
+                for _ in range(repeticiones):
+                    write_encrypted(path, raw, compression=comp)
+                tw = (time.perf_counter() - t0) / repeticiones
+                t0 = time.perf_counter()
+                for _ in range(repeticiones):
+                    assert read_encrypted(path) == raw
+                tr = (time.perf_counter() - t0) / repeticiones
+                size = os.path.getsize(path)
+                mb = len(raw) / 1e6
+                print(f"[Bench]   {comp:5s} disco={size:9d} B  ratio={len(raw) / size:5.2f}  "
+                      f"escritura={mb / tw:6.1f} MB/s  lectura={mb / tr:6.1f} MB/s")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def benchmark_envelope(repeticiones=20):
+    """Compara tamaño y velocidad del token Fernet con el sobre AEAD."""
+    global AEAD_ALGORITHM
+
+    original = AEAD_ALGORITHM
+    try:
+        for size in (1024, 64 * 1024, 1024 * 1024):
+            raw = os.urandom(size)
+            print(f"[Bench] bloque de {size} bytes")
+            variantes = [("fernet", _F.encrypt, _F.decrypt)]
+            for alg in ("aesgcm", "chacha20"):
+                variantes.append((alg, encrypt_envelope, decrypt_envelope))
+            for nombre, enc, dec in variantes:
+                if nombre != "fernet":
+                    AEAD_ALGORITHM = nombre
+                t0 = time.perf_counter()
+                for _ in range(repeticiones):
+                    blob = enc(raw)
+                te = (time.perf_counter() - t0) / repeticiones
+                t0 = time.perf_counter()
+                for _ in range(repeticiones):
+                    dec(blob)
+                td = (time.perf_counter() - t0) / repeticiones
+                mb = size / 1e6
+                print(f"[Bench]   {nombre:8s} tamaño={len(blob):8d} B (+{100 * (len(blob) / size - 1):5.1f}%)  "
+                      f"cifrado={mb / te:7.1f} MB/s  descifrado={mb / td:7.1f} MB/s")
+    finally:
+        AEAD_ALGORITHM = original
+
+
+if __name__ == "__main__":
+    benchmark_compression()
+    benchmark_envelope()
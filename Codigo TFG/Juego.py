@@ -1,16 +1,103 @@
 import os
-import json
 import random
 import time
-import threading
 from datetime import datetime
 import uuid
 import tkinter as tk
-from PIL import Image, ImageTk
 
-from Conexion_Teensy import conectar_teensy, leer_teensy_linea, configurar_teensy
-from Encriptacion import ensure_dirs, write_encrypted
+from Conexion_Teensy import (conectar_teensy, configurar_teensy, configurar_salida, TeensyReader,
+                             CaptureWriter, CAPTURE_EXT, reconectar_teensy, connection_metrics)
+from Encriptacion import ensure_dirs, write_encrypted_stream
+from Usuarios import record_session
+from Sesiones import iter_encode_session, session_extension
+from Bucle import FixedTimestep, FrameProfiler
+from Motor import GameEngine, Renderer
+from Recursos import asset_manager
+
+# Guardar una captura cruda del puerto serie por sesión (para reproducirla
+# luego con Repeticiones.replay_capture); queda cifrada en "Datos locales/capturas"
+CAPTURE_RAW = False
+
+# Recibir lecturas crudas del ADC y calcular ángulo/fuerza en el host con el
+# perfil de calibración del equipo (ver Calibracion.py; requiere NumPy)
+HOST_CALIBRATION = False
+
+# Filtrar el ángulo (picos + paso bajo, ver Filtros.py) antes de mover la nave
+# y contar repeticiones; la sesión guarda además el ángulo filtrado y la velocidad.
+# Las ventanas se ajustan a la frecuencia medida del equipo (a 10 Hz el filtro
+# casi no actúa). Requiere NumPy (igual que HOST_CALIBRATION); con False el
+# juego no lo importa
+SIGNAL_FILTERS = True
+
+# Bucle del juego: la simulación avanza en pasos fijos de 1/SIM_HZ (las
+# velocidades están en px por paso) y se dibuja cada 1/RENDER_HZ interpolando
+SIM_HZ = 60
+RENDER_HZ = 60
+MAX_PASOS_POR_CUADRO = 5    # Tras un bloqueo largo el juego no "salta" más de esto
+
+# Overlay con el perfil de cuadros (FPS, percentiles del tick, bloqueos)
+DEBUG_OVERLAY = False
+
+
+class TkRenderer(Renderer):
+    """
+    Dibuja el estado de Motor.GameEngine en el canvas del juego. Los ítems de
+    asteroides y balas salen de pools creados de antemano: borrar() solo
+    oculta el ítem y el próximo crear_*() del mismo tipo lo reutiliza.
+    """
+
+    POOL_ASTEROIDES = 8   # Por tipo de asteroide
+    POOL_BALAS = 32
+
+    def __init__(self, canvas, nave_id, img_ast, img_bala, lbl_score):
+        self.canvas = canvas
+        self.nave_id = nave_id
+        self.img_ast = img_ast
+        self.img_bala = img_bala
+        self.lbl_score = lbl_score
+        self.creados = 0
+        self.reutilizados = 0
+        self._pool_de = {}   # ítem en uso → lista de libres a la que vuelve
+        self._libres_ast = [[self._nuevo(img) for _ in range(self.POOL_ASTEROIDES)]
+                            for img in img_ast]
+        self._libres_bala = [self._nuevo(img_bala) for _ in range(self.POOL_BALAS)]
+
+    def _nuevo(self, img, x=-100, y=-100, state="hidden"):
+        self.creados += 1
+        return self.canvas.create_image(x, y, image=img, state=state)
+
+    def _sacar(self, libres, img, x, y):
+        if libres:
+            h = libres.pop()
+            self.canvas.coords(h, x, y)
+            self.canvas.itemconfigure(h, state="normal")
+            self.reutilizados += 1
+        else:
+            h = self._nuevo(img, x, y, "normal")
+        self._pool_de[h] = libres
+        return h
+
+    def crear_asteroide(self, x, y, tipo):
+        return self._sacar(self._libres_ast[tipo], self.img_ast[tipo], x, y)
+
+    def crear_bala(self, x, y):
+        return self._sacar(self._libres_bala, self.img_bala, x, y)
+
+    def mover(self, handle, x, y):
+        self.canvas.coords(handle, x, y)
+
+    def borrar(self, handle):
+        self.canvas.itemconfigure(handle, state="hidden")
+        self._pool_de.pop(handle).append(handle)
 
+    def mover_nave(self, x, y):
+        self.canvas.coords(self.nave_id, x, y)
+
+    def puntaje(self, score):
+        self.lbl_score.config(text=f"Score: {score}")
+
+    def stats(self) -> dict:
+        return {"items_creados": self.creados, "items_reutilizados": self.reutilizados}
 
 
 class KneeRehabilitationGame:
@@ -20,8 +107,12 @@ class KneeRehabilitationGame:
     No realiza subidas a Adafruit IO (eso se maneja fuera del juego).
     """
 
-    def __init__(self, parent, plan_config: dict, usuario_actual: str, on_finish_callback=None):
+    def __init__(self, parent, plan_config: dict, usuario_actual: str, on_finish_callback=None,
+                 equipo=None):
+        # 'equipo': Dispositivos.Equipo ya reservado para esta sesión; si es None
+        # se usa la conexión única de Conexion_Teensy
         self.parent = parent
+        self.equipo = equipo
         self.plan = dict(plan_config)
         self.usuario = usuario_actual
         self.on_finish_callback = on_finish_callback
@@ -33,51 +124,91 @@ class KneeRehabilitationGame:
         self.obj = int(self.plan.get("repeticiones", 10))
 
         # Estados
-        self.total = self.ok = self.parcial = self.bad = 0
-        self._phase = "waiting_min"
-        self._max_reached = False
-        self._peak = 0.0
+        self.filtros = None
+        self._histeresis = 0.0
+        if SIGNAL_FILTERS:
+            # Filtros usa NumPy: solo se importa con el filtrado activo
+            from Filtros import DEFAULT_FILTERS, make_pipeline
+            self.filtros = make_pipeline()
+            self._histeresis = DEFAULT_FILTERS["histeresis"]
         self.mediciones = []
         self.t0 = time.time()
+        self._t0_mono = time.monotonic()
+        self._dev_offset = None   # t_host - t_dev de la primera muestra
         self._running = True
         self._paused = False
         self._partial_end = False
 
         # Conexión al Teensy
-        self.ser = conectar_teensy()
+        resorte = self.plan.get("resorte", "0")
+        tipo = self.plan.get("tipo", "Extensión")
+        self._tipo_cmd = "E" if tipo.lower().startswith("ext") else "F"
+        if self.equipo is not None:
+            self.ser = self.equipo.ser if self.equipo.conectar() else None
+        else:
+            self.ser = conectar_teensy()
+        self._config_ok = False
         if self.ser:
-            resorte = self.plan.get("resorte", "0")
-            tipo = self.plan.get("tipo", "Extensión")
-            tipo_cmd = "E" if tipo.lower().startswith("ext") else "F"
-            configurar_teensy(self.ser, resorte, tipo_cmd)
-            print(f"[Juego] Conectado y configurado: Resorte {resorte}, Tipo {tipo_cmd}")
+            self._config_ok = self._configure_teensy(self.ser)
+            if self._config_ok:
+                metrics = self.equipo.conexion if self.equipo else connection_metrics()
+                print(f"[Juego] Conectado y configurado: Resorte {resorte}, Tipo {self._tipo_cmd} "
+                      f"({metrics})")
+            else:
+                print("[Juego] El Teensy no confirmó la configuración del plan.")
         else:
             print("[Juego] No se detectó Teensy. Continuando sin datos en vivo.")
 
         # GUI
         self._build_gui()
         self._load_images()
-
-        # Elementos del juego
-        self.asteroides = []
-        self.balas = []
-        self.zonas = [1, 2, 3, 4, 3, 2, 1, 2]
-        self.zona_index = 0
-        self.max_asteroides = 4
-        self.velocidad_asteroides = 3.0
-        self.intervalo_generacion = 3
-        self.last_spawn = 0
+        if self.ser and not self._config_ok:
+            self._update_status_bar("El Teensy no confirmó la configuración del plan", "orange")
 
         # Contador de puntaje
-        self.score = 0
         self.lbl_score = tk.Label(self.parent, text="Score: 0", bg="#111", fg="#FFD700",
                                   font=("Arial", 14, "bold"))
         self.lbl_score.place(x=20, y=20)
 
-        # Hilo lector del Teensy
-        self._stop_reader = threading.Event()
-        self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
-        self.reader_thread.start()
+        # Estado del juego (asteroides, balas, puntaje, repeticiones); ver Motor.py
+        self.motor = GameEngine(self.ang_min, self.ang_max, self.obj, self.w, self.h,
+                                histeresis=self._histeresis,
+                                dt=1 / SIM_HZ,
+                                renderer=TkRenderer(self.canvas, self.nave_id, self.img_ast,
+                                                    self.img_bala, self.lbl_score))
+        self.reps = self.motor.reps
+
+        # Hilo lector del Teensy (vacía el puerto en bloque hacia un buffer
+        # circular); cada cuadro de _tick toma todo lo acumulado de una vez
+        self.capture = self._open_capture() if (self.ser and CAPTURE_RAW) else None
+        if self.equipo is not None:
+            # El lector es del equipo (sigue activo entre sesiones y se reconecta solo)
+            self.teensy_reader = self.equipo.reader if self.ser else None
+            if self.teensy_reader:
+                self.teensy_reader.set_capture(self.capture)
+        else:
+            self.teensy_reader = (TeensyReader(self.ser, binary=True, capture=self.capture,
+                                               reconnect=self._reconnect_teensy,
+                                               calibration=self._make_calibration()).start()
+                                  if self.ser else None)
+        self._reader_failed = False
+        if not self.teensy_reader:
+            self._update_status_bar("Sin conexión con Teensy", "orange")
+
+        # Métricas por cuadro: muestras en cola al drenar y tiempo de proceso
+        self._cuadros = 0
+        self._cola_total = 0
+        self._cola_max = 0
+        self._t_muestras = 0.0
+        self._t_muestras_max = 0.0
+
+        # Paso fijo + perfil de cuadros
+        self.reloj = FixedTimestep(1 / SIM_HZ, MAX_PASOS_POR_CUADRO)
+        self.perf = FrameProfiler(1 / RENDER_HZ)
+        self.overlay_id = (self.canvas.create_text(self.w - 10, 60, anchor="ne", fill="#00e676",
+                                                   font=("Consolas", 10), text="")
+                           if DEBUG_OVERLAY else None)
+        self._next_frame = time.perf_counter()
 
         # Bucle principal del juego (GUI)
         self._tick()
@@ -119,153 +250,172 @@ class KneeRehabilitationGame:
         def load_img(name, size):
             path = os.path.join("imagenes", name)
             try:
-                return ImageTk.PhotoImage(Image.open(path).resize(size, Image.LANCZOS))
+                # El juego se arma fuera del hilo de Tk: la PhotoImage se crea allí
+                return asset_manager().photo(path, size, master=self.parent)
             except Exception:
                 return None
 
-        self.nave_x, self.nave_y = 100, self.h // 2
+        nave_x, nave_y = 100, self.h // 2
         self.img_nave = load_img("Nave.png", (80, 80))
         self.img_bala = load_img("Disparo.png", (35, 35))
         self.img_ast = [load_img(f"Asteroide_{i}.png", (65, 65)) for i in range(3)]
-        self.nave_id = self.canvas.create_image(self.nave_x, self.nave_y, image=self.img_nave or None)
-
-    # =============== Lectura Teensy (en hilo) ===============
-    def _reader_loop(self):
-        ser = self.ser
-        if not ser:
-            self._update_status_bar("Sin conexión con Teensy", "orange")
+        self.nave_id = self.canvas.create_image(nave_x, nave_y, image=self.img_nave or None)
+
+    # =============== Lectura Teensy (una vez por cuadro) ===============
+    def _drain_samples(self):
+        """
+        Toma del buffer todo lo que llegó desde el cuadro anterior y lo procesa
+        junto, de modo que el costo por cuadro no depende de la frecuencia del
+        sensor (a 1 kHz son ~16 muestras por cuadro, no 16 callbacks de Tk).
+        """
+        reader = self.teensy_reader
+        if not reader:
             return
+        t_a = time.perf_counter()
+        batch = self.equipo.tomar(timeout=0) if self.equipo is not None else reader.ring.take()
+        if not batch:
+            if not reader.running and not self._reader_failed:
+                # El hilo lector terminó sin poder reconectar
+                self._reader_failed = True
+                self._update_status_bar("Error en lectura del Teensy", "red")
+            return
+        # En pausa se sigue vaciando el buffer, pero se descartan las muestras
+        if not self._paused:
+            self._on_samples(batch)
+        dt = time.perf_counter() - t_a
+        self._cuadros += 1
+        self._cola_total += len(batch)
+        self._cola_max = max(self._cola_max, len(batch))
+        self._t_muestras += dt
+        self._t_muestras_max = max(self._t_muestras_max, dt)
+
+    def frame_stats(self) -> dict:
+        """Muestras drenadas por cuadro y tiempo de proceso (cuadros con datos)."""
+        n = self._cuadros
+        return {"cuadros": n,
+                "cola_media": self._cola_total / n if n else 0.0,
+                "cola_max": self._cola_max,
+                "proceso_us_medio": self._t_muestras / n * 1e6 if n else 0.0,
+                "proceso_us_max": self._t_muestras_max * 1e6}
+
+    def _configure_teensy(self, ser):
+        salida = "C" if HOST_CALIBRATION else "B"
+        if self.equipo is not None:
+            # El equipo la guarda y la vuelve a aplicar si se reconecta
+            return self.equipo.configurar(self.plan.get("resorte", "0"), self._tipo_cmd, salida)
+        ok = configurar_teensy(ser, self.plan.get("resorte", "0"), self._tipo_cmd)
+        return configurar_salida(ser, salida) and ok
+
+    def _make_calibration(self):
+        if not HOST_CALIBRATION:
+            return None
+        from Calibracion import calibrador_para
+        numero_serie = connection_metrics().get("numero_serie")
+        cal = calibrador_para(numero_serie, self.plan.get("resorte", "0"), self._tipo_cmd)
+        print(f"[Juego] Calibración en el host: perfil '{cal.perfil['nombre']}' (equipo {numero_serie})")
+        return cal
+
+    def _reconnect_teensy(self):
+        # Lo llama el hilo lector tras perder el puerto (reintenta con espera exponencial)
+        if not self._running:
+            return None
+        self._update_status_bar("Reconectando con el Teensy...", "orange")
+        ser = reconectar_teensy(self._configure_teensy)
+        if ser:
+            self._update_status_bar("Teensy reconectado", "white")
+        return ser
+
+    def _open_capture(self):
+        cap_dir = os.path.join(ensure_dirs(), "capturas")
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(cap_dir, f"{self.usuario}_captura_{stamp}{CAPTURE_EXT}")
         try:
-            next_t = time.time()
-            while not self._stop_reader.is_set() and self._running:
-                if self._paused:
-                    time.sleep(0.1)
-                    continue
-                if time.time() < next_t:
-                    time.sleep(0.01)
-                    continue
-                next_t += 0.05  # 20 Hz
-                data = leer_teensy_linea(ser)
-                if not data:
-                    continue
-                ang, fuerza = data
-                self.parent.after(0, lambda a=ang, f=fuerza: self._on_sample(a, f))
-        except Exception as e:
-            print(f"[Juego] Error lector Teensy: {e}")
-            self._update_status_bar("Error en lectura del Teensy", "red")
+            return CaptureWriter(path, binary=True)
+        except OSError as e:
+            print(f"[Juego] No se pudo abrir la captura: {e}")
+            return None
+
+    def _stop_teensy_reader(self):
+        if self.equipo is not None:
+            # El equipo queda conectado y libre para la próxima sesión
+            if self.teensy_reader:
+                self.teensy_reader.set_capture(None)
+            print(f"[Juego] {self.equipo.nombre}: {self.equipo.salud()}")
+            self.equipo.liberar()
+        elif self.teensy_reader:
+            self.teensy_reader.stop()
+            print(f"[Juego] Lector Teensy: {self.teensy_reader.stats()}")
+        if self.capture:
+            self.capture.close()
+            print(f"[Juego] Captura guardada → {self.capture.path}")
+            self.capture = None
 
     # =============== Lógica principal ===============
-    def _on_sample(self, ang, fuerza):
-        if not self._running:
-            return
+    def _on_samples(self, batch):
+        """
+        Procesa un lote del buffer: [(t_host, t_dev, angulo, fuerza), ...].
+        Todas las muestras se guardan y pasan por el conteo de repeticiones
+        (con filtrado, el ángulo filtrado); la nave se mueve una sola vez,
+        a la última posición.
+        """
+        if self._dev_offset is None:
+            self._dev_offset = batch[0][0] - batch[0][1]
+        base = self._dev_offset - self._t0_mono
+        if self.filtros is not None:
+            # Todo el lote pasa junto por el pipeline
+            ang_f, vel = self.filtros.process([m[1] for m in batch], [m[2] for m in batch])
+            angs = ang_f.tolist()
+            vels = vel.tolist() if vel is not None else [0.0] * len(batch)
+        else:
+            angs = [m[2] for m in batch]
+
+        # Conteo y posición de la nave; lo posterior a la repetición que
+        # completa el objetivo se descarta
+        fin = self.motor.feed(angs)
+        if fin is not None:
+            batch = batch[:fin]
+
+        if self.filtros is not None:
+            self.mediciones.extend(
+                (round(t_dev + base, 3), ang, fuerza, round(a_f, 3), round(v, 2))
+                for (_, t_dev, ang, fuerza), a_f, v in zip(batch, angs, vels))
+        else:
+            self.mediciones.extend((round(t_dev + base, 3), ang, fuerza)
+                                   for _, t_dev, ang, fuerza in batch)
 
-        ang_min, ang_max = self.ang_min, self.ang_max
-        if ang_max <= ang_min:
-            ang_max = ang_min + 1
-
-        # Normalizar
-        p = min(1.0, max(0.0, (ang - ang_min) / (ang_max - ang_min)))
-        self.nave_y = int((1 - p) * self.h)
-        self.canvas.coords(self.nave_id, self.nave_x, self.nave_y)
-
-        t_rel = round(time.time() - self.t0, 3)
-        self.mediciones.append((t_rel, ang, fuerza))
-        self._auto_shoot_if_aligned()
-        self._update_rep_fsm(ang)
-
-    def _update_rep_fsm(self, ang):
-        p = (ang - self.ang_min) / (self.ang_max - self.ang_min)
-        p = max(0, min(1, p))
-        near_min, near_max = p <= 0.1, p >= 0.98
-        if self._phase == "waiting_min" and near_min:
-            self._phase, self._max_reached, self._peak = "going_up", False, p
-        elif self._phase == "going_up":
-            self._peak = max(self._peak, p)
-            if near_max:
-                self._max_reached = True
-            if near_min and self._peak > 0.1:
-                self.total += 1
-                if self._max_reached:
-                    self.ok += 1
-                elif self._peak >= 0.5:
-                    self.parcial += 1
-                else:
-                    self.bad += 1
-                if self.total >= self.obj:
-                    self._finish_now()
-                    return
-                self._phase = "waiting_min"
-
-    # =============== Asteroides y balas ===============
-    def _spawn_asteroid(self):
-        if len(self.asteroides) >= self.max_asteroides:
-            return
-        zona = self.zonas[self.zona_index]
-        self.zona_index = (self.zona_index + 1) % len(self.zonas)
-        seccion = self.h / 4
-        y = int((zona - 1) * seccion + seccion / 2 + random.randint(-40, 40))
-        img = random.choice(self.img_ast)
-        aid = self.canvas.create_image(self.w + 50, y, image=img)
-        self.asteroides.append({"id": aid, "x": self.w + 50, "y": y})
-
-    def _auto_shoot_if_aligned(self):
-        for a in self.asteroides:
-            if a["x"] > self.nave_x and abs(a["y"] - self.nave_y) <= 40:
-                self._spawn_bullet(self.nave_x + 40, self.nave_y)
-                break
-
-    def _spawn_bullet(self, x, y):
-        bid = self.canvas.create_image(x, y, image=self.img_bala)
-        self.balas.append({"id": bid, "x": x, "y": y})
-
-    def _move_asteroids(self):
-        for a in list(self.asteroides):
-            a["x"] -= self.velocidad_asteroides
-            self.canvas.coords(a["id"], a["x"], a["y"])
-            if a["x"] < -80:
-                self.canvas.delete(a["id"])
-                self.asteroides.remove(a)
-
-    def _move_bullets(self):
-        for b in list(self.balas):
-            b["x"] += 10
-            self.canvas.coords(b["id"], b["x"], b["y"])
-
-            for a in list(self.asteroides):
-                if abs(b["x"] - a["x"]) <= 50 and abs(b["y"] - a["y"]) <= 50:
-                    # === NUEVO: asignar puntos según el tipo de asteroide ===
-                    if a.get("img") in self.img_ast:
-                        idx = self.img_ast.index(a["img"])
-                        puntos = [1, 3, 5][idx] if 0 <= idx < 3 else 1
-                    else:
-                        puntos = 1
-
-                    self.score += puntos
-                    self.lbl_score.config(text=f"Score: {self.score}")
-
-                    # Eliminar elementos del canvas
-                    self.canvas.delete(a["id"])
-                    self.asteroides.remove(a)
-                    self.canvas.delete(b["id"])
-                    self.balas.remove(b)
-                    break
-
-            if b["x"] > self.w + 80:
-                self.canvas.delete(b["id"])
-                self.balas.remove(b)
+        if fin is not None:
+            self._finish_now()
 
     # =============== Bucle principal ===============
     def _tick(self):
         if not self._running:
             return
-        if not self._paused:
-            now = time.time()
-            if now - self.last_spawn >= self.intervalo_generacion:
-                self._spawn_asteroid()
-                self.last_spawn = now
-            self._move_asteroids()
-            self._move_bullets()
-        self.parent.after(16, self._tick)
+        now = time.perf_counter()
+        self.perf.begin_frame(now)
+        self._drain_samples()
+        if not self._running:
+            return
+        if self._paused:
+            self.reloj.reset(now)
+        else:
+            for _ in range(self.reloj.advance(now)):
+                self.motor.step()
+            self.motor.render(self.reloj.alpha)
+        if self.overlay_id is not None and self.perf.cuadros % 15 == 0:
+            self.canvas.itemconfig(self.overlay_id, text=self.perf.texto())
+        self.perf.end_frame()
+        self._schedule_tick()
+
+    def _schedule_tick(self):
+        # Cuadros sobre una grilla fija: el retraso de cada after() no se acumula
+        periodo = 1 / RENDER_HZ
+        self._next_frame += periodo
+        espera = self._next_frame - time.perf_counter()
+        if espera < -periodo:
+            # Atraso de más de un cuadro (ya contado como perdido): se reinicia la grilla
+            self._next_frame = time.perf_counter()
+            espera = 0.0
+        self.parent.after(max(1, int(espera * 1000)), self._tick)
 
     # =============== Finalización ===============
     def _toggle_pause(self):
@@ -274,7 +424,7 @@ class KneeRehabilitationGame:
 
     def _go_back(self):
         self._running = False
-        self._stop_reader.set()
+        self._stop_teensy_reader()
         for w in self.parent.winfo_children():
             w.destroy()
         if self.on_finish_callback:
@@ -288,20 +438,37 @@ class KneeRehabilitationGame:
         if not self._running:
             return
         self._running = False
-        self._stop_reader.set()
+        self._stop_teensy_reader()
+        rendimiento = dict(self.perf.resumen(), pasos_sim=self.reloj.pasos,
+                           pasos_descartados=self.reloj.descartados,
+                           muestras_por_cuadro=round(self.frame_stats()["cola_media"], 2),
+                           **self.motor.renderer.stats())
+        print(f"[Juego] Cuadros: {rendimiento}")
+        img = asset_manager().stats()
+        print(f"[Juego] Imágenes en caché: photo {img['photo']['tasa']:.0%}, memoria "
+              f"{img['memoria']['tasa']:.0%}, disco {img['disco']['tasa']:.0%} "
+              f"({img['escalados']} escaladas, {img['t_escalado_ms']} ms)")
+        st = self.frame_stats()
+        print(f"[Juego] Muestras por cuadro: media {st['cola_media']:.1f}, máx {st['cola_max']} | "
+              f"proceso {st['proceso_us_medio']:.0f} µs/cuadro (máx {st['proceso_us_max']:.0f} µs)")
+        if self.filtros is not None:
+            if self.filtros.frec_hz:
+                print(f"[Juego] Filtros ajustados a {self.filtros.frec_hz:.0f} Hz")
+            for nombre, st in self.filtros.stats().items():
+                print(f"[Juego] Filtro {nombre}: {st['us_por_muestra']:.2f} µs/muestra "
+                      f"(máx {st['max_us_lote']:.0f} µs/lote)")
 
         resumen = {
             "usuario": self.usuario,
             "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "plan_usado": self.plan.get("id"),
             "duracion_s": int(time.time() - self.t0),
-            "repeticiones": f"{self.total}/{self.obj}",
-            "correctas": self.ok,
-            "parciales": self.parcial,
-            "incorrectas": self.bad,
-            "estado": "Completada" if (self.total >= self.obj and not self._partial_end) else "Parcial",
-            "score": self.score,  # 🟩 NUEVO campo
-            "session_id": uuid.uuid4().hex[:8].upper()
+            **self.reps.resumen(),
+            "estado": "Completada" if (self.reps.completed and not self._partial_end) else "Parcial",
+            "score": self.motor.score,  # 🟩 NUEVO campo
+            "session_id": uuid.uuid4().hex[:8].upper(),
+            "rendimiento": rendimiento,
+            "juego": self.motor.stats(),
         }
 
         self._persist_local(resumen)
@@ -314,14 +481,15 @@ class KneeRehabilitationGame:
 
         session_id = uuid.uuid4().hex[:8].upper()
 
-        # Combinar resumen + mediciones en un solo dict
+        # Resumen como encabezado + mediciones en columnas (ver Sesiones.py)
         resumen_completo = dict(resumen)
         resumen_completo["session_id"] = session_id
-        resumen_completo["mediciones"] = self.mediciones
 
-        json_path = os.path.join(user_dir, f"{self.usuario}_sesion_{stamp}.json.enc")
-        write_encrypted(json_path, json.dumps(resumen_completo, ensure_ascii=False, indent=2).encode("utf-8"))
-        print(f"[Juego] Sesión guardada → {json_path}")
+        fname = f"{self.usuario}_sesion_{stamp}{session_extension()}"
+        ses_path = os.path.join(user_dir, fname)
+        write_encrypted_stream(ses_path, iter_encode_session(resumen_completo, self.mediciones))
+        record_session(self.usuario, fname, resumen_completo)
+        print(f"[Juego] Sesión guardada → {ses_path}")
 
         # (No subimos directamente aquí, se hará en la sincronización posterior)
         self._update_status_bar("Sesión guardada localmente", "orange")
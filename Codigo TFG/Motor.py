@@ -0,0 +1,466 @@
+import sys
+import time
+import random
+from bisect import bisect_right
+
+from Repeticiones import RepCounter
+
+# ======================= Motor del juego =======================
+#
+# Estado y reglas del juego sin Tkinter: asteroides, balas, colisiones,
+# puntaje y conteo de repeticiones. El dibujo pasa por un Renderer (en
+# Juego.py, TkRenderer sobre el canvas; aquí, NullRenderer para correr sin
+# pantalla), así el mismo motor se puede simular más rápido que el tiempo
+# real sobre sesiones grabadas para ajustar la dificultad.
+
+# Parámetros de dificultad (velocidades en px por paso de 1/60 s)
+DEFAULT_PARAMS = {
+    "velocidad_asteroides": 3.0,
+    "velocidad_balas": 10.0,
+    "intervalo_generacion_s": 3.0,
+    "max_asteroides": 4,
+    "zonas": (1, 2, 3, 4, 3, 2, 1, 2),   # Franja (1..4, de arriba abajo) de cada asteroide
+    "disparo_intervalo_s": 0.1,
+    "alineacion_px": 40,                 # Tolerancia vertical del disparo automático
+    "radio_impacto_px": 50,
+    "puntos": (1, 3, 5),                 # Por tipo de asteroide
+}
+
+# Con menos pares bala × asteroide que esto, comparar todos contra todos es
+# más barato que armar la grilla de colisiones
+GRILLA_MIN_PARES = 64
+
+
+class Renderer:
+    """
+    Interfaz de dibujo del motor. Los 'handle' son lo que devuelva crear_*
+    (p. ej. el id del ítem del canvas) y el motor solo los guarda.
+    """
+
+    def crear_asteroide(self, x, y, tipo):
+        raise NotImplementedError
+
+    def crear_bala(self, x, y):
+        raise NotImplementedError
+
+    def mover(self, handle, x, y):
+        raise NotImplementedError
+
+    def borrar(self, handle):
+        raise NotImplementedError
+
+    def mover_nave(self, x, y):
+        raise NotImplementedError
+
+    def puntaje(self, score):
+        raise NotImplementedError
+
+
+class NullRenderer(Renderer):
+    """No dibuja nada (simulación sin pantalla y pruebas)."""
+
+    def crear_asteroide(self, x, y, tipo):
+        return None
+
+    def crear_bala(self, x, y):
+        return None
+
+    def mover(self, handle, x, y):
+        pass
+
+    def borrar(self, handle):
+        pass
+
+    def mover_nave(self, x, y):
+        pass
+
+    def puntaje(self, score):
+        pass
+
+
+# ======================= Entidades =======================
+
+class Asteroide:
+    __slots__ = ("h", "x", "px", "y", "tipo", "i")   # i: posición en GameEngine.asteroides
+
+    def __init__(self, h, x, y, tipo, i):
+        self.h, self.x, self.px, self.y, self.tipo, self.i = h, x, x, y, tipo, i
+
+
+class Bala:
+    __slots__ = ("h", "x", "px", "y")
+
+    def __init__(self, h, x, y):
+        self.h, self.x, self.px, self.y = h, x, x, y
+
+
+def _swap_remove(lista, i):
+    """
+    Quita lista[i] en O(1) moviendo el último a su lugar (no conserva el
+    orden). Devuelve el elemento movido, o None si se quitó el último.
+    """
+    ultimo = lista.pop()
+    if i < len(lista):
+        lista[i] = ultimo
+        return ultimo
+    return None
+
+
+class SpatialGrid:
+    """
+    Grilla uniforme para la fase amplia de colisiones. Con celdas de lado
+    2·radio, lo que está a ≤ radio (en cada eje) de un punto cae en a lo
+    sumo 2×2 celdas, que son las únicas que se revisan.
+    """
+
+    _FILA = 1 << 16   # Clave entera de celda: cx·_FILA + cy
+
+    def __init__(self, radio):
+        self.radio = radio
+        self.celda = 2 * radio
+        self._celdas = {}
+
+    def _clave(self, e):
+        c = self.celda
+        return int(e.x // c) * self._FILA + int(e.y // c)
+
+    def reconstruir(self, entidades):
+        celdas = {}
+        for e in entidades:
+            clave = self._clave(e)
+            lista = celdas.get(clave)
+            if lista is None:
+                celdas[clave] = [e]
+            else:
+                lista.append(e)
+        self._celdas = celdas
+
+    def quitar(self, e):
+        self._celdas[self._clave(e)].remove(e)
+
+    def cercanos(self, x, y):
+        c, r, fila = self.celda, self.radio, self._FILA
+        x0, x1 = int((x - r) // c), int((x + r) // c)
+        y0, y1 = int((y - r) // c), int((y + r) // c)
+        celdas = self._celdas
+        out = []
+        for cx in ((x0,) if x0 == x1 else (x0, x1)):
+            for cy in ((y0,) if y0 == y1 else (y0, y1)):
+                lista = celdas.get(cx * fila + cy)
+                if lista:
+                    out += lista
+        return out
+
+
+class GameEngine:
+    """
+    Estado del juego avanzado en pasos fijos de 'dt':
+    - feed(angulos): pasa las muestras por el contador de repeticiones y
+      ubica la nave en la última
+    - step(): genera asteroides, dispara, mueve y resuelve colisiones
+    - render(alpha): dibuja interpolando entre el paso anterior y el actual
+    """
+
+    def __init__(self, ang_min, ang_max, objetivo, ancho=1280, alto=720, histeresis=0.0,
+                 params: dict = None, dt=1 / 60, seed=None, renderer: Renderer = None,
+                 grilla_min_pares=GRILLA_MIN_PARES):
+        self.p = dict(DEFAULT_PARAMS, **(params or {}))
+        self.dt = dt
+        self.grilla_min_pares = grilla_min_pares
+        self.w, self.h = ancho, alto
+        self.renderer = renderer if renderer is not None else NullRenderer()
+        self.reps = RepCounter(ang_min, ang_max, objetivo, histeresis)
+        self._rnd = random.Random(seed)
+
+        self.nave_x, self.nave_y = 100, alto // 2
+        self._nave_dibujada = None
+        self.asteroides = []   # Asteroide (sin orden; se quitan con _swap_remove)
+        self.balas = []        # Bala
+        self._grilla = SpatialGrid(self.p["radio_impacto_px"])
+        self.zona_index = 0
+        self.score = 0
+        self.pasos = 0
+        self.last_spawn = -self.p["intervalo_generacion_s"]   # Primer asteroide de inmediato
+        self.last_shot = -self.p["disparo_intervalo_s"]
+
+        # Métricas para ajustar la dificultad
+        self.generados = 0
+        self.destruidos = 0
+        self.escapados = 0
+        self.disparos = 0
+
+    @property
+    def t_sim(self):
+        return self.pasos * self.dt
+
+    # ---------- Entrada ----------
+    def set_angle(self, ang):
+        reps = self.reps
+        p = min(1.0, max(0.0, (ang - reps.ang_min) / (reps.ang_max - reps.ang_min)))
+        self.nave_y = int((1 - p) * self.h)
+
+    def feed(self, angs):
+        """
+        Procesa ángulos en orden. Si uno completa el objetivo, devuelve
+        cuántos se usaron (lo posterior se descarta); si no, None.
+        """
+        update = self.reps.update
+        fin = None
+        for i, ang in enumerate(angs):
+            if update(ang):
+                fin = i + 1
+                break
+        if len(angs):
+            self.set_angle(angs[fin - 1 if fin else -1])
+        return fin
+
+    # ---------- Simulación ----------
+    def step(self):
+        """Un paso fijo de simulación."""
+        self.pasos += 1
+        t = self.pasos * self.dt
+        p = self.p
+        if t - self.last_spawn >= p["intervalo_generacion_s"]:
+            self._spawn_asteroid()
+            self.last_spawn = t
+        if t - self.last_shot >= p["disparo_intervalo_s"]:
+            self._auto_shoot(t)
+        self._move_asteroids()
+        self._move_bullets()
+
+    def _spawn_asteroid(self):
+        p = self.p
+        if len(self.asteroides) >= p["max_asteroides"]:
+            return
+        zonas = p["zonas"]
+        zona = zonas[self.zona_index]
+        self.zona_index = (self.zona_index + 1) % len(zonas)
+        seccion = self.h / 4
+        y = int((zona - 1) * seccion + seccion / 2 + self._rnd.randint(-40, 40))
+        tipo = self._rnd.randrange(len(p["puntos"]))
+        x = self.w + 50
+        self.asteroides.append(Asteroide(self.renderer.crear_asteroide(x, y, tipo), x, y, tipo,
+                                         len(self.asteroides)))
+        self.generados += 1
+
+    def _auto_shoot(self, t):
+        nx, ny, tol = self.nave_x, self.nave_y, self.p["alineacion_px"]
+        for a in self.asteroides:
+            if a.x > nx and abs(a.y - ny) <= tol:
+                x = nx + 40
+                self.balas.append(Bala(self.renderer.crear_bala(x, ny), x, ny))
+                self.last_shot = t
+                self.disparos += 1
+                break
+
+    def _move_asteroids(self):
+        v = self.p["velocidad_asteroides"]
+        asteroides = self.asteroides
+        i = 0
+        while i < len(asteroides):
+            a = asteroides[i]
+            a.px = a.x
+            a.x -= v
+            if a.x < -80:
+                self.renderer.borrar(a.h)
+                self.escapados += 1
+                self._quitar_asteroide(i)   # El que ocupa su lugar se revisa ahora
+            else:
+                i += 1
+
+    def _move_bullets(self):
+        v = self.p["velocidad_balas"]
+        r = self.p["radio_impacto_px"]
+        limite = self.w + 80
+        balas, asteroides = self.balas, self.asteroides
+        grilla = self._grilla if len(balas) * len(asteroides) >= self.grilla_min_pares else None
+        if grilla is not None:
+            grilla.reconstruir(asteroides)
+        i = 0
+        while i < len(balas):
+            b = balas[i]
+            b.px = bx = b.x
+            b.x = bx = bx + v
+            by = b.y
+            candidatos = grilla.cercanos(bx, by) if grilla is not None else asteroides
+            for a in candidatos:
+                if abs(bx - a.x) <= r and abs(by - a.y) <= r:
+                    self._impacto(a, grilla)
+                    break
+            else:
+                if bx <= limite:
+                    i += 1
+                    continue
+            self.renderer.borrar(b.h)
+            _swap_remove(balas, i)
+
+    def _quitar_asteroide(self, i):
+        movido = _swap_remove(self.asteroides, i)
+        if movido is not None:
+            movido.i = i
+
+    def _impacto(self, a, grilla):
+        self.score += self.p["puntos"][a.tipo]
+        self.destruidos += 1
+        self._quitar_asteroide(a.i)
+        if grilla is not None:
+            grilla.quitar(a)
+        self.renderer.borrar(a.h)
+        self.renderer.puntaje(self.score)
+
+    # ---------- Dibujo ----------
+    def render(self, alpha=1.0):
+        r = self.renderer
+        if self._nave_dibujada != self.nave_y:
+            r.mover_nave(self.nave_x, self.nave_y)
+            self._nave_dibujada = self.nave_y
+        mover = r.mover
+        for e in self.asteroides:
+            mover(e.h, e.px + (e.x - e.px) * alpha, e.y)
+        for e in self.balas:
+            mover(e.h, e.px + (e.x - e.px) * alpha, e.y)
+
+    def stats(self) -> dict:
+        return {"score": self.score, "pasos": self.pasos, "t_sim_s": round(self.t_sim, 3),
+                "asteroides_generados": self.generados, "asteroides_destruidos": self.destruidos,
+                "asteroides_escapados": self.escapados, "disparos": self.disparos,
+                "tasa_acierto": round(self.destruidos / self.generados, 4) if self.generados else 0.0}
+
+
+# ======================= Simulación de sesiones grabadas =======================
+
+def cargar_sesion(path):
+    """(t, ángulos) de un archivo de sesión; usa el ángulo filtrado si se guardó."""
+    from Encriptacion import read_encrypted
+    from Sesiones import load_session
+
+    header, cols = load_session(read_encrypted(path))
+    ang = cols["angulo_filtrado"] if "angulo_filtrado" in cols else cols["angulo"]
+    return list(cols["t"]), list(ang)
+
+
+def simular(t, ang, ang_min=0.0, ang_max=90.0, objetivo=10 ** 9, params=None,
+            dt=1 / 60, seed=0, histeresis=0.0) -> dict:
+    """
+    Reproduce una trayectoria (t, ángulo) en el motor sin pantalla, a máxima
+    velocidad: antes de cada paso entran las muestras hasta ese instante.
+    """
+    eng = GameEngine(ang_min, ang_max, objetivo, histeresis=histeresis, params=params,
+                     dt=dt, seed=seed)
+    t_a = time.perf_counter()
+    n = len(t)
+    if n:
+        t0, i = t[0], 0
+        for k in range(int((t[-1] - t0) / dt) + 1):
+            j = bisect_right(t, t0 + (k + 1) * dt, i)
+            if j > i:
+                if eng.feed(ang[i:j]) is not None:
+                    break
+                i = j
+            eng.step()
+    st = eng.stats()
+    st.update(eng.reps.resumen())
+    st["total_repeticiones"] = eng.reps.total
+    st["t_real_s"] = time.perf_counter() - t_a
+    return st
+
+
+def ajustar_dificultad(trayectorias, ang_min=0.0, ang_max=90.0, velocidades=(3.0, 6.0, 9.0, 12.0),
+                       intervalos=(2.0, 3.0, 4.0), objetivo_acierto=0.6, semillas=(0, 1, 2)):
+    """
+    Barre velocidad de asteroides × intervalo de generación sobre las
+    trayectorias grabadas y elige la combinación cuya tasa de acierto media
+    queda más cerca de 'objetivo_acierto'. Devuelve (mejor, todos).
+    """
+    resultados = []
+    for v in velocidades:
+        for iv in intervalos:
+            params = {"velocidad_asteroides": v, "intervalo_generacion_s": iv}
+            tasas = [simular(t, a, ang_min, ang_max, params=params, seed=s)["tasa_acierto"]
+                     for t, a in trayectorias for s in semillas]
+            resultados.append({"params": params, "tasa_acierto": sum(tasas) / len(tasas)})
+    mejor = min(resultados, key=lambda r: abs(r["tasa_acierto"] - objetivo_acierto))
+    return mejor, resultados
+
+
+# ======================= Prueba directa =======================
+
+def _trayectoria_sintetica(segundos=600, frec_hz=100, rep_s=6.0, descanso_s=1.5, seed=0):
+    """
+    Paciente simulado: repeticiones con recorrido variable (55–100 % del
+    rango) separadas por un descanso en el mínimo, más ruido de 1°.
+    """
+    import math
+    rnd = random.Random(seed)
+    t, ang = [], []
+    ti, paso = 0.0, 1 / frec_hz
+    while ti < segundos:
+        amplitud = rnd.uniform(0.55, 1.0) * 90
+        for k in range(int(rep_s * frec_hz)):
+            fase = k / (rep_s * frec_hz)
+            t.append(ti)
+            ang.append(amplitud * (0.5 - 0.5 * math.cos(2 * math.pi * fase)) + rnd.gauss(0, 1.0))
+            ti += paso
+        for _ in range(int(descanso_s * frec_hz)):
+            t.append(ti)
+            ang.append(rnd.gauss(0, 1.0))
+            ti += paso
+    return t, ang
+
+
+def benchmark_engine(pasos=300_000, sesiones=()):
+    """
+    Velocidad del motor sin pantalla (pasos/s) y ajuste de dificultad sobre
+    sesiones grabadas (rutas de .ses.enc) o una trayectoria sintética.
+    """
+    import math
+
+    eng = GameEngine(0, 90, 10 ** 9, seed=0)
+    t_a = time.perf_counter()
+    for k in range(pasos):
+        # Nave subiendo y bajando como en una repetición de 4 s
+        eng.set_angle(45 - 45 * math.cos(2 * math.pi * k / 240))
+        eng.step()
+    dt = time.perf_counter() - t_a
+    print(f"[Bench] Motor: {pasos / dt:,.0f} pasos/s ({pasos / 60 / dt:,.0f}x tiempo real) | "
+          f"{eng.stats()}")
+
+    # Nivel denso: muchos asteroides y disparo rápido, con y sin grilla
+    denso = {"max_asteroides": 48, "intervalo_generacion_s": 0.05, "disparo_intervalo_s": 0.02,
+             "velocidad_asteroides": 4.0}
+    for nombre, umbral in (("grilla", GRILLA_MIN_PARES), ("todos contra todos", float("inf"))):
+        eng = GameEngine(0, 90, 10 ** 9, params=denso, seed=0, grilla_min_pares=umbral)
+        n = pasos // 5
+        t_a = time.perf_counter()
+        for k in range(n):
+            eng.set_angle(45 - 45 * math.cos(2 * math.pi * k / 60))
+            eng.step()
+        dt = time.perf_counter() - t_a
+        print(f"[Bench] Nivel denso ({nombre}): {n / dt:,.0f} pasos/s, "
+              f"{dt / n * 1e6:.1f} µs/paso | {len(eng.asteroides)} asteroides, "
+              f"{len(eng.balas)} balas en pantalla | {eng.stats()}")
+
+    if sesiones:
+        trayectorias = [cargar_sesion(p) for p in sesiones]
+        origen = f"{len(sesiones)} sesión(es) grabada(s)"
+    else:
+        trayectorias = [_trayectoria_sintetica()]
+        origen = "trayectoria sintética de 10 min a 100 Hz"
+    st = simular(*trayectorias[0])
+    dur = trayectorias[0][0][-1] - trayectorias[0][0][0]
+    print(f"[Bench] Sesión de {dur:.0f} s ({origen}) simulada en {st['t_real_s'] * 1000:.0f} ms "
+          f"({st['pasos'] / st['t_real_s']:,.0f} pasos/s con muestras) → "
+          f"{st['total_repeticiones']} repeticiones, acierto {st['tasa_acierto']:.2f}")
+
+    t_a = time.perf_counter()
+    mejor, todos = ajustar_dificultad(trayectorias)
+    print(f"[Bench] Ajuste de dificultad ({len(todos)} combinaciones en "
+          f"{time.perf_counter() - t_a:.1f} s):")
+    for r in todos:
+        marca = "  ←" if r is mejor else ""
+        print(f"        velocidad {r['params']['velocidad_asteroides']:.0f} px/paso, "
+              f"cada {r['params']['intervalo_generacion_s']:.0f} s → acierto {r['tasa_acierto']:.2f}{marca}")
+
+
+if __name__ == "__main__":
+    benchmark_engine(sesiones=sys.argv[1:])
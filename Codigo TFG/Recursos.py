@@ -0,0 +1,323 @@
+import os
+import time
+import struct
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from Encriptacion import ensure_dirs, exclude_from_reencrypt
+
+# ======================= Caché de imágenes =======================
+#
+# Cada pantalla llama a set_background y cada partida carga sus sprites; antes
+# eso decodificaba el archivo original y lo reescalaba con LANCZOS cada vez.
+# AssetManager reescala una sola vez por (archivo, tamaño) y guarda tres
+# niveles:
+#   1. PhotoImage en memoria (lista para el canvas)
+#   2. imagen PIL ya escalada en memoria
+#   3. copia escalada en disco, en crudo (sin compresión), nombrada por el
+#      hash del archivo original y el tamaño: sobrevive entre ejecuciones y
+#      se invalida sola si la imagen cambia.
+# Los dos niveles de memoria son LRU acotados.
+
+ASSET_CACHE_DIR = "cache_imagenes"      # Dentro de "Datos locales"
+exclude_from_reencrypt(ASSET_CACHE_DIR)   # No son datos cifrados (Encriptacion ya la omite)
+CACHE_MAGIC = b"PFGI"                   # No empieza como un archivo cifrado
+CACHE_EXT = ".img"
+_CACHE_HEADER = struct.Struct("<4sB7sHH")   # magic, versión, modo PIL, ancho, alto
+_CACHE_VERSION = 1
+
+MAX_IMAGENES = 32       # Imágenes PIL escaladas en memoria
+MAX_PHOTOS = 32         # PhotoImage en memoria
+
+_NIVELES = ("photo", "memoria", "disco")
+
+
+class AssetManager:
+    """
+    Carga imágenes escaladas con caché en memoria y en disco.
+    imagen(path, size) devuelve la imagen PIL escalada (desde cualquier hilo);
+    photo(path, size) la PhotoImage para Tk, que siempre se crea en el hilo de
+    la interfaz. precargar() llena los niveles PIL y disco en segundo plano.
+    stats() informa aciertos y fallos por nivel.
+    """
+
+    def __init__(self, cache_dir=None, max_imagenes=MAX_IMAGENES, max_photos=MAX_PHOTOS,
+                 resample=Image.LANCZOS):
+        if cache_dir is None:
+            cache_dir = os.path.join(ensure_dirs(), ASSET_CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.resample = resample
+        self.max_imagenes = max_imagenes
+        self.max_photos = max_photos
+        self._imagenes = OrderedDict()   # (ruta, ancho, alto) → Image
+        self._photos = OrderedDict()     # (ruta, ancho, alto) → PhotoImage
+        self._hashes = {}                # ruta → (mtime_ns, tamaño, sha1)
+        self._lock = threading.Lock()
+        self.aciertos = dict.fromkeys(_NIVELES, 0)
+        self.fallos = dict.fromkeys(_NIVELES, 0)
+        self.escalados = 0
+        self.t_escalado = 0.0
+        self.t_disco = 0.0
+
+    # ---------- Claves ----------
+    def _hash_origen(self, path):
+        """SHA-1 del archivo original, recalculado solo si cambió en disco."""
+        st = os.stat(path)
+        previo = self._hashes.get(path)
+        if previo and previo[0] == st.st_mtime_ns and previo[1] == st.st_size:
+            return previo[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 16), b""):
+                h.update(bloque)
+        digest = h.hexdigest()
+        self._hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def _ruta_cache(self, digest, size):
+        return os.path.join(self.cache_dir, f"{digest}_{size[0]}x{size[1]}{CACHE_EXT}")
+
+    # ---------- Disco ----------
+    def _leer_disco(self, ruta):
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+        except OSError:
+            return None
+        if len(datos) < _CACHE_HEADER.size:
+            return None
+        magic, version, modo, w, h = _CACHE_HEADER.unpack_from(datos)
+        if magic != CACHE_MAGIC or version != _CACHE_VERSION:
+            return None
+        try:
+            return Image.frombytes(modo.rstrip(b"\0").decode("ascii"), (w, h),
+                                   datos[_CACHE_HEADER.size:])
+        except ValueError:
+            return None     # Archivo truncado: se vuelve a generar
+
+    def _escribir_disco(self, ruta, img):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cab = _CACHE_HEADER.pack(CACHE_MAGIC, _CACHE_VERSION, img.mode.encode("ascii"),
+                                 img.width, img.height)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cab)
+                f.write(img.tobytes())
+            os.replace(tmp, ruta)
+        except OSError as e:
+            print("[Recursos] No se pudo guardar en caché:", e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    # ---------- Niveles ----------
+    @staticmethod
+    def _guardar(cache, clave, valor, maximo):
+        cache[clave] = valor
+        cache.move_to_end(clave)
+        while len(cache) > maximo:
+            cache.popitem(last=False)
+
+    def imagen(self, path, size):
+        """Imagen PIL de 'path' escalada a 'size' (ancho, alto)."""
+        path = os.path.normpath(path)
+        size = (int(size[0]), int(size[1]))
+        clave = (path, size[0], size[1])
+        with self._lock:
+            img = self._imagenes.get(clave)
+            if img is not None:
+                self._imagenes.move_to_end(clave)
+                self.aciertos["memoria"] += 1
+                return img
+            self.fallos["memoria"] += 1
+
+        # Disco y escalado sin el lock: mientras tanto los demás hilos siguen
+        # obteniendo de memoria las imágenes ya cargadas
+        ruta = self._ruta_cache(self._hash_origen(path), size)
+        t_a = time.perf_counter()
+        img = self._leer_disco(ruta)
+        t_disco = time.perf_counter() - t_a
+        t_escalado = None
+        if img is None:
+            t_a = time.perf_counter()
+            with Image.open(path) as original:
+                img = original.resize(size, self.resample)
+            t_escalado = time.perf_counter() - t_a
+            self._escribir_disco(ruta, img)
+
+        with self._lock:
+            self.t_disco += t_disco
+            if t_escalado is None:
+                self.aciertos["disco"] += 1
+            else:
+                self.fallos["disco"] += 1
+                self.t_escalado += t_escalado
+                self.escalados += 1
+            # Si otro hilo la cargó a la vez, se conserva la primera
+            img = self._imagenes.get(clave, img)
+            self._guardar(self._imagenes, clave, img, self.max_imagenes)
+            return img
+
+    def photo(self, path, size, master=None, timeout=5.0):
+        """
+        PhotoImage de 'path' escalada a 'size'. Tk no admite crear imágenes
+        desde otro hilo: llamada fuera del hilo principal (el de mainloop), la
+        imagen PIL se prepara en el hilo que llama y la PhotoImage se crea en
+        el de Tk con master.after(0, ...), esperando hasta 'timeout' segundos.
+        """
+        from PIL import ImageTk
+        path = os.path.normpath(path)
+        clave = (path, int(size[0]), int(size[1]))
+        with self._lock:
+            tkimg = self._photos.get(clave)
+            if tkimg is not None:
+                self._photos.move_to_end(clave)
+                self.aciertos["photo"] += 1
+                return tkimg
+            self.fallos["photo"] += 1
+        img = self.imagen(path, size)
+        if threading.current_thread() is threading.main_thread():
+            tkimg = ImageTk.PhotoImage(img, master=master)
+        else:
+            if master is None:
+                raise RuntimeError("photo() fuera del hilo de Tk necesita 'master'.")
+            tkimg = _en_hilo_tk(master, lambda: ImageTk.PhotoImage(img, master=master), timeout)
+        with self._lock:
+            self._guardar(self._photos, clave, tkimg, self.max_photos)
+        return tkimg
+
+    def precargar(self, pedidos, en_hilo=True):
+        """
+        Deja listas en memoria (y en disco) las imágenes de 'pedidos', una
+        lista de (ruta, tamaño). Los errores se ignoran: la carga real los
+        vuelve a encontrar y los informa.
+        """
+        def trabajo():
+            for path, size in pedidos:
+                try:
+                    self.imagen(path, size)
+                except Exception:
+                    pass
+
+        if not en_hilo:
+            trabajo()
+            return None
+        hilo = threading.Thread(target=trabajo, name="PrecargaImagenes", daemon=True)
+        hilo.start()
+        return hilo
+
+    def limpiar_memoria(self):
+        with self._lock:
+            self._imagenes.clear()
+            self._photos.clear()
+
+    def stats(self) -> dict:
+        """Aciertos, fallos y tasa de acierto por nivel, más el tiempo de escalado."""
+        out = {}
+        for nivel in _NIVELES:
+            a, f = self.aciertos[nivel], self.fallos[nivel]
+            out[nivel] = {"aciertos": a, "fallos": f,
+                          "tasa": round(a / (a + f), 3) if a + f else 0.0}
+        out["escalados"] = self.escalados
+        out["t_escalado_ms"] = round(self.t_escalado * 1000, 1)
+        out["t_disco_ms"] = round(self.t_disco * 1000, 1)
+        out["en_memoria"] = {"imagenes": len(self._imagenes), "photos": len(self._photos)}
+        return out
+
+
+def _en_hilo_tk(master, fn, timeout):
+    """Ejecuta fn() en el hilo de Tk (vía master.after) y devuelve su resultado."""
+    hecho = threading.Event()
+    resultado = {}
+
+    def correr():
+        try:
+            resultado["valor"] = fn()
+        except Exception as e:
+            resultado["error"] = e
+        finally:
+            hecho.set()
+
+    master.after(0, correr)
+    if not hecho.wait(timeout):
+        raise TimeoutError("El hilo de Tk no atendió la creación de la imagen.")
+    if "error" in resultado:
+        raise resultado["error"]
+    return resultado["valor"]
+
+
+# Gestor compartido por la aplicación
+_assets = None
+
+
+def asset_manager() -> AssetManager:
+    global _assets
+    if _assets is None:
+        _assets = AssetManager()
+    return _assets
+
+
+# Imágenes de la aplicación y del juego, con el tamaño en que se dibujan
+FONDO = (os.path.join("imagenes", "Costa_Rica.jpg"), (1280, 720))
+SPRITES = [(os.path.join("imagenes", "Nave.png"), (80, 80)),
+           (os.path.join("imagenes", "Disparo.png"), (35, 35))] + \
+          [(os.path.join("imagenes", f"Asteroide_{i}.png"), (65, 65)) for i in range(3)]
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_assets(repeticiones=7):
+    """
+    Tiempo de carga de las imágenes de una pantalla (fondo) y del inicio de
+    una partida (sprites) en tres situaciones: sin caché (decodificar y
+    escalar, como antes), con la copia en disco (nueva ejecución) y en
+    memoria. Solo nivel PIL: la PhotoImage necesita una pantalla.
+    """
+    cache_dir = tempfile.mkdtemp(prefix="cache_imagenes_")
+    try:
+        for nombre, pedidos in (("Pantalla (fondo)", [FONDO]), ("Inicio de partida", SPRITES)):
+            def sin_cache():
+                for path, size in pedidos:
+                    with Image.open(path) as original:
+                        original.resize(size, Image.LANCZOS).load()
+
+            def medir(fn):
+                tiempos = []
+                for _ in range(repeticiones):
+                    t_a = time.perf_counter()
+                    fn()
+                    tiempos.append(time.perf_counter() - t_a)
+                return sorted(tiempos)[len(tiempos) // 2] * 1000
+
+            t_sin = medir(sin_cache)
+            AssetManager(cache_dir).precargar(pedidos, en_hilo=False)    # genera la copia en disco
+            t_disco = medir(lambda: AssetManager(cache_dir).precargar(pedidos, en_hilo=False))
+            gestor = AssetManager(cache_dir)
+            gestor.precargar(pedidos, en_hilo=False)
+            t_mem = medir(lambda: gestor.precargar(pedidos, en_hilo=False))
+            print(f"[Bench] {nombre}: sin caché {t_sin:.2f} ms | disco {t_disco:.2f} ms "
+                  f"(x{t_sin / t_disco:.1f}) | memoria {t_mem:.3f} ms (x{t_sin / t_mem:.0f})")
+
+        # Recorrido típico: 7 pantallas y 3 partidas en una ejecución con caché en disco
+        gestor = AssetManager(cache_dir)
+        for _ in range(3):
+            for _ in range(7):
+                gestor.imagen(*FONDO)
+            for path, size in SPRITES:
+                gestor.imagen(path, size)
+        print(f"[Bench] Recorrido de 7 pantallas x 3 partidas: {gestor.stats()}")
+        tam = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir))
+        print(f"[Bench] Caché en disco: {len(os.listdir(cache_dir))} archivos, {tam:,} B")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark_assets()
@@ -0,0 +1,200 @@
+import os
+import time
+import tempfile
+
+from Conexion_Teensy import ReplaySource, TeensyReader, load_capture
+from Encriptacion import write_encrypted_stream
+from Sesiones import iter_encode_session
+
+# ======================= Conteo de repeticiones =======================
+
+class RepCounter:
+    """
+    Máquina de estados de repeticiones (sin GUI), usada por el juego y por
+    la reproducción de capturas. Una repetición empieza cerca del mínimo,
+    se clasifica según el pico alcanzado y termina al volver al mínimo:
+    correcta (llegó al máximo), parcial (pico ≥ 50 %) o incorrecta.
+    Con 'histeresis' > 0 los umbrales de inicio y fin de la zona mínima se
+    separan para no contar el ruido del borde.
+    """
+
+    def __init__(self, ang_min, ang_max, objetivo, histeresis=0.0):
+        self.ang_min = float(ang_min)
+        self.ang_max = float(ang_max)
+        if self.ang_max <= self.ang_min:
+            self.ang_max = self.ang_min + 1
+        self.objetivo = int(objetivo)
+        # Banda alrededor del umbral del mínimo (fracción del recorrido): una
+        # repetición empieza bajo 0.1 − h y solo cuenta si el pico pasó 0.1 + h,
+        # así el ruido en el borde de la zona mínima no suma repeticiones
+        self.histeresis = float(histeresis)
+        self.total = self.ok = self.parcial = self.bad = 0
+        self.phase = "waiting_min"
+        self.max_reached = False
+        self.peak = 0.0
+
+    @property
+    def completed(self):
+        return self.total >= self.objetivo
+
+    def update(self, ang) -> bool:
+        """Procesa un ángulo. Devuelve True al alcanzar el objetivo."""
+        p = (ang - self.ang_min) / (self.ang_max - self.ang_min)
+        p = max(0, min(1, p))
+        near_min, near_max = p <= 0.1, p >= 0.98
+        if self.phase == "waiting_min" and p <= 0.1 - self.histeresis:
+            self.phase, self.max_reached, self.peak = "going_up", False, p
+        elif self.phase == "going_up":
+            self.peak = max(self.peak, p)
+            if near_max:
+                self.max_reached = True
+            if near_min and self.peak > 0.1 + self.histeresis:
+                self.total += 1
+                if self.max_reached:
+                    self.ok += 1
+                elif self.peak >= 0.5:
+                    self.parcial += 1
+                else:
+                    self.bad += 1
+                if self.total >= self.objetivo:
+                    return True
+                self.phase = "waiting_min"
+        return False
+
+    def resumen(self) -> dict:
+        return {"repeticiones": f"{self.total}/{self.objetivo}", "correctas": self.ok,
+                "parciales": self.parcial, "incorrectas": self.bad}
+
+
+# ======================= Reproducción de capturas =======================
+
+def replay_capture(path, plan: dict, speed=None, persist=True, stop_at_goal=False, filtros=None):
+    """
+    Reproduce una captura por el mismo camino que una sesión real:
+    ReplaySource → TeensyReader (decodificación) → [filtros] → RepCounter → sesión cifrada.
+    Con speed=None va lo más rápido posible. 'filtros' es una configuración
+    como Filtros.DEFAULT_FILTERS (None = sin filtrar). Devuelve resumen + tiempos.
+    """
+    info, records = load_capture(path)
+    source = ReplaySource((info, records), speed=speed, timeout=0.05)
+    # Buffer con lugar para toda la captura: la reproducción no debe perder muestras
+    reader = TeensyReader(source, binary=info["binario"],
+                          capacity=max(8192, source.total_bytes // 8 + 1))
+    pipe = None
+    if filtros:
+        from Filtros import make_pipeline
+        pipe = make_pipeline(filtros)
+    reps = RepCounter(plan.get("angulo_min", 0), plan.get("angulo_max", 90),
+                      plan.get("repeticiones", 10),
+                      histeresis=filtros.get("histeresis", 0.0) if filtros else 0.0)
+
+    mediciones = []
+    t0_dev = None
+    t_fsm = 0.0
+
+    def procesar(batch):
+        nonlocal t0_dev, t_fsm
+        if t0_dev is None:
+            t0_dev = batch[0][1]
+        t_a = time.perf_counter()
+        if pipe is None:
+            for _, t_dev, ang, fuerza in batch:
+                mediciones.append((round(t_dev - t0_dev, 3), ang, fuerza))
+                if reps.update(ang) and stop_at_goal:
+                    break
+        else:
+            ang_f, vel = pipe.process([m[1] for m in batch], [m[2] for m in batch])
+            vel = vel.tolist() if vel is not None else [0.0] * len(batch)
+            for (_, t_dev, ang, fuerza), a_f, v in zip(batch, ang_f.tolist(), vel):
+                mediciones.append((round(t_dev - t0_dev, 3), ang, fuerza, a_f, v))
+                if reps.update(a_f) and stop_at_goal:
+                    break
+        t_fsm += time.perf_counter() - t_a
+
+    t_ini = time.perf_counter()
+    reader.start()
+    while not (stop_at_goal and reps.completed):
+        batch = reader.ring.wait_take(timeout=0.05)
+        if batch:
+            procesar(batch)
+        elif source.finished:
+            break
+    # Detener el hilo antes de vaciar lo último que haya dejado en el buffer
+    reader.stop()
+    batch = reader.ring.take()
+    if batch and not (stop_at_goal and reps.completed):
+        procesar(batch)
+    t_total = time.perf_counter() - t_ini
+
+    resumen = {"usuario": "replay", "plan_usado": plan.get("id"),
+               "duracion_s": int(mediciones[-1][0]) if mediciones else 0}
+    resumen.update(reps.resumen())
+
+    t_persist = 0.0
+    if persist:
+        t_a = time.perf_counter()
+        fd, out = tempfile.mkstemp(suffix=".ses.enc")
+        os.close(fd)
+        try:
+            write_encrypted_stream(out, iter_encode_session(resumen, mediciones))
+        finally:
+            t_persist = time.perf_counter() - t_a
+            os.remove(out)
+
+    n = len(mediciones)
+    return {
+        "resumen": resumen,
+        "muestras": n,
+        "lector": reader.stats(),
+        "t_total_s": t_total,
+        "t_fsm_s": t_fsm,
+        "t_persistencia_s": t_persist,
+        "muestras_por_s": n / t_total if t_total else 0.0,
+        "fsm_us_por_muestra": t_fsm / n * 1e6 if n else 0.0,
+        "filtros": pipe.stats() if pipe else None,
+    }
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_replay(seconds=5.0, rate_hz=1000):
+    """Graba una captura del simulador y la reproduce a máxima velocidad."""
+    from Conexion_Teensy import (conectar_teensy, configurar_teensy, configurar_salida,
+                                 configurar_frecuencia, cerrar_teensy, CaptureWriter, CAPTURE_EXT)
+    from Simulador_Teensy import TeensySimulator
+
+    fd, cap_path = tempfile.mkstemp(suffix=CAPTURE_EXT)
+    os.close(fd)
+    sim = TeensySimulator(seed=3).start()
+    try:
+        ser = conectar_teensy(port=sim.port)
+        configurar_teensy(ser, 1, "E")
+        configurar_salida(ser, "B")
+        configurar_frecuencia(ser, rate_hz)
+        ser.reset_input_buffer()
+        capture = CaptureWriter(cap_path, binary=True)
+        reader = TeensyReader(ser, binary=True, capture=capture).start()
+        t_ini = time.time()
+        while time.time() - t_ini < seconds:
+            reader.ring.wait_take(timeout=0.1)
+        reader.stop()
+        capture.close()
+        cerrar_teensy()
+    finally:
+        sim.stop()
+
+    print(f"[Bench] Captura: {capture.records} lecturas, {capture.bytes:,} B crudos → "
+          f"{os.path.getsize(cap_path):,} B en disco")
+    plan = {"angulo_min": 0, "angulo_max": 90, "repeticiones": 1000}
+    from Filtros import DEFAULT_FILTERS
+    for speed, filtros in ((None, None), (None, DEFAULT_FILTERS), (1.0, None)):
+        st = replay_capture(cap_path, plan, speed=speed, filtros=filtros)
+        modo = ("máxima" if speed is None else f"x{speed}") + (", filtrada" if filtros else "")
+        print(f"[Bench] Reproducción ({modo}): {st['muestras']} muestras en {st['t_total_s']:.3f}s "
+              f"({st['muestras_por_s']:,.0f}/s), FSM {st['fsm_us_por_muestra']:.2f} µs/muestra, "
+              f"persistencia {st['t_persistencia_s'] * 1000:.1f} ms → {st['resumen']['repeticiones']}")
+    os.remove(cap_path)
+
+
+if __name__ == "__main__":
+    benchmark_replay()
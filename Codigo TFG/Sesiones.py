@@ -0,0 +1,214 @@
+import sys
+import json
+import struct
+from array import array
+
+from Encriptacion import read_encrypted_prefix
+
+# ======================= Formato de sesión =======================
+#
+# Formato binario v1 (contenido en claro, antes de cifrar):
+#
+#   [0:4]   magic  b"PFGS"
+#   [4]     versión (u8)
+#   [5]     flags (u8)     bit 0 = columna de tiempo codificada en deltas
+#   [6]     tamaño de cada valor en bytes (u8): 4 = float32, 8 = float64
+#   [7]     número de columnas (u8)
+#   [8:12]  número de muestras n (u32, little-endian)
+#   [12:16] longitud del encabezado JSON (u32, little-endian)
+#   [16:..] encabezado JSON (resumen de la sesión), con relleno hasta múltiplo de 8
+#   [..]    columnas contiguas t, angulo, fuerza (n valores cada una, little-endian)
+#           y, si las hay, columnas extra (p. ej. angulo_filtrado, velocidad),
+#           cuyos nombres van en "columnas" del encabezado
+#
+# Las sesiones antiguas (JSON con lista "mediciones") se siguen leyendo.
+
+SESSION_MAGIC = b"PFGS"
+SESSION_VERSION = 1
+FLAG_DELTA_T = 0x01
+COLUMNS = ("t", "angulo", "fuerza")
+EXTRA_COLUMNS = ("angulo_filtrado", "velocidad")
+
+# Formato usado al guardar sesiones nuevas: "binary" | "json"
+SESSION_FORMAT = "binary"
+SESSION_ITEMSIZE = 4        # 4 = float32, 8 = float64
+SESSION_DELTA_T = False
+
+# Extensiones de archivo de sesión (binario nuevo y JSON antiguo)
+SESSION_EXT = ".ses.enc"
+LEGACY_SESSION_EXT = ".json.enc"
+
+# Bytes leídos de entrada al buscar solo el resumen (cubre encabezados normales)
+SUMMARY_PREFIX = 4096
+
+_PREFIX = struct.Struct("<4sBBBBII")
+_TYPECODE = {4: "f", 8: "d"}
+_LITTLE = sys.byteorder == "little"
+
+
+def is_session_file(fname: str):
+    """Indica si un nombre de archivo corresponde a una sesión guardada."""
+    return "_sesion_" in fname and fname.endswith((SESSION_EXT, LEGACY_SESSION_EXT))
+
+
+def session_extension():
+    """Extensión a usar para una sesión nueva según SESSION_FORMAT."""
+    return SESSION_EXT if SESSION_FORMAT == "binary" else LEGACY_SESSION_EXT
+
+
+# ======================= Codificación =======================
+
+def _column_names(mediciones):
+    """Nombres de columna según el ancho de las filas (3 = t, angulo, fuerza)."""
+    ancho = len(mediciones[0]) if len(mediciones) else len(COLUMNS)
+    return (COLUMNS + EXTRA_COLUMNS)[:max(ancho, len(COLUMNS))]
+
+
+def iter_encode_session(resumen: dict, mediciones, itemsize=None, delta_t=None,
+                        chunk_rows=16384, fmt=None):
+    """
+    Serializa resumen + mediciones [(t, ang, fuerza[, ang_filtrado, velocidad]), ...]
+    según 'fmt' (por defecto SESSION_FORMAT), produciendo bloques de bytes
+    (para cifrado por segmentos sin armar todo en memoria).
+    """
+    names = _column_names(mediciones)
+    extra = {"columnas": list(names)} if len(names) > len(COLUMNS) else {}
+
+    if (fmt or SESSION_FORMAT) != "binary":
+        data = dict(resumen, **extra)
+        data["mediciones"] = [list(m) for m in mediciones]
+        yield json.dumps(data, ensure_ascii=False).encode("utf-8")
+        return
+
+    itemsize = itemsize or SESSION_ITEMSIZE
+    delta_t = SESSION_DELTA_T if delta_t is None else delta_t
+    tc = _TYPECODE[itemsize]
+    n = len(mediciones)
+
+    header = dict(resumen, **extra)
+    header.pop("mediciones", None)
+    hjson = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    hjson += b" " * (-(_PREFIX.size + len(hjson)) % 8)
+
+    flags = FLAG_DELTA_T if delta_t else 0
+    yield _PREFIX.pack(SESSION_MAGIC, SESSION_VERSION, flags, itemsize, len(names), n, len(hjson)) + hjson
+
+    for c in range(len(names)):
+        prev = 0.0
+        for i in range(0, n, chunk_rows):
+            out = array(tc)
+            for row in mediciones[i:i + chunk_rows]:
+                v = row[c]
+                if c == 0 and delta_t:
+                    v, prev = v - prev, v
+                out.append(v)
+            if not _LITTLE:
+                out.byteswap()
+            yield out.tobytes()
+
+
+def encode_session(resumen: dict, mediciones, itemsize=None, delta_t=None, fmt=None):
+    """Serializa la sesión completa en un único bloque de bytes."""
+    return b"".join(iter_encode_session(resumen, mediciones, itemsize, delta_t, fmt=fmt))
+
+
+# ======================= Decodificación =======================
+
+def is_binary_session(raw) -> bool:
+    return bytes(raw[:4]) == SESSION_MAGIC
+
+
+def _parse_prefix(raw):
+    magic, version, flags, itemsize, ncols, n, hlen = _PREFIX.unpack_from(raw, 0)
+    if magic != SESSION_MAGIC:
+        raise ValueError("No es una sesión binaria.")
+    if version > SESSION_VERSION:
+        raise ValueError(f"Versión de sesión no soportada: {version}")
+    if itemsize not in _TYPECODE:
+        raise ValueError(f"Tamaño de valor inválido: {itemsize}")
+    return flags, itemsize, ncols, n, hlen
+
+
+def read_session_header(raw) -> dict:
+    """
+    Devuelve solo el resumen de la sesión (sin decodificar mediciones).
+    Funciona con ambos formatos.
+    """
+    if not is_binary_session(raw):
+        data = json.loads(bytes(raw).decode("utf-8"))
+        data.pop("mediciones", None)
+        return data
+    _, _, _, _, hlen = _parse_prefix(raw)
+    return json.loads(bytes(raw[_PREFIX.size:_PREFIX.size + hlen]).decode("utf-8"))
+
+
+def read_session_summary(path: str) -> dict:
+    """
+    Lee solo el resumen de un archivo de sesión cifrado. En sesiones binarias
+    cifradas por segmentos solo se descifra el primer segmento.
+    """
+    raw = read_encrypted_prefix(path, SUMMARY_PREFIX)
+    if is_binary_session(raw):
+        _, _, _, _, hlen = _parse_prefix(raw)
+        if len(raw) < _PREFIX.size + hlen:
+            raw = read_encrypted_prefix(path, _PREFIX.size + hlen)
+    elif len(raw) == SUMMARY_PREFIX:
+        raw = read_encrypted_prefix(path, -1)
+    return read_session_header(raw)
+
+
+def load_session(raw):
+    """
+    Decodifica una sesión completa. Devuelve (resumen, columnas) donde
+    columnas = {"t": ..., "angulo": ..., "fuerza": ...} son secuencias de float.
+    En formato binario las columnas son vistas (memoryview) sobre 'raw',
+    sin copiar los datos (salvo la columna de tiempo si va en deltas).
+    """
+    if not is_binary_session(raw):
+        data = json.loads(bytes(raw).decode("utf-8"))
+        mediciones = data.pop("mediciones", [])
+        names = data.get("columnas") or COLUMNS
+        cols = {name: array("d") for name in names}
+        destinos = [cols[name].append for name in names]
+        for row in mediciones:
+            try:
+                valores = [float(v) for v in row]
+            except (TypeError, ValueError):
+                continue
+            if len(valores) != len(names):
+                continue
+            for agregar, v in zip(destinos, valores):
+                agregar(v)
+        return data, cols
+
+    flags, itemsize, ncols, n, hlen = _parse_prefix(raw)
+    header = json.loads(bytes(raw[_PREFIX.size:_PREFIX.size + hlen]).decode("utf-8"))
+
+    mv = memoryview(raw)
+    tc = _TYPECODE[itemsize]
+    off = _PREFIX.size + hlen
+    cols = {}
+    for name in (header.get("columnas") or COLUMNS)[:ncols]:
+        chunk = mv[off:off + n * itemsize]
+        if _LITTLE:
+            cols[name] = chunk.cast(tc)
+        else:
+            col = array(tc, bytes(chunk))
+            col.byteswap()
+            cols[name] = col
+        off += n * itemsize
+
+    if flags & FLAG_DELTA_T and n:
+        t = array("d")
+        acc = 0.0
+        for d in cols["t"]:
+            acc += d
+            t.append(acc)
+        cols["t"] = t
+
+    return header, cols
+
+
+def iter_mediciones(cols, names=COLUMNS):
+    """Recorre las columnas como filas (por defecto t, angulo, fuerza)."""
+    return zip(*(cols[name] for name in names))
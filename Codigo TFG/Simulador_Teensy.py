@@ -0,0 +1,295 @@
+import os
+import pty
+import tty
+import math
+import time
+import random
+import select
+import threading
+
+from Conexion_Teensy import (
+    convertir_angulo, angulo_a_adc, fuerza_tabla,
+    encode_data_frame, encode_ack_frame, encode_raw_frame,
+    ACK_OK, ACK_DESCONOCIDO, ACK_INVALIDO, ACK_AJUSTADO, PROTOCOL_VERSION,
+    FREC_MIN_HZ, FREC_MAX_HZ, FREC_ADC_MAX_HZ, DECIMACION_MAX,
+)
+
+# ======================= Simulador del Teensy =======================
+#
+# Abre un pseudo-terminal (Linux/macOS) y se comporta como Teensy/Teensy.ino:
+# acepta los mismos comandos por línea ("0".."3", "E"/"F", "A"/"B", "R<hz>",
+# "R?", "D<n>", "D?", "?"), con o sin id "#<id> " para confirmarlos, y emite "angulo,fuerza" en modo ASCII o tramas binarias en modo 'B'.
+# El ángulo sigue repeticiones de rodilla realistas y la fuerza se calcula
+# con la misma tabla que fuerzaTabla(). La decimación promedia lecturas, por
+# lo que reduce el ruido en √n como en el equipo. Permite probar la conexión,
+# el lector y el juego sin hardware: conectar_teensy(port=sim.port).
+
+FREC_DEFECTO_HZ = 10      # Igual que frec_hz = 10 en el firmware
+MAX_RAFAGA = 1000         # Muestras máximas por escritura si el simulador se atrasa
+
+
+class TeensySimulator:
+    """
+    Simulador configurable:
+    - rate_hz:     frecuencia inicial de muestreo (luego se cambia con "R<hz>")
+    - max_hz:      límite de "R<hz>" (subirlo permite pruebas por encima del firmware;
+                   también levanta el límite de lecturas del ADC)
+    - noise_deg:   desviación estándar del ruido del ángulo (°)
+    - dropout:     probabilidad de omitir una muestra (la secuencia avanza igual)
+    - garbage:     probabilidad de insertar bytes basura antes de una muestra
+    - ang_min/ang_max/rep_s: recorrido y duración de cada repetición
+    - seed:        semilla para trayectorias reproducibles
+    """
+
+    def __init__(self, rate_hz=FREC_DEFECTO_HZ, max_hz=FREC_MAX_HZ, noise_deg=0.5,
+                 dropout=0.0, garbage=0.0, ang_min=0.0, ang_max=90.0, rep_s=3.0,
+                 seed=None):
+        self.frec_hz = rate_hz
+        self.decimacion = 1
+        self.max_hz = max_hz
+        self.adc_max_hz = max(FREC_ADC_MAX_HZ, max_hz)
+        self.noise_deg = noise_deg
+        self.dropout = dropout
+        self.garbage = garbage
+        self.ang_min = ang_min
+        self.ang_max = ang_max
+        self.rep_s = rep_s
+        self._rnd = random.Random(seed)
+
+        # Estado del firmware
+        self.resorte_sel = 0
+        self.modo_sel = "E"
+        self.salida_sel = "A"
+        self.secuencia = 0
+
+        self._linea = bytearray()
+        self._amplitud = 1.0
+        self._rep_actual = -1
+        self._master = self._slave = None
+        self.port = None
+        self._thread = None
+        self._stop = threading.Event()
+
+        # Métricas
+        self.samples = 0
+        self.dropped = 0
+        self.garbage_bytes = 0
+        self.bytes_sent = 0
+        self.commands = 0
+
+    # ---------- Ciclo de vida ----------
+    def start(self):
+        """Crea el pty y arranca el hilo del 'firmware'. Devuelve self."""
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._t0 = time.monotonic()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(1.0)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------- Comandos (igual que procesarComando/ejecutarLinea) ----------
+    def _procesar_comando(self, cmd: str, eco=True):
+        """Devuelve (estado, valor) como el firmware."""
+        self.commands += 1
+        if len(cmd) == 1 and cmd.isdigit():
+            if cmd > "3":
+                return ACK_INVALIDO, 0
+            self.resorte_sel = int(cmd)
+            if eco and self.salida_sel == "A":
+                self._escribir(f"Resorte seleccionado: {self.resorte_sel}\r\n".encode())
+            return ACK_OK, self.resorte_sel
+        if cmd in ("E", "F"):
+            self.modo_sel = cmd
+            if eco and self.salida_sel == "A":
+                modo = "Extensión" if cmd == "E" else "Flexión"
+                self._escribir(f"Modo: {modo}\r\n".encode("utf-8"))
+            return ACK_OK, ord(cmd)
+        if cmd in ("A", "B", "C"):
+            self.salida_sel = cmd
+            self.secuencia = 0
+            return ACK_OK, ord(cmd)
+        if cmd in ("R?", "D?"):
+            return ACK_OK, self.frec_hz if cmd == "R?" else self.decimacion
+        if cmd[:1] in ("R", "D"):
+            digitos = cmd[1:].strip()
+            n = int(digitos) if digitos.isdigit() else 0  # atol() devuelve 0 con texto inválido
+            if n <= 0:
+                return ACK_INVALIDO, 0
+            estado = ACK_OK
+            if cmd[0] == "R":
+                tope = min(self.max_hz, self.adc_max_hz // self.decimacion)
+                if not FREC_MIN_HZ <= n <= tope:
+                    n, estado = min(tope, max(FREC_MIN_HZ, n)), ACK_AJUSTADO
+                self.frec_hz = n
+            else:
+                tope = min(DECIMACION_MAX, self.adc_max_hz // self.frec_hz)
+                if n > tope:
+                    n, estado = tope, ACK_AJUSTADO
+                self.decimacion = n
+            return estado, n
+        if cmd == "?":
+            return ACK_OK, PROTOCOL_VERSION
+        return ACK_DESCONOCIDO, 0
+
+    def _ejecutar_linea(self, linea: str):
+        if not linea.startswith("#"):
+            self._procesar_comando(linea)
+            return
+        id_txt, _, cmd = linea[1:].partition(" ")
+        cmd_id = int(id_txt) & 0xFFFF if id_txt.isdigit() else 0
+        estado, valor = self._procesar_comando(cmd.strip(), eco=False)
+        if self.salida_sel != "A":
+            self._escribir(encode_ack_frame(cmd_id, estado, valor))
+        else:
+            self._escribir(f"#ACK,{cmd_id},{estado},{valor}\r\n".encode())
+
+    def _leer_comandos(self, data: bytes):
+        for c in data:
+            if c in (0x0A, 0x0D):
+                if self._linea:
+                    self._ejecutar_linea(self._linea.decode("utf-8", "replace"))
+                    self._linea.clear()
+            elif len(self._linea) < 31:
+                self._linea.append(c)
+
+    # ---------- Trayectoria ----------
+    def angulo_en(self, t):
+        """Ángulo simulado en t (s): repeticiones coseno con amplitud variable."""
+        rep = int(t // self.rep_s)
+        if rep != self._rep_actual:
+            self._rep_actual = rep
+            # La mayoría llega al máximo; algunas quedan parciales
+            self._amplitud = 1.0 if self._rnd.random() < 0.8 else self._rnd.uniform(0.5, 0.9)
+        fase = (t % self.rep_s) / self.rep_s
+        p = 0.5 - 0.5 * math.cos(2 * math.pi * fase)
+        ang = self.ang_min + p * self._amplitud * (self.ang_max - self.ang_min)
+        return ang + self._rnd.gauss(0.0, self.noise_deg / math.sqrt(self.decimacion))
+
+    def _muestra(self, t):
+        """Una muestra como la produciría el firmware (ADC cuantizado)."""
+        adc = angulo_a_adc(self.angulo_en(t), self.modo_sel)
+        ang = convertir_angulo(adc, self.modo_sel)
+        return adc, ang, fuerza_tabla(ang, self.resorte_sel)
+
+    def _codificar(self, t):
+        out = b""
+        if self.garbage and self._rnd.random() < self.garbage:
+            basura = bytes(self._rnd.randrange(256) for _ in range(self._rnd.randint(1, 8)))
+            self.garbage_bytes += len(basura)
+            out += basura
+        adc, ang, fuerza = self._muestra(t)
+        if self.dropout and self._rnd.random() < self.dropout:
+            self.dropped += 1
+            self.secuencia = (self.secuencia + 1) & 0xFFFF
+            return out
+        self.samples += 1
+        if self.salida_sel in ("B", "C"):
+            t_us = int(t * 1e6)
+            if self.salida_sel == "B":
+                out += encode_data_frame(self.secuencia, t_us, adc, ang, fuerza)
+            else:
+                out += encode_raw_frame(self.secuencia, t_us, adc)
+            self.secuencia = (self.secuencia + 1) & 0xFFFF
+        else:
+            out += f"{ang:.2f},{fuerza:.3f}\r\n".encode()
+        return out
+
+    # ---------- Hilo principal ----------
+    def _escribir(self, data: bytes):
+        """Escribe todo, esperando si el host no lee (como el USB del Teensy)."""
+        mv = memoryview(data)
+        while mv and not self._stop.is_set():
+            _, w, _ = select.select([], [self._master], [], 0.1)
+            if w:
+                n = os.write(self._master, mv)
+                self.bytes_sent += n
+                mv = mv[n:]
+
+    def _run(self):
+        try:
+            self._escribir("Teensy listo. Esperando comandos...\r\n".encode())
+            proximo = time.monotonic() - self._t0
+            while not self._stop.is_set():
+                ahora = time.monotonic() - self._t0
+                espera = max(0.0, proximo - ahora)
+                r, _, _ = select.select([self._master], [], [], espera)
+                if r:
+                    self._leer_comandos(os.read(self._master, 1024))
+                    continue
+                # Generar todas las muestras vencidas en una sola escritura
+                ahora = time.monotonic() - self._t0
+                bloque = []
+                while proximo <= ahora and len(bloque) < MAX_RAFAGA:
+                    bloque.append(self._codificar(proximo))
+                    proximo += 1.0 / self.frec_hz
+                if proximo <= ahora:
+                    proximo = ahora  # Evitar ráfagas tras un retraso largo
+                if bloque:
+                    self._escribir(b"".join(bloque))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {"muestras": self.samples, "omitidas": self.dropped,
+                "bytes_basura": self.garbage_bytes, "bytes": self.bytes_sent,
+                "comandos": self.commands}
+
+
+# ======================= Prueba directa =======================
+
+def benchmark_acquisition(rate_hz=1000, seconds=3.0, dropout=0.0, garbage=0.0, max_hz=None):
+    """Prueba de carga del lector con el simulador en modo binario."""
+    from Conexion_Teensy import (conectar_teensy, configurar_teensy, configurar_salida,
+                                 configurar_frecuencia, cerrar_teensy, enviar_comando,
+                                 TeensyReader)
+
+    sim = TeensySimulator(max_hz=max_hz or max(rate_hz, FREC_MAX_HZ),
+                          dropout=dropout, garbage=garbage, seed=1).start()
+    try:
+        ser = conectar_teensy(port=sim.port)
+        configurar_teensy(ser, 2, "E")
+        configurar_salida(ser, "B")
+        if rate_hz <= FREC_MAX_HZ:
+            configurar_frecuencia(ser, rate_hz)
+        else:
+            # Por encima del límite del firmware solo lo acepta el simulador
+            enviar_comando(ser, f"R{rate_hz}")
+        reader = TeensyReader(ser, binary=True).start()
+        recibidas = 0
+        t_ini = time.perf_counter()
+        while time.perf_counter() - t_ini < seconds:
+            recibidas += len(reader.ring.wait_take(timeout=0.1))
+        dt = time.perf_counter() - t_ini
+        reader.stop()
+        cerrar_teensy()
+        print(f"[Bench] {rate_hz} Hz pedidos: {recibidas / dt:,.0f} muestras/s recibidas "
+              f"(dropout={dropout}, basura={garbage})")
+        print(f"        simulador: {sim.stats()}")
+        print(f"        lector:    {reader.stats()}")
+    finally:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    benchmark_acquisition(rate_hz=10, seconds=2.0)
+    benchmark_acquisition(rate_hz=1000, seconds=3.0)
+    benchmark_acquisition(rate_hz=20000, seconds=3.0, dropout=0.01, garbage=0.01)
@@ -1,3 +1,5 @@
+#include <ADC.h>   // Biblioteca ADC de Teensyduino (conversiones por interrupción)
+
 // ------------------- CONFIGURACIÓN -------------------
 struct Resorte {
   float L0;          // Longitud efectiva inicial (m)
@@ -6,27 +8,95 @@ struct Resorte {
 
 // Datos de los resortes: {L0, K}
 Resorte resortes[3] = {
-  {0.045, 428.3},  // Resorte 1 
-  {0.046, 595.6},  // Resorte 2 
-  {0.04, 12146.8}   // Resorte 3 
+  {0.045, 428.3},  // Resorte 1
+  {0.046, 595.6},  // Resorte 2
+  {0.04, 12146.8}   // Resorte 3
 };
 
 
+// ------------------- PROTOCOLO -------------------
+// Modo ASCII ('A'): una línea "angulo,fuerza" por muestra (depuración).
+// Modo binario ('B'): tramas de 22 bytes (little-endian):
+//   0xA5 0x5A | tipo u8 | largo u8 | secuencia u16 | t_us u32 | adc u16
+//   | angulo f32 | fuerza f32 | CRC-16/CCITT u16 (sobre tipo..fuerza)
+// Confirmación de comando (tipo 0x02, 13 bytes):
+//   0xA5 0x5A | tipo u8 | largo u8 | id u16 | estado u8 | valor i32 | CRC u16
+// Modo crudo ('C'): tramas de 14 bytes solo con la lectura promediada del
+// ADC en 1/16 de cuenta; ángulo y fuerza los calcula el host (Calibracion.py):
+//   0xA5 0x5A | tipo u8 | largo u8 | secuencia u16 | t_us u32 | adc_x16 u16 | CRC u16
+const uint8_t SYNC0 = 0xA5;
+const uint8_t SYNC1 = 0x5A;
+const uint8_t TIPO_DATOS = 0x01;
+const uint8_t LARGO_DATOS = 16;
+const uint8_t TIPO_ACK = 0x02;
+const uint8_t LARGO_ACK = 7;
+const uint8_t TIPO_CRUDO = 0x03;
+const uint8_t LARGO_CRUDO = 8;
+
+const int32_t VERSION_PROTOCOLO = 2;
+
+// Estados de confirmación
+const uint8_t ACK_OK = 0;
+const uint8_t ACK_DESCONOCIDO = 1;
+const uint8_t ACK_INVALIDO = 2;
+const uint8_t ACK_AJUSTADO = 3;
+
+// ------------------- MUESTREO -------------------
+// Un IntervalTimer arranca una conversión del ADC a frec_hz * decimacion y
+// adcISR() recoge el resultado al terminar (ninguna interrupción espera al
+// ADC); cada 'decimacion' lecturas se promedian en una muestra que loop()
+// calcula y envía.
+const int PIN_POT = A10;
+const uint32_t FREC_MAX_HZ = 5000;      // Muestras enviadas por segundo
+const uint32_t FREC_ADC_MAX_HZ = 50000; // Lecturas del ADC por segundo (frec * decimación)
+const uint16_t DECIMACION_MAX = 64;
+const uint8_t PROMEDIO_HW = 4;          // Promedio por hardware de cada conversión
+
+// Tabla ángulo → fuerza (una por resorte), indexada por |ángulo|:
+// la longitud del resorte es par en el ángulo (depende de cos θ)
+const float LUT_PASO = 0.5;             // grados
+const int LUT_N = 361;                  // 0° .. 180°
+
+
 // ------------------- VARIABLES -------------------
 int resorte_sel = 0;   // 0 = sin resorte
 char modo_sel = 'E';   // 'E' = Extensión, 'F' = Flexión
+char salida_sel = 'A'; // 'A' = ASCII, 'B' = binario, 'C' = crudo
 
 float angulo = 0.0;
 float fuerza = 0.0;
+float lectura_adc = 0;
+
+uint32_t frec_hz = 10;        // 10 Hz por defecto
+uint16_t decimacion = 1;
+uint16_t secuencia = 0;      // Continua al cambiar de salida: el host cuenta los saltos
+
+IntervalTimer timerMuestreo;
+ADC *adc = new ADC();
+ADC_Module *adc_pot = nullptr;  // Módulo del ADC que atiende PIN_POT
+float tablaFuerza[3][LUT_N];
+
+// Cola ISR → loop() de muestras ya promediadas
+const uint8_t COLA_N = 64;
+volatile uint32_t cola_t[COLA_N];
+volatile float cola_adc[COLA_N];
+volatile uint8_t cola_ini = 0;
+volatile uint8_t cola_fin = 0;
+volatile uint32_t acum_adc = 0;
+volatile uint16_t n_acum = 0;
+volatile uint32_t desbordes_cola = 0;
+volatile uint32_t conversiones_perdidas = 0;  // Ticks con el ADC aún ocupado
+
+char linea[32];
+uint8_t largo_linea = 0;
 
 
 // ============================================================
 //                  FUNCIONES AUXILIARES
 // ============================================================
 
-// Leer potenciómetro y convertirlo a ángulo (°)
-float leerPotenciometro(char modo) {
-  int lectura = analogRead(A10); // Potenciómetro
+// Convertir lectura del potenciómetro a ángulo (°); acepta lecturas promediadas
+float convertirAngulo(float lectura, char modo) {
   float pot_val = (lectura / 1023.0) * 10000.0;  // Escalado a rango
   float ang_calc = 0;
 
@@ -76,49 +146,307 @@ float calcularFuerza(float angulo, int sel, char modo) {
 }
 
 
+// Precalcular calcularFuerza() para cada resorte (se llama una vez en setup)
+void construirTablas() {
+  for (int s = 0; s < 3; s++)
+    for (int i = 0; i < LUT_N; i++)
+      tablaFuerza[s][i] = calcularFuerza(i * LUT_PASO, s + 1, 'E');
+}
+
+// Fuerza por tabla con interpolación lineal (sin trigonometría por muestra)
+float fuerzaTabla(float angulo, int sel) {
+  if (sel == 0)
+    return 0;
+  const float *t = tablaFuerza[sel - 1];
+  float x = fabs(angulo) / LUT_PASO;
+  if (x >= LUT_N - 1)
+    return t[LUT_N - 1];
+  int i = (int)x;
+  return t[i] + (x - i) * (t[i + 1] - t[i]);
+}
+
+
 
 // ============================================================
-//                     SETUP Y LOOP
+//                  MUESTREO POR TEMPORIZADOR
 // ============================================================
 
-void setup() {
-  Serial.begin(115200);
-  delay(500);
-  Serial.println("Teensy listo. Esperando comandos...");
+// Temporizador: solo arranca la conversión
+void muestrearISR() {
+  if (adc_pot->isConverting()) {
+    conversiones_perdidas++;
+    return;
+  }
+  adc_pot->startSingleRead(PIN_POT);
+}
+
+// Fin de conversión: acumula y encola la muestra promediada
+void adcISR() {
+  acum_adc += adc_pot->readSingle();
+  if (++n_acum < decimacion)
+    return;
+  uint8_t sig = (cola_fin + 1) % COLA_N;
+  if (sig != cola_ini) {
+    cola_t[cola_fin] = micros();
+    cola_adc[cola_fin] = (float)acum_adc / n_acum;
+    cola_fin = sig;
+  } else {
+    desbordes_cola++;
+  }
+  acum_adc = 0;
+  n_acum = 0;
 }
 
+void aplicarMuestreo() {
+  noInterrupts();
+  acum_adc = 0;
+  n_acum = 0;
+  interrupts();
+  timerMuestreo.begin(muestrearISR, 1000000.0f / (frec_hz * decimacion));
+}
 
 
-void loop() {
-  // ---------- LECTURA DE COMANDOS DESDE PC ----------
-  if (Serial.available()) {
-    char c = Serial.read();
 
-    // Seleccionar resorte (0–3)
-    if (c >= '0' && c <= '3') {
-      resorte_sel = c - '0';
+// ============================================================
+//                  PROTOCOLO BINARIO
+// ============================================================
+
+// CRC-16/CCITT-FALSE (polinomio 0x1021, valor inicial 0xFFFF)
+uint16_t crc16(const uint8_t *datos, size_t n) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < n; i++) {
+    crc ^= (uint16_t)datos[i] << 8;
+    for (uint8_t b = 0; b < 8; b++)
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+  }
+  return crc;
+}
+
+void enviarTrama(uint8_t tipo, const uint8_t *payload, uint8_t largo) {
+  uint8_t trama[6 + 64];
+  trama[0] = SYNC0;
+  trama[1] = SYNC1;
+  trama[2] = tipo;
+  trama[3] = largo;
+  memcpy(&trama[4], payload, largo);
+  uint16_t crc = crc16(&trama[2], 2 + largo);
+  memcpy(&trama[4 + largo], &crc, 2);
+  Serial.write(trama, 6 + largo);
+}
+
+void enviarTramaDatos(uint32_t t_us, uint16_t adc, float ang, float F) {
+  uint8_t p[LARGO_DATOS];
+  memcpy(&p[0], &secuencia, 2);
+  memcpy(&p[2], &t_us, 4);
+  memcpy(&p[6], &adc, 2);
+  memcpy(&p[8], &ang, 4);
+  memcpy(&p[12], &F, 4);
+  enviarTrama(TIPO_DATOS, p, LARGO_DATOS);
+  secuencia++;
+}
+
+void enviarTramaCruda(uint32_t t_us, float adc) {
+  uint8_t p[LARGO_CRUDO];
+  uint16_t adc_x16 = (uint16_t)(adc * 16.0f + 0.5f);
+  memcpy(&p[0], &secuencia, 2);
+  memcpy(&p[2], &t_us, 4);
+  memcpy(&p[6], &adc_x16, 2);
+  enviarTrama(TIPO_CRUDO, p, LARGO_CRUDO);
+  secuencia++;
+}
+
+// Confirmación: trama en salida binaria o cruda, línea "#ACK,id,estado,valor" en ASCII
+void enviarAck(uint16_t id, uint8_t estado, int32_t valor) {
+  if (salida_sel != 'A') {
+    uint8_t p[LARGO_ACK];
+    memcpy(&p[0], &id, 2);
+    p[2] = estado;
+    memcpy(&p[3], &valor, 4);
+    enviarTrama(TIPO_ACK, p, LARGO_ACK);
+  } else {
+    Serial.print("#ACK,");
+    Serial.print(id);
+    Serial.print(",");
+    Serial.print(estado);
+    Serial.print(",");
+    Serial.println(valor);
+  }
+}
+
+
+
+// ============================================================
+//                  COMANDOS DESDE PC
+// ============================================================
+// Un comando por línea:
+//   "0".."3"  resorte        "E" / "F"  modo
+//   "A" / "B" / "C" salida ASCII / binaria / cruda (solo ADC)
+//   "R<hz>"   frecuencia de envío (1–5000 Hz), p. ej. "R500"; "R?" consulta
+//   "D<n>"    decimación: lecturas del ADC promediadas por muestra (1–64); "D?" consulta
+//   "?"       ping (responde la versión de protocolo)
+// Con prefijo "#<id> " (p. ej. "#7 R500") el comando se confirma con
+// enviarAck() en lugar del eco de texto.
+
+uint8_t procesarComando(const char *cmd, bool eco, int32_t &valor) {
+  valor = 0;
+
+  // Seleccionar resorte (0–3)
+  if (cmd[0] >= '0' && cmd[0] <= '9' && cmd[1] == '\0') {
+    if (cmd[0] > '3')
+      return ACK_INVALIDO;
+    resorte_sel = cmd[0] - '0';
+    valor = resorte_sel;
+    if (eco && salida_sel == 'A') {
       Serial.print("Resorte seleccionado: ");
       Serial.println(resorte_sel);
     }
+    return ACK_OK;
+  }
 
-    // Seleccionar modo ('E' o 'F')
-    else if (c == 'E' || c == 'F') {
-      modo_sel = c;
+  // Seleccionar modo ('E' o 'F')
+  if ((cmd[0] == 'E' || cmd[0] == 'F') && cmd[1] == '\0') {
+    modo_sel = cmd[0];
+    valor = modo_sel;
+    if (eco && salida_sel == 'A') {
       Serial.print("Modo: ");
       Serial.println(modo_sel == 'E' ? "Extensión" : "Flexión");
     }
+    return ACK_OK;
+  }
+
+  // Seleccionar salida ('A' = ASCII, 'B' = binaria, 'C' = cruda)
+  if ((cmd[0] == 'A' || cmd[0] == 'B' || cmd[0] == 'C') && cmd[1] == '\0') {
+    salida_sel = cmd[0];
+    valor = salida_sel;
+    return ACK_OK;
+  }
+
+  // Frecuencia de envío ("R?" consulta)
+  if (cmd[0] == 'R') {
+    if (cmd[1] == '?' && cmd[2] == '\0') {
+      valor = frec_hz;
+      return ACK_OK;
+    }
+    long hz = atol(cmd + 1);
+    if (hz <= 0)
+      return ACK_INVALIDO;
+    uint8_t estado = ACK_OK;
+    long hz_max = min((long)FREC_MAX_HZ, (long)(FREC_ADC_MAX_HZ / decimacion));
+    if (hz > hz_max) { hz = hz_max; estado = ACK_AJUSTADO; }
+    frec_hz = hz;
+    aplicarMuestreo();
+    valor = hz;
+    return estado;
+  }
+
+  // Decimación: lecturas del ADC promediadas por muestra ("D?" consulta)
+  if (cmd[0] == 'D') {
+    if (cmd[1] == '?' && cmd[2] == '\0') {
+      valor = decimacion;
+      return ACK_OK;
+    }
+    long d = atol(cmd + 1);
+    if (d <= 0)
+      return ACK_INVALIDO;
+    uint8_t estado = ACK_OK;
+    long d_max = min((long)DECIMACION_MAX, (long)(FREC_ADC_MAX_HZ / frec_hz));
+    if (d > d_max) { d = d_max; estado = ACK_AJUSTADO; }
+    decimacion = d;
+    aplicarMuestreo();
+    valor = d;
+    return estado;
+  }
+
+  // Ping
+  if (cmd[0] == '?' && cmd[1] == '\0') {
+    valor = VERSION_PROTOCOLO;
+    return ACK_OK;
   }
 
-  // ---------- LECTURA DE ÁNGULO ----------
-  angulo = leerPotenciometro(modo_sel);
+  return ACK_DESCONOCIDO;
+}
 
-  // ---------- CÁLCULO DE FUERZA ----------
-  fuerza = calcularFuerza(angulo, resorte_sel, modo_sel);
+void ejecutarLinea(const char *linea) {
+  int32_t valor;
+  if (linea[0] != '#') {
+    procesarComando(linea, true, valor);  // Comando sin id: comportamiento anterior
+    return;
+  }
+  char *resto;
+  uint16_t id = (uint16_t)strtoul(linea + 1, &resto, 10);
+  while (*resto == ' ')
+    resto++;
+  uint8_t estado = procesarComando(resto, false, valor);
+  enviarAck(id, estado, valor);
+}
+
+void leerComandos() {
+  while (Serial.available()) {
+    char c = Serial.read();
+    if (c == '\n' || c == '\r') {
+      if (largo_linea > 0) {
+        linea[largo_linea] = '\0';
+        ejecutarLinea(linea);
+        largo_linea = 0;
+      }
+    } else if (largo_linea < sizeof(linea) - 1) {
+      linea[largo_linea++] = c;
+    }
+  }
+}
 
-  // ---------- ENVÍO DE DATOS ----------
-  Serial.print(angulo, 2);
-  Serial.print(",");
-  Serial.println(fuerza, 3);
 
-  delay(100);  // Frecuencia ~10 Hz
+
+// ============================================================
+//                     SETUP Y LOOP
+// ============================================================
+
+void setup() {
+  Serial.begin(115200);
+  adc_pot = adc->adc0;
+#if ADC_NUM_ADCS > 1
+  if (!adc->adc0->checkPin(PIN_POT))
+    adc_pot = adc->adc1;
+#endif
+  adc_pot->setResolution(10);
+  adc_pot->setAveraging(PROMEDIO_HW);
+  adc_pot->setConversionSpeed(ADC_CONVERSION_SPEED::HIGH_SPEED);
+  adc_pot->setSamplingSpeed(ADC_SAMPLING_SPEED::HIGH_SPEED);
+  adc_pot->enableInterrupts(adcISR);
+  construirTablas();
+  delay(500);
+  Serial.println("Teensy listo. Esperando comandos...");
+  aplicarMuestreo();
+}
+
+
+
+void loop() {
+  // ---------- LECTURA DE COMANDOS DESDE PC ----------
+  leerComandos();
+
+  // ---------- MUESTRAS DEL TEMPORIZADOR ----------
+  while (cola_ini != cola_fin) {
+    uint32_t t_us = cola_t[cola_ini];
+    lectura_adc = cola_adc[cola_ini];
+    cola_ini = (cola_ini + 1) % COLA_N;
+
+    if (salida_sel == 'C') {
+      enviarTramaCruda(t_us, lectura_adc);
+      continue;
+    }
+
+    // ---------- ÁNGULO Y FUERZA ----------
+    angulo = convertirAngulo(lectura_adc, modo_sel);
+    fuerza = fuerzaTabla(angulo, resorte_sel);
+
+    // ---------- ENVÍO DE DATOS ----------
+    if (salida_sel == 'B') {
+      enviarTramaDatos(t_us, (uint16_t)(lectura_adc + 0.5f), angulo, fuerza);
+    } else {
+      Serial.print(angulo, 2);
+      Serial.print(",");
+      Serial.println(fuerza, 3);
+    }
+  }
 }
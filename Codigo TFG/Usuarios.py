@@ -1,32 +1,624 @@
 import os
 import json
 import glob
+import copy
+import hashlib
+import time
+import sqlite3
+import tempfile
+import threading
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from Encriptacion import ensure_dirs, write_encrypted, read_encrypted
+from Encriptacion import (ensure_dirs, write_encrypted, read_encrypted,
+                          encrypt_bytes, decrypt_bytes, decompress_payload,
+                          rotate_key, reencrypt_pending, reencrypt_local_data)
+from Sesiones import (is_session_file, read_session_summary, is_binary_session,
+                      load_session, encode_session, iter_mediciones)
 
 
 # ======================= Constantes =======================
 
 USERS_FILE = os.path.join(ensure_dirs(), "usuarios.json")
+USERS_DB_FILE = os.path.join(ensure_dirs(), "usuarios.db")
+USERS_JOURNAL_FILE = os.path.join(ensure_dirs(), "usuarios.journal")
+
+# Backend de almacenamiento de usuarios: "json" (archivo cifrado único),
+# "journal" (snapshot + bitácora de cambios) o "sqlite". SQLite reemplaza a
+# la caché en memoria de _UsersCache, que solo usan "json" y "journal".
+USERS_BACKEND = "sqlite"
+
+# Umbrales de compactación de la bitácora
+JOURNAL_MAX_RECORDS = 200
+JOURNAL_MAX_BYTES = 256 * 1024
+
+
+# ======================= Caché de usuarios =======================
+
+class _UsersCache:
+    """
+    Copia en memoria de la base de usuarios ya descifrada (backends "json"
+    y "journal"; con "sqlite" cada consulta va a la base).
+    Se valida contra (mtime, tamaño, hash SHA-256) del archivo cifrado:
+    si mtime y tamaño no cambian no se lee el disco; si cambian, se compara
+    el hash del contenido antes de volver a descifrar.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.db = None
+        self.stat = None      # (mtime_ns, size)
+        self.digest = None    # sha256 del contenido cifrado
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        with self.lock:
+            self.db = None
+            self.stat = None
+            self.digest = None
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+# ======================= Backend JSON cifrado =======================
+
+class JsonUserStore:
+    """
+    Formato original: toda la base en un único usuarios.json cifrado.
+    Cada escritura reescribe el archivo completo.
+    """
+
+    def __init__(self, path=USERS_FILE):
+        self.path = path
+        self.cache = _UsersCache()
+
+    def _shared(self):
+        """Base compartida (solo lectura) desde la caché."""
+        cache = self.cache
+        with cache.lock:
+            if not os.path.exists(self.path):
+                cache.db, cache.stat, cache.digest = {}, None, None
+                cache.misses += 1
+                return cache.db
+
+            stat = _file_stat(self.path)
+            if cache.db is not None and stat == cache.stat:
+                cache.hits += 1
+                return cache.db
+
+            with open(self.path, "rb") as f:
+                token = f.read()
+            digest = hashlib.sha256(token).digest()
+            if cache.db is not None and digest == cache.digest:
+                cache.stat = stat
+                cache.hits += 1
+                return cache.db
+
+            cache.misses += 1
+            try:
+                db = json.loads(decompress_payload(decrypt_bytes(token)).decode("utf-8"))
+            except Exception as e:
+                # No se cachea ni se toma como base vacía: un save_all o una
+                # compactación posterior borraría a todos los usuarios
+                raise ValueError(f"No se pudo leer {os.path.basename(self.path)}: "
+                                 f"{str(e) or type(e).__name__}") from e
+            cache.db, cache.stat, cache.digest = db, stat, digest
+            return db
+
+    def load_all(self):
+        return copy.deepcopy(self._shared())
+
+    def save_all(self, db: dict):
+        data = json.dumps(db, indent=2, ensure_ascii=False).encode("utf-8")
+        with self.cache.lock:
+            token = write_encrypted(self.path, data)
+            self.cache.db = copy.deepcopy(db)
+            self.cache.stat = _file_stat(self.path)
+            self.cache.digest = hashlib.sha256(token).digest()
+
+    def get(self, id_app):
+        u = self._shared().get(id_app)
+        return copy.deepcopy(u) if u is not None else None
+
+    def ids_by_tipo(self, tipo, terapeuta=None):
+        return [uid for uid, u in self._shared().items()
+                if isinstance(u, dict) and u.get("tipo") == tipo
+                and (terapeuta is None or u.get("terapeuta") == terapeuta)]
+
+    def insert(self, id_app, user: dict):
+        with self.cache.lock:
+            db = self.load_all()
+            db[id_app] = user
+            self.save_all(db)
+
+    def set_planes(self, id_app, planes: list):
+        with self.cache.lock:
+            db = self.load_all()
+            if id_app not in db:
+                return False
+            db[id_app]["planes"] = planes[:]
+            self.save_all(db)
+            return True
+
+    def stats(self):
+        with self.cache.lock:
+            total = self.cache.hits + self.cache.misses
+            return {
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+                "hit_rate": (self.cache.hits / total) if total else 0.0,
+            }
+
+    def invalidate(self):
+        self.cache.clear()
+
+
+# ======================= Backend SQLite =======================
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usuarios (
+    id_app          TEXT PRIMARY KEY,
+    tipo            TEXT NOT NULL,
+    terapeuta       TEXT NOT NULL DEFAULT '',
+    fecha_registro  TEXT NOT NULL DEFAULT '',
+    password        BLOB,
+    nombre          BLOB,
+    cedula          BLOB,
+    extra           BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_usuarios_tipo ON usuarios(tipo);
+CREATE INDEX IF NOT EXISTS idx_usuarios_terapeuta ON usuarios(terapeuta);
+
+CREATE TABLE IF NOT EXISTS planes (
+    id_app  TEXT NOT NULL,
+    orden   INTEGER NOT NULL,
+    datos   BLOB NOT NULL,
+    PRIMARY KEY (id_app, orden)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    clave   TEXT PRIMARY KEY,
+    valor   TEXT
+);
+"""
+
+# Campos en claro (indexados) y campos sensibles cifrados por separado
+_PLAIN_FIELDS = ("tipo", "terapeuta", "fecha_registro")
+_SECRET_FIELDS = {"password": "password", "nombre": "nombre", "id": "cedula"}
+
+
+def _enc(value):
+    return encrypt_bytes(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+def _dec(token):
+    if token is None:
+        return None
+    return json.loads(decrypt_bytes(token).decode("utf-8"))
+
+
+class SqliteUserStore:
+    """
+    Usuarios y planes como filas de una base SQLite embebida.
+    - Búsqueda por id_app mediante la clave primaria.
+    - 'tipo' y 'terapeuta' indexados para listar pacientes/terapeutas.
+    - Contraseña, nombre, cédula y cada plan se cifran por campo con la clave Fernet.
+    """
+
+    def __init__(self, path=USERS_DB_FILE, legacy_json=USERS_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self.migrate_from_json(legacy_json)
+
+    # ---------- Conversión fila <-> dict ----------
+
+    def _row_to_user(self, row, planes):
+        id_app, tipo, terapeuta, fecha, password, nombre, cedula, extra = row
+        u = dict(_dec(extra) or {})
+        u.update({
+            "password": _dec(password),
+            "tipo": tipo,
+            "nombre": _dec(nombre),
+            "id": _dec(cedula),
+            "fecha_registro": fecha,
+            "terapeuta": terapeuta,
+            "planes": planes,
+        })
+        return u
+
+    def _user_params(self, id_app, user: dict):
+        extra = {k: v for k, v in user.items()
+                 if k not in _PLAIN_FIELDS and k not in _SECRET_FIELDS and k != "planes"}
+        return (
+            id_app,
+            user.get("tipo", ""),
+            user.get("terapeuta", "") or "",
+            user.get("fecha_registro", "") or "",
+            _enc(user.get("password")),
+            _enc(user.get("nombre")),
+            _enc(user.get("id")),
+            _enc(extra) if extra else None,
+        )
+
+    def _planes_of(self, id_app):
+        rows = self.conn.execute(
+            "SELECT datos FROM planes WHERE id_app = ? ORDER BY orden", (id_app,)
+        ).fetchall()
+        return [_dec(r[0]) for r in rows]
+
+    def _write_planes(self, id_app, planes):
+        self.conn.execute("DELETE FROM planes WHERE id_app = ?", (id_app,))
+        self.conn.executemany(
+            "INSERT INTO planes (id_app, orden, datos) VALUES (?, ?, ?)",
+            [(id_app, i, _enc(p)) for i, p in enumerate(planes)]
+        )
+
+    # ---------- API del backend ----------
+
+    def load_all(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM usuarios").fetchall()
+            planes = {}
+            for id_app, _, datos in self.conn.execute(
+                    "SELECT id_app, orden, datos FROM planes ORDER BY id_app, orden"):
+                planes.setdefault(id_app, []).append(_dec(datos))
+        return {r[0]: self._row_to_user(r, planes.get(r[0], [])) for r in rows}
+
+    def save_all(self, db: dict):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM planes")
+            self.conn.execute("DELETE FROM usuarios")
+            for id_app, u in db.items():
+                if not isinstance(u, dict):
+                    continue
+                self.conn.execute("INSERT INTO usuarios VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                  self._user_params(id_app, u))
+                self._write_planes(id_app, u.get("planes", []))
+
+    def get(self, id_app):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM usuarios WHERE id_app = ?", (id_app,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_user(row, self._planes_of(id_app))
+
+    def ids_by_tipo(self, tipo, terapeuta=None):
+        with self.lock:
+            if terapeuta is None:
+                rows = self.conn.execute(
+                    "SELECT id_app FROM usuarios WHERE tipo = ?", (tipo,))
+            else:
+                rows = self.conn.execute(
+                    "SELECT id_app FROM usuarios WHERE tipo = ? AND terapeuta = ?",
+                    (tipo, terapeuta))
+            return [r[0] for r in rows]
+
+    def insert(self, id_app, user: dict):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO usuarios VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              self._user_params(id_app, user))
+            self._write_planes(id_app, user.get("planes", []))
+
+    def set_planes(self, id_app, planes: list):
+        with self.lock, self.conn:
+            exists = self.conn.execute(
+                "SELECT 1 FROM usuarios WHERE id_app = ?", (id_app,)
+            ).fetchone()
+            if not exists:
+                return False
+            self._write_planes(id_app, planes)
+            return True
+
+    def stats(self):
+        with self.lock:
+            n = self.conn.execute("SELECT COUNT(*) FROM usuarios").fetchone()[0]
+        return {"backend": "sqlite", "usuarios": n}
+
+    def invalidate(self):
+        pass
+
+    # ---------- Migración ----------
+
+    def migrate_from_json(self, json_path):
+        """
+        Migración única desde el usuarios.json cifrado.
+        Solo se ejecuta si la base SQLite aún no registró la migración; si
+        en la primera apertura no hay JSON se marca igual como hecha, para
+        que un usuarios.json copiado después no pise la base.
+        El archivo JSON original se conserva como respaldo.
+        """
+        with self.lock:
+            done = self.conn.execute(
+                "SELECT valor FROM meta WHERE clave = 'migrado_json'"
+            ).fetchone()
+            if done:
+                return 0
+            if not json_path or not os.path.exists(json_path):
+                with self.conn:
+                    self._marcar_migrado()
+                return 0
+            try:
+                db = JsonUserStore(json_path).load_all()
+            except ValueError as e:
+                # Sin marcar la migración: se reintenta en el próximo inicio
+                print(f"[USUARIOS] ⚠️ Migración pospuesta: {e}")
+                return 0
+            if not isinstance(db, dict):
+                db = {}
+            with self.conn:
+                for id_app, u in db.items():
+                    if not isinstance(u, dict):
+                        print(f"[USUARIOS] ⚠️ Entrada inválida ignorada en migración: {id_app}")
+                        continue
+                    self.conn.execute("INSERT OR REPLACE INTO usuarios VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                      self._user_params(id_app, u))
+                    self._write_planes(id_app, u.get("planes", []))
+                self._marcar_migrado()
+            print(f"[USUARIOS] Migrados {len(db)} usuarios de {os.path.basename(json_path)} a SQLite.")
+            return len(db)
+
+    def _marcar_migrado(self):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (clave, valor) VALUES ('migrado_json', ?)",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"),))
+
+    def close(self):
+        """Cierra la conexión a la base (p. ej. al cambiar de backend)."""
+        with self.lock:
+            self.conn.close()
+
+
+# ======================= Backend snapshot + bitácora =======================
+
+class JournalUserStore:
+    """
+    Snapshot cifrado (usuarios.json) más una bitácora de solo-anexado.
+    - Cada add_user / upsert_planes añade un registro cifrado de una línea.
+    - Las lecturas aplican la bitácora sobre el último snapshot.
+    - Al superar JOURNAL_MAX_RECORDS o JOURNAL_MAX_BYTES se compacta:
+      se escribe un snapshot nuevo y se vacía la bitácora.
+    Los registros son idempotentes (asignaciones), así que repetir la bitácora
+    sobre un snapshot que ya los contiene no cambia el resultado. Un registro
+    truncado por un corte de luz se descarta sin afectar a los anteriores.
+    """
+
+    def __init__(self, path=USERS_FILE, journal_path=USERS_JOURNAL_FILE):
+        self.snapshot = JsonUserStore(path)
+        self.journal_path = journal_path
+        self.lock = threading.RLock()
+        self.db = None
+        self._base = None       # objeto snapshot sobre el que se construyó self.db
+        self.offset = 0         # bytes válidos ya aplicados de la bitácora
+        self.records = 0
+        self.compactions = 0
+        self.discarded = 0
+
+    # ---------- Bitácora ----------
+
+    @staticmethod
+    def _apply(db, rec):
+        op = rec.get("op")
+        if op == "user":
+            db[rec["id_app"]] = rec["user"]
+        elif op == "planes":
+            if isinstance(db.get(rec["id_app"]), dict):
+                db[rec["id_app"]]["planes"] = rec["planes"]
+
+    def _refresh(self):
+        """Sincroniza self.db con el snapshot y los registros nuevos de la bitácora."""
+        base = self.snapshot._shared()
+        size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if self.db is None or base is not self._base or size < self.offset:
+            self.db = copy.deepcopy(base)
+            self._base = base
+            self.offset = 0
+            self.records = 0
+        if size == self.offset:
+            return
+
+        with open(self.journal_path, "rb") as f:
+            f.seek(self.offset)
+            tail = f.read()
+        pos = 0
+        while True:
+            end = tail.find(b"\n", pos)
+            if end < 0:
+                break  # registro incompleto al final: se ignora
+            try:
+                rec = json.loads(decrypt_bytes(tail[pos:end]).decode("utf-8"))
+            except Exception:
+                self.discarded += 1
+                print(f"[USUARIOS] ⚠️ Registro dañado en bitácora (byte {self.offset + pos}), se descarta el resto.")
+                break
+            self._apply(self.db, rec)
+            self.records += 1
+            pos = end + 1
+        self.offset += pos
+
+    def _append(self, rec: dict):
+        line = encrypt_bytes(json.dumps(rec, ensure_ascii=False).encode("utf-8")) + b"\n"
+        with open(self.journal_path, "ab") as f:
+            # Eliminar cola dañada antes de seguir anexando
+            if f.tell() > self.offset:
+                f.truncate(self.offset)
+                f.seek(self.offset)
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._apply(self.db, copy.deepcopy(rec))
+        self.offset += len(line)
+        self.records += 1
+        if self.records >= JOURNAL_MAX_RECORDS or self.offset >= JOURNAL_MAX_BYTES:
+            self.compact()
+
+    def _write_snapshot(self, db: dict):
+        """Escribe 'db' como snapshot nuevo y vacía la bitácora."""
+        self.snapshot.save_all(db)
+        with open(self.journal_path, "wb"):
+            pass
+        self.db = copy.deepcopy(db)
+        self._base = self.snapshot.cache.db
+        self.offset = 0
+        self.records = 0
+        self.compactions += 1
+
+    def compact(self):
+        """Integra la bitácora en un snapshot nuevo y la vacía."""
+        with self.lock:
+            self._refresh()
+            self._write_snapshot(self.db)
+
+    # ---------- API del backend ----------
+
+    def load_all(self):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self.db)
+
+    def save_all(self, db: dict):
+        with self.lock:
+            # Sin _refresh(): el snapshot en disco es justamente lo que se reemplaza
+            self._write_snapshot(db)
+
+    def get(self, id_app):
+        with self.lock:
+            self._refresh()
+            u = self.db.get(id_app)
+            return copy.deepcopy(u) if u is not None else None
+
+    def ids_by_tipo(self, tipo, terapeuta=None):
+        with self.lock:
+            self._refresh()
+            return [uid for uid, u in self.db.items()
+                    if isinstance(u, dict) and u.get("tipo") == tipo
+                    and (terapeuta is None or u.get("terapeuta") == terapeuta)]
+
+    def insert(self, id_app, user: dict):
+        with self.lock:
+            self._refresh()
+            self._append({"op": "user", "id_app": id_app, "user": user})
+
+    def set_planes(self, id_app, planes: list):
+        with self.lock:
+            self._refresh()
+            if id_app not in self.db:
+                return False
+            self._append({"op": "planes", "id_app": id_app, "planes": planes[:]})
+            return True
+
+    def stats(self):
+        with self.lock:
+            st = self.snapshot.stats()
+            st.update({
+                "backend": "journal",
+                "registros_bitacora": self.records,
+                "bytes_bitacora": self.offset,
+                "compactaciones": self.compactions,
+                "registros_descartados": self.discarded,
+            })
+            return st
+
+    def invalidate(self):
+        with self.lock:
+            self.snapshot.invalidate()
+            self.db = None
+
+
+# ======================= Selección de backend =======================
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _make_store(backend):
+    if backend == "json":
+        return JsonUserStore()
+    if backend == "journal":
+        return JournalUserStore()
+    if backend == "sqlite":
+        return SqliteUserStore()
+    raise ValueError(f"Backend de usuarios desconocido: {backend}")
+
+
+def get_store():
+    """Devuelve (creando si hace falta) el backend de usuarios activo."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _make_store(USERS_BACKEND)
+    return _store
+
+
+def set_backend(backend: str):
+    """Cambia el backend de usuarios ("json" | "journal" | "sqlite")."""
+    global _store, USERS_BACKEND
+    with _store_lock:
+        anterior = _store
+        _store = _make_store(backend)
+        USERS_BACKEND = backend
+    if isinstance(anterior, SqliteUserStore):
+        anterior.close()
+    return _store
+
+
+def users_cache_stats():
+    """Devuelve contadores del backend activo (aciertos/fallos de caché en JSON)."""
+    return get_store().stats()
+
+
+def invalidate_users_cache():
+    """Fuerza a releer la base de usuarios en la próxima consulta."""
+    get_store().invalidate()
+
+
+# ======================= Rotación de clave =======================
+
+def reencrypt_user_store():
+    """
+    Vuelve a cifrar la base de usuarios con la clave principal actual
+    (campos SQLite, snapshot + bitácora, o JSON según el backend).
+    """
+    store = get_store()
+    if isinstance(store, JournalUserStore):
+        store.compact()
+    else:
+        store.save_all(store.load_all())
+
+
+def rotate_encryption_key(workers: int = None):
+    """
+    Rota la clave de cifrado y recifra todos los datos locales.
+    Si un recifrado anterior quedó a medias, no rota de nuevo: lo reanuda.
+    """
+    if not reencrypt_pending():
+        rotate_key()
+    reencrypt_user_store()
+    return reencrypt_local_data(workers=workers)
 
 
 # ======================= Manejo de base de usuarios =======================
 
 def _load_users():
-    """Carga la base de datos de usuarios cifrada."""
-    if not os.path.exists(USERS_FILE):
-        return {}
-    try:
-        raw = read_encrypted(USERS_FILE)
-        return json.loads(raw.decode("utf-8"))
-    except Exception:
-        return {}
+    """
+    Carga la base de datos de usuarios completa.
+    Devuelve una copia independiente: el llamador puede modificarla.
+    """
+    return get_store().load_all()
 
 def _save_users(db: dict):
-    """Guarda la base de datos de usuarios encriptada."""
-    data = json.dumps(db, indent=2, ensure_ascii=False).encode("utf-8")
-    write_encrypted(USERS_FILE, data)
+    """Reemplaza la base de datos de usuarios completa."""
+    get_store().save_all(db)
 
 
 # ======================= Creación de usuarios =======================
@@ -43,17 +635,15 @@ def add_user(data: dict):
         "terapeuta": str        # opcional (solo paciente)
     }
     """
-    db = _load_users()
+    store = get_store()
 
-    if data["tipo"] == "administrador":
-        for u in db.values():
-            if u.get("tipo") == "administrador":
-                return False, "Ya existe un administrador. No se puede crear otro."
+    if data["tipo"] == "administrador" and store.ids_by_tipo("administrador"):
+        return False, "Ya existe un administrador. No se puede crear otro."
 
-    if data["id_app"] in db:
+    if store.get(data["id_app"]) is not None:
         return False, "El ID de aplicación ya existe."
 
-    db[data["id_app"]] = {
+    store.insert(data["id_app"], {
         "password": data["password"],
         "tipo": data["tipo"],
         "nombre": data["nombre"],
@@ -61,15 +651,13 @@ def add_user(data: dict):
         "fecha_registro": datetime.now().strftime("%Y-%m-%d"),
         "terapeuta": data.get("terapeuta", ""),
         "planes": []
-    }
-    _save_users(db)
+    })
     return True, "Usuario creado correctamente."
 
 
 def verify_login(id_app: str, password: str):
     """Verifica credenciales. Devuelve (bool, datos|mensaje)."""
-    db = _load_users()
-    u = db.get(id_app)
+    u = get_store().get(id_app)
     if not u:
         return False, "Usuario no encontrado."
     if u.get("password") != password:
@@ -79,7 +667,7 @@ def verify_login(id_app: str, password: str):
 
 def get_user(id_app: str):
     """Obtiene los datos de un usuario específico."""
-    return _load_users().get(id_app)
+    return get_store().get(id_app)
 
 
 def list_users():
@@ -106,66 +694,268 @@ def list_users():
 
 def upsert_planes(id_app: str, planes_list: list):
     """Actualiza o reemplaza los planes de un usuario."""
-    db = _load_users()
-    if id_app not in db:
+    if not get_store().set_planes(id_app, planes_list):
         return False, "Usuario no existe."
-    db[id_app]["planes"] = planes_list[:]
-    _save_users(db)
     return True, "Planes actualizados."
 
 
 # ======================= Historial de sesiones =======================
 
-def list_session_summaries(uid: str):
+SESSION_INDEX_NAME = "indice_sesiones.idx.enc"
+SESSION_INDEX_VERSION = 1
+
+_index_lock = threading.Lock()
+
+
+def _session_summary(data: dict, uid: str):
+    """Extrae los campos de resumen de una sesión completa."""
+    return {
+        "usuario": data.get("usuario", uid),
+        "fecha": data.get("fecha", "-"),
+        "plan_usado": data.get("plan_usado", "-"),
+        "duracion_s": data.get("duracion_s", 0),
+        "repeticiones": data.get("repeticiones", "0/0"),
+        "correctas": data.get("correctas", 0),
+        "parciales": data.get("parciales", 0),
+        "incorrectas": data.get("incorrectas", 0),
+        "estado": data.get("estado", "-"),
+        "session_id": data.get("session_id", ""),
+    }
+
+
+def _index_path(user_dir: str):
+    return os.path.join(user_dir, SESSION_INDEX_NAME)
+
+
+def _read_index(user_dir: str):
+    """Lee el índice de sesiones; devuelve {} si no existe o está dañado."""
+    path = _index_path(user_dir)
+    if not os.path.exists(path):
+        return {}
+    try:
+        data = json.loads(read_encrypted(path).decode("utf-8"))
+        if data.get("version") == SESSION_INDEX_VERSION and isinstance(data.get("sesiones"), dict):
+            return data["sesiones"]
+    except Exception as e:
+        print(f"[Historial] Índice dañado en {user_dir}, se reconstruirá: {e}")
+    return {}
+
+
+def _write_index(user_dir: str, sesiones: dict):
+    data = {"version": SESSION_INDEX_VERSION, "sesiones": sesiones}
+    write_encrypted(_index_path(user_dir), json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def record_session(uid: str, fname: str, data: dict):
+    """
+    Añade una sesión recién guardada al índice de resúmenes del usuario.
+    Se llama después de escribir el archivo de sesión.
+    """
+    user_dir = os.path.join(ensure_dirs(), uid)
+    try:
+        size = os.path.getsize(os.path.join(user_dir, fname))
+    except OSError:
+        return
+    with _index_lock:
+        sesiones = _read_index(user_dir)
+        sesiones[fname] = {"size": size, "resumen": _session_summary(data, uid)}
+        _write_index(user_dir, sesiones)
+
+
+def list_session_summaries(uid: str, workers=1):
     """
-    Lee todos los archivos de sesión cifrados (.json.enc) del usuario y devuelve
-    una lista de resúmenes simplificados para mostrar en el historial.
+    Devuelve los resúmenes de sesión del usuario para mostrar en el historial.
+    Se leen desde el índice cifrado del usuario; si el índice no coincide con
+    los archivos de sesión de la carpeta, solo se descifran las sesiones que
+    faltan y se descartan las entradas de archivos eliminados.
+    Las sesiones faltantes se descifran sin tener tomado el lock del índice y,
+    por defecto, en serie: la interfaz llama a esta función y crear un pool
+    de procesos (spawn en Windows) la bloquearía. Para indexar en lote, pasar
+    workers=None (todos los núcleos) o un número mayor que 1.
     """
     user_dir = os.path.join(ensure_dirs(), uid)
-    print(f"[DEBUG] Buscando sesiones en: {user_dir}")
-    print("Archivos encontrados:", os.listdir(user_dir) if os.path.exists(user_dir) else "No existe carpeta")
 
     if not os.path.exists(user_dir):
         return []
 
-    sesiones = []
-    for fname in os.listdir(user_dir):
-        if fname.endswith(".json.enc") and "_sesion_" in fname:
-            try:
-                raw = read_encrypted(os.path.join(user_dir, fname))
-                data = json.loads(raw.decode("utf-8"))
-
-                # Estructura del nuevo formato
-                resumen = {
-                    "usuario": data.get("usuario", uid),
-                    "fecha": data.get("fecha", "-"),
-                    "plan_usado": data.get("plan_usado", "-"),
-                    "duracion_s": data.get("duracion_s", 0),
-                    "repeticiones": data.get("repeticiones", "0/0"),
-                    "correctas": data.get("correctas", 0),
-                    "parciales": data.get("parciales", 0),
-                    "incorrectas": data.get("incorrectas", 0),
-                    "estado": data.get("estado", "-"),
-                    "session_id": data.get("session_id", ""),
-                }
-                sesiones.append(resumen)
-            except Exception as e:
-                print(f"[Historial] Error leyendo {fname}: {e}")
+    with _index_lock:
+        sesiones = _read_index(user_dir)
+        en_disco = {e.name: e.stat().st_size for e in os.scandir(user_dir)
+                    if e.is_file() and is_session_file(e.name)}
+        borrados = [f for f in sesiones if en_disco.get(f) != sesiones[f].get("size")]
+        for fname in borrados:
+            del sesiones[fname]
+
+    faltantes = [os.path.join(user_dir, f) for f in en_disco if f not in sesiones]
+    nuevos = {}
+    for path, data, error in iter_sessions_parallel(faltantes, "summary", workers=workers,
+                                                    ordered=False):
+        fname = os.path.basename(path)
+        if error:
+            print(f"[Historial] Error leyendo {fname}: {error}")
+            continue
+        nuevos[fname] = {"size": en_disco[fname], "resumen": _session_summary(data, uid)}
+
+    if borrados or nuevos:
+        with _index_lock:
+            # Releer: record_session pudo añadir sesiones mientras se descifraba
+            sesiones = _read_index(user_dir)
+            for fname in borrados:
+                sesiones.pop(fname, None)
+            sesiones.update(nuevos)
+            _write_index(user_dir, sesiones)
+
+    resumenes = [dict(s["resumen"]) for s in sesiones.values()]
 
     # Ordenar del más reciente al más antiguo
-    sesiones.sort(key=lambda x: x.get("fecha", ""), reverse=True)
-    return sesiones
+    resumenes.sort(key=lambda x: x.get("fecha", ""), reverse=True)
+    return resumenes
+
+
+
+# ======================= Carga paralela de sesiones =======================
+#
+# La interfaz no usa el pool: el historial llama a list_session_summaries con
+# workers=1. Lo usan los procesos por lotes fuera de la GUI: load_user_sessions
+# (análisis de todas las sesiones de un paciente, todos los núcleos por
+# defecto) y list_session_summaries(uid, workers=None) para reindexar.
+
+PARALLEL_WORKERS = None       # None = os.cpu_count()
+PARALLEL_MIN_FILES = 64       # por debajo de esto se procesa en serie
+PARALLEL_CHUNK = None         # archivos por tarea; None = automático
+
+
+def _summary_task(paths):
+    """Tarea de proceso: resumen de cada sesión."""
+    out = []
+    for p in paths:
+        try:
+            out.append((p, read_session_summary(p), None))
+        except Exception as e:
+            out.append((p, None, str(e)))
+    return out
+
+
+def _full_task(paths):
+    """
+    Tarea de proceso: sesión completa descifrada. Las sesiones JSON antiguas se
+    convierten al formato binario aquí, para que el proceso principal solo
+    tenga que crear vistas sobre los bytes recibidos.
+    """
+    out = []
+    for p in paths:
+        try:
+            raw = read_encrypted(p)
+            if not is_binary_session(raw):
+                header, cols = load_session(raw)
+                raw = encode_session(header, list(iter_mediciones(cols, list(cols))),
+                                     itemsize=8, fmt="binary")
+            out.append((p, raw, None))
+        except Exception as e:
+            out.append((p, None, str(e)))
+    return out
+
 
+_TASKS = {"summary": _summary_task, "full": _full_task}
+
+
+def iter_sessions_parallel(paths, mode="summary", workers=None, chunk_size=None, ordered=True):
+    """
+    Descifra y decodifica archivos de sesión repartiéndolos en un
+    ProcessPoolExecutor. Genera tuplas (ruta, datos, error):
+    - mode="summary": datos = dict de resumen
+    - mode="full":    datos = bytes en formato binario (usar Sesiones.load_session)
+    Con ordered=True se respeta el orden de 'paths'; con False se entregan
+    los resultados a medida que terminan. Con pocos archivos o un solo
+    worker se procesa en serie (crear el pool cuesta más de lo que ahorra).
+    """
+    paths = list(paths)
+    task = _TASKS[mode]
+    workers = workers or PARALLEL_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < PARALLEL_MIN_FILES:
+        yield from task(paths)
+        return
+
+    chunk = chunk_size or PARALLEL_CHUNK or max(1, len(paths) // (workers * 4))
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        if ordered:
+            for res in ex.map(task, chunks):
+                yield from res
+        else:
+            for fut in as_completed([ex.submit(task, c) for c in chunks]):
+                yield from fut.result()
+
+
+def load_user_sessions(uid: str, workers=None, ordered=True):
+    """
+    Carga todas las sesiones completas de un usuario (análisis masivo).
+    Genera (nombre_archivo, resumen, columnas). Pensada para scripts de
+    análisis fuera de la interfaz: por defecto reparte el trabajo entre
+    todos los núcleos.
+    """
+    user_dir = os.path.join(ensure_dirs(), uid)
+    if not os.path.exists(user_dir):
+        return
+    paths = sorted(os.path.join(user_dir, f) for f in os.listdir(user_dir) if is_session_file(f))
+    for path, raw, error in iter_sessions_parallel(paths, "full", workers, ordered=ordered):
+        if error:
+            print(f"[Historial] Error leyendo {os.path.basename(path)}: {error}")
+            continue
+        header, cols = load_session(raw)
+        yield os.path.basename(path), header, cols
+
+
+def benchmark_parallel_sessions(n_sessions=1000, muestras=3000, workers=(1, 2, 4, 8), fmt="json"):
+    """
+    Mide la carga de n_sessions sesiones sintéticas con distinto número de
+    workers. Los archivos se crean en un directorio temporal.
+    """
+    import random
+    import shutil
+    from Encriptacion import write_encrypted_stream
+    from Sesiones import iter_encode_session
+
+    tmp = tempfile.mkdtemp(prefix="pfg_bench_")
+    try:
+        resumen = {"usuario": "BENCH", "fecha": "2025-01-01 00:00:00", "plan_usado": 1,
+                   "duracion_s": muestras // 10, "repeticiones": "10/10", "correctas": 10,
+                   "parciales": 0, "incorrectas": 0, "estado": "Completada"}
+        mediciones = [(round(i * 0.1, 3), random.uniform(0, 90), random.uniform(0, 20))
+                      for i in range(muestras)]
+        paths = []
+        for i in range(n_sessions):
+            path = os.path.join(tmp, f"BENCH_sesion_{i:05d}.ses.enc")
+            write_encrypted_stream(path, iter_encode_session(dict(resumen, session_id=str(i)),
+                                                             mediciones, fmt=fmt))
+            paths.append(path)
+
+        print(f"[Bench] {n_sessions} sesiones x {muestras} muestras ({fmt}), CPUs: {os.cpu_count()}")
+        for mode in ("summary", "full"):
+            for w in workers:
+                t0 = time.perf_counter()
+                n = sum(1 for _ in iter_sessions_parallel(paths, mode, workers=w))
+                dt = time.perf_counter() - t0
+                print(f"[Bench] {mode:7s} workers={w}: {dt:.2f} s ({n / dt:.0f} sesiones/s)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
 
 
 # ======================= Utilidades adicionales =======================
 
 def list_therapists():
     """Devuelve lista de IDs de usuarios con tipo 'terapeuta'."""
-    db = _load_users()
-    return [uid for uid, u in db.items() if u.get("tipo") == "terapeuta"]
+    return get_store().ids_by_tipo("terapeuta")
+
+def list_patients(terapeuta: str = None):
+    """
+    Devuelve lista de IDs de usuarios con tipo 'paciente'.
+    Si se indica 'terapeuta', solo los pacientes asignados a él.
+    """
+    return get_store().ids_by_tipo("paciente", terapeuta)
+
+
+# ======================= Prueba directa =======================
 
-def list_patients():
-    """Devuelve lista de IDs de usuarios con tipo 'paciente'."""
-    db = _load_users()
-    return [uid for uid, u in db.items() if u.get("tipo") == "paciente"]
+if __name__ == "__main__":
+    benchmark_parallel_sessions()